@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib import admin
-from .models import Book
+from .models import Book, BookEnrichmentTask
+from .search import filter_books
+from utils.pagination import EstimatedCountPaginator
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -11,6 +13,7 @@ class BookAdminForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Rendered as raw-id inputs; the querysets only validate the submitted ids.
         self.fields['created_by'].queryset = User.objects.filter(is_staff=True, is_active=True)
         self.fields['last_modified_by'].queryset = User.objects.filter(is_staff=True, is_active=True)
 
@@ -18,14 +21,32 @@ class BookAdminForm(forms.ModelForm):
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     form = BookAdminForm
-    list_display = ['title', 'author', 'number_of_pages', "is_rented"]
+    list_display = ['title', 'author', 'number_of_pages', "is_rented", "is_enrichment_pending"]
     search_fields = ['title', 'author']
     list_filter = ['created_at', 'last_modified_at']
-    
+    raw_id_fields = ['created_by', 'last_modified_by']
+    ordering = ['title']  # Unique, so indexed; the rental form's autocomplete pages through it.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the full-text index instead of LIKE scans over search_fields.
+        if request.GET.get('model_name') == 'rental' and request.GET.get('field_name') == 'book':
+            # The rental form's autocomplete only offers books that can be rented.
+            queryset = queryset.filter(is_rented=False, is_active=True)
+        return filter_books(queryset, search_term), False
+
     def save_model(self, request, obj, form, change):
         if change and 'title' in form.changed_data:
-            updated_details = Book._fetch_book_details(obj.title)
-            obj.author = updated_details.author
-            obj.number_of_pages = updated_details.number_of_pages
-            obj.title = f"{obj.title} | {updated_details.title}"
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+            # Re-queue the book so the enrichment worker fetches the details for the new title.
+            obj.author = None
+            obj.number_of_pages = None
+            obj.is_enrichment_pending = False
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(BookEnrichmentTask)
+class BookEnrichmentTaskAdmin(admin.ModelAdmin):
+    list_display = ['book', 'status', 'attempts', 'next_attempt_at', 'last_error']
+    list_filter = ['status']
+    raw_id_fields = ['book']
\ No newline at end of file
@@ -0,0 +1,113 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from bookmate.load_env_vars import var_settings
+from utils.db_router import REPLICA_ALIAS
+import hashlib, time
+
+CATALOGUE_VERSION_KEY = 'books:catalogue:version'
+CATALOGUE_MODIFIED_KEY = 'books:catalogue:modified_at'
+
+
+def catalogue_state() -> tuple[int, int]:
+    """
+    Returns the catalogue version and the timestamp of its last change.
+    A fresh cache starts the counter from the clock so ETags handed out before a restart are never reused.
+    """
+    state = cache.get_many([CATALOGUE_VERSION_KEY, CATALOGUE_MODIFIED_KEY])
+    if len(state) < 2:
+        now = int(time.time())
+        cache.add(CATALOGUE_VERSION_KEY, now * 1000, timeout=None)
+        cache.add(CATALOGUE_MODIFIED_KEY, now, timeout=None)
+        state = cache.get_many([CATALOGUE_VERSION_KEY, CATALOGUE_MODIFIED_KEY])
+    return state.get(CATALOGUE_VERSION_KEY, 0), state.get(CATALOGUE_MODIFIED_KEY, 0)
+
+
+async def acatalogue_state() -> tuple[int, int]:
+    state = await cache.aget_many([CATALOGUE_VERSION_KEY, CATALOGUE_MODIFIED_KEY])
+    if len(state) < 2:
+        return await sync_to_async(catalogue_state)()
+    return state[CATALOGUE_VERSION_KEY], state[CATALOGUE_MODIFIED_KEY]
+
+
+def catalogue_etag(version, renderer_format) -> str:
+    return f'"books-{version}-{renderer_format}"'
+
+
+def catalogue_page_key(version, renderer_format, request) -> str:
+    return f"books:catalogue:{version}:{renderer_format}:{hashlib.md5(request.get_full_path().encode()).hexdigest()}"
+
+
+def may_be_stale(read_from, modified_at) -> bool:
+    """
+    Whether a page read from `read_from` may predate the last change, because the replica lags behind it.
+    """
+    return read_from == REPLICA_ALIAS and time.time() - modified_at < var_settings.DB_REPLICA_STICKINESS
+
+
+def set_catalogue_headers(response, etag, modified_at):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified_at)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+    return response
+
+
+def _bump():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, int(time.time() * 1000), timeout=None)
+    cache.set(CATALOGUE_MODIFIED_KEY, int(time.time()), timeout=None)
+
+
+def invalidate_catalogue():
+    """
+    Moves the catalogue to a new version, which drops every cached book page and ETag.
+
+    Called on Book save/delete by signal and explicitly by the bulk paths that skip signals
+    (imports, enrichment, queryset updates). The version is bumped right away and again on
+    commit, so a page rendered from pre-commit data in between is not kept either.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+class CatalogueCacheMixin:
+    """
+    Conditional GET and response caching for read-only book views.
+
+    Every response carries an ETag and Last-Modified derived from the catalogue version, and a
+    matching If-None-Match/If-Modified-Since is answered with 304 before any query runs. Rendered
+    JSON pages are stored in the Django cache under the version, so a hit costs no queries either.
+    Pages read from a replica within DB_REPLICA_STICKINESS of the last change are not stored, as
+    the replica may not have caught up with the version yet.
+    """
+
+    def get(self, request, *args, **kwargs):
+        version, modified_at = catalogue_state()
+        renderer_format = request.accepted_renderer.format
+        etag = catalogue_etag(version, renderer_format)
+
+        response = get_conditional_response(request, etag=etag, last_modified=modified_at)
+        if response is None:
+            key = catalogue_page_key(version, renderer_format, request)
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = super().get(request, *args, **kwargs)
+                # The browsable API renders the user's name, so only the JSON pages are shared.
+                if response.status_code == 200 and renderer_format == 'json' and not may_be_stale(getattr(self, 'read_from', None), modified_at):
+                    store = lambda rendered: cache.set(key, (rendered.content, rendered['Content-Type']), timeout=var_settings.CATALOGUE_CACHE_TTL)
+                    if hasattr(response, 'add_post_render_callback'):
+                        response.add_post_render_callback(store)
+                    else:
+                        # Pages from the fast serializers are rendered already.
+                        store(response)
+        return set_catalogue_headers(response, etag, modified_at)
@@ -0,0 +1,135 @@
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from changes.models import Change
+from .catalogue import invalidate_catalogue
+from .lookup_cache import isbndb_lookup_cache, normalize_title
+from .models import Book, BookEnrichmentTask, IsbndbLookup
+from .signals import book_details_updated
+from .utils import FetchBookDetailsFromIsbndb, afetch_many_book_details_from_isbndb, fetch_many_book_details_from_isbndb
+
+
+def retry_delay(attempts) -> timedelta:
+    """
+    Exponential backoff for a task that has failed `attempts` times, capped at one day.
+    """
+    return timedelta(seconds=min(var_settings.ENRICHMENT_RETRY_BACKOFF * 2 ** (attempts - 1), 24 * 60 * 60))
+
+
+def claim_due_tasks(batch_size) -> list[BookEnrichmentTask]:
+    """
+    Claims up to `batch_size` due tasks by leasing them for ENRICHMENT_LEASE_TIMEOUT seconds.
+    A worker that dies mid-batch leaves its tasks to be picked up again once the lease expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        task_ids = list(
+            BookEnrichmentTask.objects.select_for_update(skip_locked=True)
+            .filter(status=BookEnrichmentTask.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        tasks = list(BookEnrichmentTask.objects.filter(id__in=task_ids).select_related('book'))
+        lease_until = now + timedelta(seconds=var_settings.ENRICHMENT_LEASE_TIMEOUT)
+        for task in tasks:
+            task.attempts += 1
+            task.next_attempt_at = lease_until
+        BookEnrichmentTask.objects.bulk_update(tasks, ['attempts', 'next_attempt_at'])
+    return tasks
+
+
+def _update_book(book):
+    invalidate_catalogue()
+    Book.objects.filter(pk=book.pk).update(
+        author=book.author,
+        number_of_pages=book.number_of_pages,
+        title=book.title,
+        is_enrichment_pending=False,
+        last_modified_at=timezone.now(),
+    )
+    Change.record(Change.BOOK, [book.pk])
+    # The page count prices the book's open rentals (see rentals.signals).
+    book_details_updated.send(sender=Book, instance=book)
+
+
+def _save_book_details(book, book_details):
+    original_title = book.title
+    book.apply_book_details(book_details)
+    try:
+        with transaction.atomic():
+            _update_book(book)
+    except IntegrityError:
+        # Another book already carries the enriched title; keep the title that was entered.
+        book.title = original_title
+        _update_book(book)
+
+
+def _cached_lookups(tasks) -> tuple[dict, list]:
+    """
+    Returns the cached lookups of the tasks' titles, by normalized title, and the titles left to look up.
+    """
+    # Serve repeated titles from the lookup cache; only the misses go to ISBNDB, once per normalized title.
+    # Cached errors are ignored here since the task's own backoff already paces the retries.
+    titles = {normalize_title(task.book.title): task.book.title for task in tasks}
+    cached = {
+        normalize_title(title): (entry.details, None)
+        for title, entry in isbndb_lookup_cache.get_many(titles.values()).items()
+        if entry.outcome != IsbndbLookup.OUTCOME_ERROR
+    }
+    misses = [title for key, title in titles.items() if key not in cached]
+    return cached, misses
+
+
+def _store_results(tasks, cached, fetched, stats) -> dict:
+    isbndb_lookup_cache.set_many(fetched)
+    cached.update((normalize_title(title), result) for title, result in fetched.items())
+    results = [cached[normalize_title(task.book.title)] for task in tasks]
+
+    for task, (book_details, error) in zip(tasks, results):
+        if error is None:
+            # No match on ISBNDB is final: fall back to the defaults like a failed lookup always has.
+            _save_book_details(task.book, book_details or FetchBookDetailsFromIsbndb())
+            task.status = BookEnrichmentTask.STATUS_DONE
+            task.last_error = ''
+            stats['enriched'] += 1
+        elif task.attempts >= var_settings.ENRICHMENT_MAX_ATTEMPTS:
+            _save_book_details(task.book, FetchBookDetailsFromIsbndb())
+            task.status = BookEnrichmentTask.STATUS_FAILED
+            task.last_error = str(error)
+            stats['failed'] += 1
+        else:
+            task.next_attempt_at = timezone.now() + retry_delay(task.attempts)
+            task.last_error = str(error)
+            stats['retried'] += 1
+    BookEnrichmentTask.objects.bulk_update(tasks, ['status', 'next_attempt_at', 'last_error'])
+    return stats
+
+
+def run_enrichment_batch(batch_size=None) -> dict:
+    """
+    Claims one batch of due tasks, looks the titles up concurrently and stores the results.
+    Returns:
+        dict: Counts of claimed, enriched, retried and failed tasks.
+    """
+    tasks = claim_due_tasks(batch_size or var_settings.ENRICHMENT_BATCH_SIZE)
+    stats = {'claimed': len(tasks), 'enriched': 0, 'retried': 0, 'failed': 0}
+    if not tasks:
+        return stats
+    cached, misses = _cached_lookups(tasks)
+    return _store_results(tasks, cached, fetch_many_book_details_from_isbndb(misses), stats)
+
+
+async def arun_enrichment_batch(batch_size=None) -> dict:
+    """
+    run_enrichment_batch() for async callers: the database work goes through sync_to_async and
+    the ISBNDB lookups are awaited, so the event loop is never blocked.
+    """
+    tasks = await sync_to_async(claim_due_tasks)(batch_size or var_settings.ENRICHMENT_BATCH_SIZE)
+    stats = {'claimed': len(tasks), 'enriched': 0, 'retried': 0, 'failed': 0}
+    if not tasks:
+        return stats
+    cached, misses = await sync_to_async(_cached_lookups)(tasks)
+    fetched = await afetch_many_book_details_from_isbndb(misses)
+    return await sync_to_async(_store_results)(tasks, cached, fetched, stats)
@@ -0,0 +1,187 @@
+from dataclasses import dataclass, field
+from itertools import islice
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from changes.models import Change
+from .catalogue import invalidate_catalogue
+from .models import Book, BookEnrichmentTask, Counter
+import csv, json, time
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': self.errors,
+        }
+
+
+def guess_format(filename, default='csv') -> str:
+    extension = str(filename or '').rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, input_format):
+    """
+    Lazily yields (line number, row dict) from a CSV (with a header) or JSONL text stream.
+    Rows that cannot be parsed are yielded as (line number, ValueError).
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                # The reader counts a line once it has parsed it, so the rejected one is the next.
+                yield reader.line_num + 1, ValueError(f"Invalid CSV: {e}")
+                continue
+            yield reader.line_num, row
+    elif input_format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Each line must be a JSON object.")
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported format '{input_format}', expected one of {', '.join(IMPORT_FORMATS)}.")
+
+
+def clean_row(row) -> dict:
+    title = str(row.get('title') or '').strip()
+    if not title:
+        raise ValueError("Title is required.")
+    if len(title) > Book._meta.get_field('title').max_length:
+        raise ValueError("Title is longer than 255 characters.")
+    author = str(row.get('author') or '').strip() or None
+    pages = row.get('number_of_pages')
+    if pages in (None, ''):
+        pages = None
+    else:
+        try:
+            pages = int(pages)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid number_of_pages '{pages}'.")
+        if pages < 0:
+            raise ValueError("number_of_pages cannot be negative.")
+    return {'title': title, 'author': author, 'number_of_pages': pages or None}
+
+
+class BookImporter:
+    """
+    Streams books from a CSV/JSONL file into the catalogue in chunks.
+
+    Each chunk is deduplicated against the unique title with a single query, written with
+    bulk_create and the books missing details are queued for enrichment in bulk. Bad rows
+    are reported with their line number and never abort the import.
+
+    Usage:
+        report = BookImporter(chunk_size=1000, created_by=user).run(stream, 'csv')
+    """
+
+    def __init__(self, chunk_size=None, created_by=None):
+        self.chunk_size = chunk_size or var_settings.BOOK_IMPORT_CHUNK_SIZE
+        self.created_by = created_by
+
+    def run(self, stream, input_format) -> ImportReport:
+        report = ImportReport()
+        rows = iter_rows(stream, input_format)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk, report)
+        report.elapsed = time.perf_counter() - report.started_at
+        return report
+
+    def _import_chunk(self, chunk, report):
+        cleaned = {}
+        for line, row in chunk:
+            report.rows += 1
+            if isinstance(row, Exception):
+                report.add_error(line, str(row))
+                continue
+            try:
+                values = clean_row(row)
+            except ValueError as e:
+                report.add_error(line, str(e))
+                continue
+            if values['title'] in cleaned:
+                report.duplicates += 1
+                continue
+            cleaned[values['title']] = (line, values)
+
+        existing = set(Book.objects.filter(title__in=cleaned.keys()).values_list('title', flat=True))
+        report.duplicates += len(existing)
+        books = [self._build_book(values) for title, (line, values) in cleaned.items() if title not in existing]
+        if not books:
+            return
+        try:
+            with transaction.atomic():
+                self._create_books(books)
+            report.created += len(books)
+        except IntegrityError:
+            # A concurrent writer took some of the titles; fall back to row by row for this chunk.
+            lines = {title: line for title, (line, values) in cleaned.items()}
+            for book in books:
+                try:
+                    with transaction.atomic():
+                        self._create_books([book])
+                    report.created += 1
+                except IntegrityError as e:
+                    report.add_error(lines[book.title], str(e))
+
+    def _build_book(self, values) -> Book:
+        book = Book(**values, created_by=self.created_by, last_modified_by=self.created_by)
+        book.is_enrichment_pending = not book.author or not book.number_of_pages
+        return book
+
+    def _create_books(self, books):
+        for book in books:
+            book.pk = None
+        Book.objects.bulk_create(books)
+        Counter.adjust(Counter.AVAILABLE_BOOKS, sum(book.is_available for book in books))
+        Change.record(Change.BOOK, [book.pk for book in books])
+        invalidate_catalogue()
+        now = timezone.now()
+        BookEnrichmentTask.objects.bulk_create(
+            BookEnrichmentTask(book=book, next_attempt_at=now) for book in books if book.is_enrichment_pending
+        )
@@ -0,0 +1,81 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import json, threading
+
+
+class IsbndbStubServer:
+    """
+    A local stand-in for the ISBNDB `/books/{title}` endpoint, so enrichment can run offline.
+
+    Point ISBN_API_BASE_URL at `server.base_url` and the lookups are answered from `books`,
+    a dict of lowercased title -> ISBNDB book payload. Unknown titles get a 404 like ISBNDB,
+    and `fail_next` makes the next N requests answer 503 to exercise the retry path.
+
+    Usage:
+        with IsbndbStubServer({'dune': {'title': 'Dune', 'authors': ['Frank Herbert'], 'pages': 412}}) as server:
+            var_settings.ISBN_API_BASE_URL = server.base_url
+    """
+
+    def __init__(self, books=None, host='127.0.0.1', port=0):
+        self.books = {title.lower(): book for title, book in (books or {}).items()}
+        self.fail_next = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                title = unquote(path[len('/books/'):]) if path.startswith('/books/') else None
+                with stub._lock:
+                    stub.requests.append(title)
+                    failing = stub.fail_next > 0
+                    if failing:
+                        stub.fail_next -= 1
+                if failing:
+                    return self._send(503, {'errorMessage': 'Service unavailable'})
+                book = stub.books.get((title or '').lower())
+                if book is None:
+                    return self._send(404, {'errorMessage': 'Not Found'})
+                return self._send(200, {'total': 1, 'books': [book]})
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
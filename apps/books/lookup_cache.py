@@ -0,0 +1,166 @@
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from .models import IsbndbLookup
+from .utils import FetchBookDetailsFromIsbndb, request_book_details_from_isbndb
+import requests, threading
+
+
+class CachedLookupError(requests.RequestException):
+    """
+    Raised for a title whose last ISBNDB lookup failed and is still negatively cached.
+    """
+
+
+def normalize_title(title) -> str:
+    return " ".join(str(title).split()).casefold()[:512]
+
+
+@dataclass(frozen=True)
+class CachedLookup:
+    outcome: str
+    details: FetchBookDetailsFromIsbndb | None
+    expires_at: datetime
+    error: str = ''
+
+    def result(self) -> FetchBookDetailsFromIsbndb | None:
+        """
+        Replays the lookup: the details, None for "no books found", or the cached error.
+        """
+        if self.outcome == IsbndbLookup.OUTCOME_ERROR:
+            raise CachedLookupError(self.error or "ISBNDB lookup recently failed")
+        return self.details
+
+
+class IsbndbLookupCache:
+    """
+    Two-tier cache of ISBNDB lookups keyed by normalized title.
+
+    The in-process tier is an LRU of ISBN_CACHE_SIZE entries; the persistent tier is the
+    IsbndbLookup table, shared by every process. Found books live for ISBN_CACHE_TTL seconds,
+    "no books found" for ISBN_CACHE_NEGATIVE_TTL and failed lookups for ISBN_CACHE_ERROR_TTL.
+
+    `counters` tracks memory_hits, persistent_hits, negative_hits and misses.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.counters = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ttl(self, outcome) -> timedelta:
+        seconds = {
+            IsbndbLookup.OUTCOME_FOUND: var_settings.ISBN_CACHE_TTL,
+            IsbndbLookup.OUTCOME_NOT_FOUND: var_settings.ISBN_CACHE_NEGATIVE_TTL,
+            IsbndbLookup.OUTCOME_ERROR: var_settings.ISBN_CACHE_ERROR_TTL,
+        }[outcome]
+        return timedelta(seconds=seconds)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > (self.max_size or var_settings.ISBN_CACHE_SIZE):
+                self._entries.popitem(last=False)
+
+    def _count_hit(self, tier, entry):
+        self.counters[tier] += 1
+        if entry.outcome != IsbndbLookup.OUTCOME_FOUND:
+            self.counters['negative_hits'] += 1
+
+    def get_many(self, titles) -> dict[str, CachedLookup]:
+        """
+        Returns the live cached lookups for `titles`, keyed by the titles as given.
+        Titles missing from memory are fetched from the persistent tier in a single query.
+        """
+        now = timezone.now()
+        keys = {title: normalize_title(title) for title in titles}
+        found = {}
+        with self._lock:
+            for title, key in keys.items():
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    found[title] = entry
+        for entry in found.values():
+            self._count_hit('memory_hits', entry)
+
+        pending = {key for title, key in keys.items() if title not in found}
+        if pending:
+            rows = IsbndbLookup.objects.filter(normalized_title__in=pending, expires_at__gt=now)
+            stored = {}
+            for row in rows:
+                details = FetchBookDetailsFromIsbndb(**row.details) if row.outcome == IsbndbLookup.OUTCOME_FOUND else None
+                error = row.details.get('error', '') if row.outcome == IsbndbLookup.OUTCOME_ERROR and row.details else ''
+                stored[row.normalized_title] = CachedLookup(row.outcome, details, row.expires_at, error)
+                self._remember(row.normalized_title, stored[row.normalized_title])
+            for title, key in keys.items():
+                if title in found:
+                    continue
+                if key in stored:
+                    found[title] = stored[key]
+                    self._count_hit('persistent_hits', stored[key])
+                else:
+                    self.counters['misses'] += 1
+        return found
+
+    def get(self, title) -> CachedLookup | None:
+        return self.get_many([title]).get(title)
+
+    def set_many(self, results):
+        """
+        Stores lookup results given as {title: (details or None, error or None)} in both tiers.
+        """
+        now = timezone.now()
+        rows = {}
+        for title, (details, error) in results.items():
+            if error is not None:
+                outcome, payload = IsbndbLookup.OUTCOME_ERROR, {'error': str(error)}
+            elif details is None:
+                outcome, payload = IsbndbLookup.OUTCOME_NOT_FOUND, None
+            else:
+                outcome, payload = IsbndbLookup.OUTCOME_FOUND, details.model_dump()
+            key = normalize_title(title)
+            expires_at = now + self._ttl(outcome)
+            self._remember(key, CachedLookup(outcome, details if error is None else None, expires_at, str(error or '')))
+            rows[key] = IsbndbLookup(normalized_title=key, outcome=outcome, details=payload, expires_at=expires_at)
+        if rows:
+            IsbndbLookup.objects.bulk_create(
+                rows.values(),
+                update_conflicts=True,
+                unique_fields=['normalized_title'],
+                update_fields=['outcome', 'details', 'expires_at', 'last_modified_at'],
+            )
+
+    def lookup(self, title) -> FetchBookDetailsFromIsbndb | None:
+        """
+        Cached equivalent of request_book_details_from_isbndb.
+        """
+        entry = self.get(title)
+        if entry is not None:
+            return entry.result()
+        try:
+            details = request_book_details_from_isbndb(title)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self.set_many({title: (None, e)})
+            raise
+        self.set_many({title: (details, None)})
+        return details
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return dict(self.counters, size=size)
+
+    def clear(self, persistent=False):
+        with self._lock:
+            self._entries.clear()
+        self.counters.clear()
+        if persistent:
+            IsbndbLookup.objects.all().delete()
+
+
+isbndb_lookup_cache = IsbndbLookupCache()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from bookmate.load_env_vars import var_settings
+from books.enrichment import run_enrichment_batch
+from books.lookup_cache import isbndb_lookup_cache
+import time
+
+
+class Command(BaseCommand):
+    help = "Fetch missing book details from ISBNDB for books queued for enrichment."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=var_settings.ENRICHMENT_BATCH_SIZE, help="Tasks claimed per batch.")
+        parser.add_argument('--once', action='store_true', help="Drain the due tasks and exit instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds to sleep when no task is due.")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = run_enrichment_batch(options['batch_size'])
+            if stats['claimed']:
+                self.stdout.write(
+                    f"Claimed {stats['claimed']}: {stats['enriched']} enriched, "
+                    f"{stats['retried']} to retry, {stats['failed']} failed."
+                )
+                continue
+            if options['once']:
+                self.stdout.write(f"Lookup cache: {isbndb_lookup_cache.stats()}")
+                break
+            time.sleep(options['poll_interval'])
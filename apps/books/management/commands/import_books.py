@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from bookmate.load_env_vars import var_settings
+from books.enrichment import run_enrichment_batch
+from books.importer import IMPORT_FORMATS, BookImporter, guess_format
+import json, sys
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Stream books from a CSV (title,author,number_of_pages header) or JSONL file into the catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Input format; guessed from the file extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=var_settings.BOOK_IMPORT_CHUNK_SIZE, help="Rows written per bulk insert.")
+        parser.add_argument('--created-by', help="Username recorded as creator of the imported books.")
+        parser.add_argument('--enrich', action='store_true', help="Drain the enrichment queue after importing.")
+
+    def handle(self, *args, **options):
+        created_by = None
+        if options['created_by']:
+            try:
+                created_by = User.objects.get(username=options['created_by'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['created_by']}' does not exist.")
+
+        input_format = options['format'] or guess_format(options['path'])
+        importer = BookImporter(chunk_size=options['chunk_size'], created_by=created_by)
+        if options['path'] == '-':
+            report = importer.run(sys.stdin, input_format)
+        else:
+            with open(options['path'], newline='', encoding='utf-8', errors='replace') as stream:
+                report = importer.run(stream, input_format)
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(
+            f"Imported {report.created} of {report.rows} rows ({report.duplicates} duplicates, "
+            f"{report.failed} errors) in {report.elapsed:.2f}s, {report.rows_per_second:.0f} rows/sec."
+        )
+
+        if options['enrich']:
+            enriched = 0
+            while True:
+                stats = run_enrichment_batch()
+                if not stats['claimed']:
+                    break
+                enriched += stats['enriched']
+            self.stdout.write(f"Enriched {enriched} books.")
+        if options['verbosity'] > 1:
+            self.stdout.write(json.dumps(report.as_dict()))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from books.isbndb_stub import IsbndbStubServer
+import json
+
+
+class Command(BaseCommand):
+    help = "Serve a local ISBNDB stub so enrichment can run offline (set ISBN_API_BASE_URL to its address)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--books', help="JSON file mapping titles to ISBNDB book payloads.")
+
+    def handle(self, *args, **options):
+        books = {}
+        if options['books']:
+            with open(options['books']) as books_file:
+                books = json.load(books_file)
+        server = IsbndbStubServer(books, port=options['port'])
+        self.stdout.write(f"ISBNDB stub listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
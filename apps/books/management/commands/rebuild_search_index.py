@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from books.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the book full-text search index from books_book."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        backend.rebuild()
+        self.stdout.write(f"Rebuilt the search index with {type(backend).__name__}.")
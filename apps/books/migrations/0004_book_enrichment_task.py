@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_is_rented'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='is_enrichment_pending',
+            field=models.BooleanField(default=False, help_text='Whether the book details are still waiting to be fetched from ISBNDB.'),
+        ),
+        migrations.CreateModel(
+            name='BookEnrichmentTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', help_text='The state of the enrichment task.', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='How many times the task has been attempted.')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the task is due to be attempted.')),
+                ('last_error', models.TextField(blank=True, default='', help_text='The error of the last failed attempt.')),
+                ('book', models.OneToOneField(help_text='The book waiting for its details.', on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_task', to='books.book')),
+            ],
+            options={
+                'verbose_name': 'Book Enrichment Task',
+                'verbose_name_plural': 'Book Enrichment Tasks',
+                'db_table': 'books_book_enrichment_task',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='enrichment_due_idx')],
+            },
+        ),
+    ]
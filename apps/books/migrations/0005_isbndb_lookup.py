@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_enrichment_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IsbndbLookup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('normalized_title', models.CharField(help_text='The normalized title that was looked up.', max_length=512, unique=True)),
+                ('outcome', models.CharField(choices=[('found', 'Found'), ('not_found', 'Not found'), ('error', 'Error')], help_text='The result of the lookup.', max_length=16)),
+                ('details', models.JSONField(blank=True, help_text='The book details returned by ISBNDB.', null=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='When the cached lookup expires.')),
+            ],
+            options={
+                'verbose_name': 'ISBNDB Lookup',
+                'verbose_name_plural': 'ISBNDB Lookups',
+                'db_table': 'books_isbndb_lookup',
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:55
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE books_book_fts USING fts5(
+        title, author, content='books_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')",
+    """
+    CREATE TRIGGER books_book_fts_insert AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_delete AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_update AFTER UPDATE OF title, author ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_book_fts_update",
+    "DROP TRIGGER IF EXISTS books_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_book_fts_insert",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX books_book_search_idx ON books_book
+    USING GIN (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, '')))
+    """,
+    "CREATE INDEX books_book_title_trgm_idx ON books_book USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX books_book_author_trgm_idx ON books_book USING GIN (author gin_trgm_ops)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS books_book_author_trgm_idx",
+    "DROP INDEX IF EXISTS books_book_title_trgm_idx",
+    "DROP INDEX IF EXISTS books_book_search_idx",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index on book title and author, see books.search.
+
+    SQLite gets an external-content FTS5 table kept in sync by triggers, so saves, deletes,
+    bulk imports and queryset updates are all indexed. PostgreSQL gets a GIN tsvector
+    expression index plus trigram indexes. Other backends fall back to LIKE searches.
+    """
+
+    dependencies = [
+        ('books', '0006_book_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_statements({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
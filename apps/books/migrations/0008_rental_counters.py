@@ -0,0 +1,64 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+# Adding a column with a default rebuilds books_book on SQLite, which drops the FTS5 triggers of 0007.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS books_book_fts_insert",
+    "DROP TRIGGER IF EXISTS books_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_book_fts_update",
+    """
+    CREATE TRIGGER books_book_fts_insert AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_delete AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_update AFTER UPDATE OF title, author ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    Book.rental_count and the Counter table, see rentals.counters. The rentals migration fills them in.
+    """
+
+    dependencies = [
+        ('books', '0007_book_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(help_text='The name of the counter.', max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0, help_text='The current count.')),
+            ],
+            options={
+                'verbose_name': 'Counter',
+                'verbose_name_plural': 'Counters',
+                'db_table': 'books_counter',
+            },
+        ),
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='book',
+            name='rental_count',
+            field=models.IntegerField(default=0, editable=False, help_text='How many times the book has been rented.'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
 from __future__ import unicode_literals
 from django.utils.translation import gettext_lazy as _
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from utils.models import CommonFieldModel, User
-import requests
+import logging, requests
 from .utils import FetchBookDetailsFromIsbndb, fetch_book_details_from_isbndb
 
+logger = logging.getLogger('bookmate.isbndb')
+
 
 class Book(CommonFieldModel):
     """
@@ -17,18 +22,22 @@ class Book(CommonFieldModel):
         title (CharField): The title of the book. Max length 255, required, and unique.
         author (CharField): The author of the book. Max length 255, optional.
         number_of_pages (PositiveIntegerField): The number of pages in the book. Optional.
+        is_enrichment_pending (BooleanField): Whether the details are still waiting to be fetched from ISBNDB.
+        rental_count (IntegerField): How many rentals the book has had, maintained by rentals.counters.
         created_by (ForeignKey): The user who created this book record. Optional, set to NULL on user deletion.
         last_modified_by (ForeignKey): The user who last modified this book record. Optional, set to NULL on user deletion.
 
     Methods:
         _fetch_book_details(cls, title): Class method to fetch book details from OpenLibrary API.
-        save(**kwargs): Overridden to automatically fetch and set book details if missing.
+        save(**kwargs): Overridden to queue the book for enrichment if details are missing.
         __str__(): Returns the string representation of the book (its title or ID).
         __repr__(): Returns a detailed string representation for debugging.
 
     Behavior:
-        - On save, if author or number_of_pages is missing, it attempts to fetch these details from OpenLibrary API.
-        - If fetching fails, it uses default values (Unknown author, random number of pages).
+        - On save, if author or number_of_pages is missing, the book is stored right away and a
+          BookEnrichmentTask is queued; the `enrich_books` worker fetches the details from ISBNDB later.
+        - If fetching keeps failing, the worker uses default values (Unknown author, random number of pages).
+        - Saving a change to is_active or is_rented moves the available-books Counter in the same transaction.
 
     Meta:
         db_table: "books_book"
@@ -43,6 +52,8 @@ class Book(CommonFieldModel):
     author = models.CharField(max_length=255, null=True, blank=True, help_text=_("The author of the book. Can be left blank."))
     number_of_pages = models.PositiveIntegerField(null=True, blank=True, help_text=_("The number of pages in the book. Can be left blank."))
     is_rented = models.BooleanField(default=False, help_text=_("Whether the book is rented or not."))
+    is_enrichment_pending = models.BooleanField(default=False, help_text=_("Whether the book details are still waiting to be fetched from ISBNDB."))
+    rental_count = models.IntegerField(default=0, editable=False, help_text=_("How many times the book has been rented."))
     created_by = models.ForeignKey(User, related_name='book_created_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who created this book record."))
     last_modified_by = models.ForeignKey(User, related_name='book_modified_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who last modified this book record."))
 
@@ -52,28 +63,194 @@ class Book(CommonFieldModel):
         try:
             return fetch_book_details_from_isbndb(title)
         except (requests.RequestException, ValueError, KeyError) as e:
-            print(f"Error fetching book details: {e}")
+            logger.warning("Error fetching book details for %r: %s", title, e)
         return FetchBookDetailsFromIsbndb()
         
     class Meta:
         db_table = "books_book"
         verbose_name = _('Book')
         verbose_name_plural = _('Books')
+        indexes = [
+            # Keyset pagination of the book list.
+            models.Index(fields=['-created_at', '-id'], name='book_created_idx'),
+            # Books that can be rented, in the order the admin offers them.
+            models.Index(fields=['title'], condition=models.Q(is_rented=False, is_active=True), name='book_available_idx'),
+        ]
 
     def __str__(self):
         return str(self.title) if self.title else self.id
     
+    @property
+    def is_available(self) -> bool:
+        return self.is_active and not self.is_rented
+
+    @transaction.atomic
     def save(self, **kwargs):
-        if not self.author or not self.number_of_pages:
-            try:
-                book_details = self._fetch_book_details(self.title)
-                self.author = book_details.author if not self.author else self.author
-                self.number_of_pages = book_details.number_of_pages if not self.number_of_pages else self.number_of_pages
-                self.title = f"{self.title} | {book_details.title}"
-            except Exception as e:
-                print(f"An error occurred while fetching or processing book details: {e}")
+        # Never call ISBNDB here: mark the book and let the enrichment worker fill the details in.
+        needs_enrichment = (not self.author or not self.number_of_pages) and not self.is_enrichment_pending
+        adding = self._state.adding
+        if not adding and kwargs.get('update_fields') is None:
+            # rental_count only moves through F() updates; writing back a stale copy would lose rentals.
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'rental_count']
+        if needs_enrichment:
+            self.is_enrichment_pending = True
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'is_enrichment_pending'}
+        was_available = None
+        if not adding and {'is_active', 'is_rented'} & set(kwargs['update_fields']):
+            # The stored flags, locked: the instance may predate a checkout or return.
+            stored = Book.objects.select_for_update().filter(pk=self.pk).values_list('is_active', 'is_rented').first()
+            was_available = stored is not None and stored[0] and not stored[1]
         super(Book, self).save(**kwargs)
+        if adding or was_available is not None:
+            delta = int(self.is_available) - int(bool(was_available))
+            if delta:
+                Counter.adjust(Counter.AVAILABLE_BOOKS, delta)
+        if needs_enrichment:
+            BookEnrichmentTask.enqueue(self)
+
+    def apply_book_details(self, book_details: FetchBookDetailsFromIsbndb):
+        """
+        Fills in the missing details from an ISBNDB lookup, the same way the book used to be saved.
+        """
+        self.author = book_details.author if not self.author else self.author
+        self.number_of_pages = book_details.number_of_pages if not self.number_of_pages else self.number_of_pages
+        self.title = f"{self.title} | {book_details.title}"
+        self.is_enrichment_pending = False
     
     # for better object representation in debugging
     def __repr__(self):
-        return f"<Book: {self.title}>"
\ No newline at end of file
+        return f"<Book: {self.title}>"
+
+
+class BookEnrichmentTask(CommonFieldModel):
+    """
+    A queued ISBNDB lookup for a book saved without author or number of pages.
+
+    The table is the work queue of the `enrich_books` worker: a task is claimed by pushing
+    next_attempt_at forward (a lease), and on failure it is rescheduled with exponential backoff
+    until ENRICHMENT_MAX_ATTEMPTS is reached.
+
+    Attributes:
+        book (OneToOneField): The book waiting for its details.
+        status (CharField): pending, done or failed.
+        attempts (PositiveIntegerField): How many times the worker has claimed the task.
+        next_attempt_at (DateTimeField): When the task becomes due (again).
+        last_error (TextField): The error of the last failed attempt.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+
+    book = models.OneToOneField(Book, related_name='enrichment_task', on_delete=models.CASCADE, help_text=_("The book waiting for its details."))
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, help_text=_("The state of the enrichment task."))
+    attempts = models.PositiveIntegerField(default=0, help_text=_("How many times the task has been attempted."))
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text=_("When the task is due to be attempted."))
+    last_error = models.TextField(blank=True, default='', help_text=_("The error of the last failed attempt."))
+
+    @classmethod
+    def enqueue(cls, book):
+        cls.objects.update_or_create(
+            book=book,
+            defaults={'status': cls.STATUS_PENDING, 'attempts': 0, 'next_attempt_at': timezone.now(), 'last_error': ''},
+        )
+
+    class Meta:
+        db_table = "books_book_enrichment_task"
+        verbose_name = _('Book Enrichment Task')
+        verbose_name_plural = _('Book Enrichment Tasks')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='enrichment_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id}: {self.status}"
+
+
+class IsbndbLookup(CommonFieldModel):
+    """
+    The persistent tier of the ISBNDB lookup cache (see books.lookup_cache).
+
+    Attributes:
+        normalized_title (CharField): The looked up title, case-folded with whitespace collapsed.
+        outcome (CharField): found, not_found or error; the last two are negative entries.
+        details (JSONField): The FetchBookDetailsFromIsbndb payload when the outcome is found.
+        expires_at (DateTimeField): When the entry stops being served.
+    """
+
+    OUTCOME_FOUND = 'found'
+    OUTCOME_NOT_FOUND = 'not_found'
+    OUTCOME_ERROR = 'error'
+    OUTCOME_CHOICES = [
+        (OUTCOME_FOUND, _('Found')),
+        (OUTCOME_NOT_FOUND, _('Not found')),
+        (OUTCOME_ERROR, _('Error')),
+    ]
+
+    normalized_title = models.CharField(max_length=512, unique=True, help_text=_("The normalized title that was looked up."))
+    outcome = models.CharField(max_length=16, choices=OUTCOME_CHOICES, help_text=_("The result of the lookup."))
+    details = models.JSONField(null=True, blank=True, help_text=_("The book details returned by ISBNDB."))
+    expires_at = models.DateTimeField(db_index=True, help_text=_("When the cached lookup expires."))
+
+    class Meta:
+        db_table = "books_isbndb_lookup"
+        verbose_name = _('ISBNDB Lookup')
+        verbose_name_plural = _('ISBNDB Lookups')
+
+    def __str__(self):
+        return f"{self.normalized_title}: {self.outcome}"
+
+
+class Counter(models.Model):
+    """
+    A named, denormalized count kept in step with F() updates by the code that changes what it counts,
+    so reading it is a primary-key lookup instead of a COUNT over a large table.
+    `manage.py recount` rebuilds the counters and reports how far they had drifted.
+
+    Attributes:
+        name (CharField): The counter, e.g. Counter.AVAILABLE_BOOKS.
+        value (BigIntegerField): The current count.
+    """
+
+    # Active books that are not rented.
+    AVAILABLE_BOOKS = 'available_books'
+
+    name = models.CharField(max_length=64, primary_key=True, help_text=_("The name of the counter."))
+    value = models.BigIntegerField(default=0, help_text=_("The current count."))
+
+    class Meta:
+        db_table = "books_counter"
+        verbose_name = _('Counter')
+        verbose_name_plural = _('Counters')
+
+    @classmethod
+    def adjust(cls, name, delta):
+        """
+        Adds `delta` to the counter in one UPDATE; a missing counter is left for `recount` to create.
+        """
+        if delta:
+            cls.objects.filter(name=name).update(value=F('value') + delta)
+
+    @classmethod
+    def adjust_available_books(cls, book_ids, delta):
+        """
+        Moves the available-books counter by `delta` for each active book of `book_ids`, whose
+        is_rented flag the caller has just flipped (so holds the rows' locks).
+        """
+        if not book_ids:
+            return
+        active = Book.objects.filter(pk__in=book_ids, is_active=True).order_by().values('is_active').annotate(count=Count('pk')).values('count')
+        cls.objects.filter(name=cls.AVAILABLE_BOOKS).update(value=F('value') + delta * Coalesce(Subquery(active), 0))
+
+    @classmethod
+    def read(cls, name) -> int | None:
+        return cls.objects.filter(name=name).values_list('value', flat=True).first()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -0,0 +1,188 @@
+from functools import reduce
+from django.core.checks import Tags, Warning, register
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Book
+import operator, re
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query) -> list[str]:
+    return TOKEN_PATTERN.findall(str(query or ''))[:16]
+
+
+class SqliteFtsSearchBackend:
+    """
+    Ranked search on the `books_book_fts` FTS5 table (see migration 0007_book_search_index).
+    Every term is a prefix match and title matches weigh ten times more than author matches.
+
+    The table is kept in sync by triggers on books_book. SQLite drops them whenever a migration
+    rebuilds that table, so check_search_triggers() reports missing ones and rebuild() reinstalls them.
+    """
+
+    table = 'books_book_fts'
+    triggers = {
+        'books_book_fts_insert': """
+            CREATE TRIGGER books_book_fts_insert AFTER INSERT ON books_book BEGIN
+                INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+            END
+        """,
+        'books_book_fts_delete': """
+            CREATE TRIGGER books_book_fts_delete AFTER DELETE ON books_book BEGIN
+                INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            END
+        """,
+        'books_book_fts_update': """
+            CREATE TRIGGER books_book_fts_update AFTER UPDATE OF title, author ON books_book BEGIN
+                INSERT INTO books_book_fts(books_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+                INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+            END
+        """,
+    }
+
+    def __init__(self, using):
+        self.using = using
+
+    def match_expression(self, terms) -> str:
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, terms, limit) -> list[int]:
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY bm25({self.table}, 10.0, 1.0) LIMIT %s",
+                [self.match_expression(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, terms):
+        return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [self.match_expression(terms)]))
+
+    def missing_triggers(self) -> list[str]:
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books_book'")
+            installed = {row[0] for row in cursor.fetchall()}
+        return sorted(set(self.triggers) - installed)
+
+    def rebuild(self):
+        with transaction.atomic(using=self.using), connections[self.using].cursor() as cursor:
+            for name in self.missing_triggers():
+                cursor.execute(self.triggers[name])
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+
+class PostgresSearchBackend:
+    """
+    Ranked search on the GIN tsvector expression index, with prefix terms, plus trigram
+    similarity on the title so near-misses still match.
+    """
+
+    vector = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))"
+    weighted_vector = "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || setweight(to_tsvector('simple', coalesce(author, '')), 'B')"
+
+    def __init__(self, using):
+        self.using = using
+
+    def tsquery(self, terms) -> str:
+        return ' & '.join(f"{term}:*" for term in terms)
+
+    def condition(self):
+        return f"({self.vector} @@ to_tsquery('simple', %s) OR title %% %s)"
+
+    def search(self, terms, limit) -> list[int]:
+        tsquery, text = self.tsquery(terms), ' '.join(terms)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM books_book WHERE {self.condition()} "
+                f"ORDER BY ts_rank({self.weighted_vector}, to_tsquery('simple', %s)) + similarity(title, %s) DESC LIMIT %s",
+                [tsquery, text, tsquery, text, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, terms):
+        return queryset.filter(pk__in=RawSQL(f"SELECT id FROM books_book WHERE {self.condition()}", [self.tsquery(terms), ' '.join(terms)]))
+
+    def rebuild(self):
+        pass  # Expression indexes are maintained by PostgreSQL itself.
+
+
+class LikeSearchBackend:
+    """
+    Fallback for databases without a full-text index: every term must appear in the title or author.
+    """
+
+    def __init__(self, using):
+        self.using = using
+
+    def filter(self, queryset, terms):
+        return queryset.filter(reduce(operator.and_, (Q(title__icontains=term) | Q(author__icontains=term) for term in terms)))
+
+    def search(self, terms, limit) -> list[int]:
+        return list(self.filter(Book.objects.using(self.using), terms).order_by('title').values_list('id', flat=True)[:limit])
+
+    def rebuild(self):
+        pass
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    """
+    The search backend of the `using` database. The choice is cached per alias and database, so
+    a replica on another vendor, or an alias pointed at another database, gets its own backend.
+    """
+    connection = connections[using]
+    key = (using, connection.vendor, connection.settings_dict['NAME'])
+    if key not in _backends:
+        if connection.vendor == 'sqlite' and SqliteFtsSearchBackend.table in connection.introspection.table_names():
+            _backends[key] = SqliteFtsSearchBackend(using)
+        elif connection.vendor == 'postgresql':
+            _backends[key] = PostgresSearchBackend(using)
+        else:
+            _backends[key] = LikeSearchBackend(using)
+    return _backends[key]
+
+
+@register(Tags.database)
+def check_search_triggers(databases=None, **kwargs):
+    """
+    Warns when the triggers that keep the SQLite search index in sync are missing, e.g. after a
+    migration rebuilt books_book; searches would silently miss new and changed books.
+    """
+    warnings = []
+    for using in databases or []:
+        connection = connections[using]
+        # Not through get_search_backend(): migrate runs the checks before creating the index.
+        if connection.vendor != 'sqlite' or SqliteFtsSearchBackend.table not in connection.introspection.table_names():
+            continue
+        if missing := SqliteFtsSearchBackend(using).missing_triggers():
+            warnings.append(Warning(
+                f"The book search index triggers {', '.join(missing)} are missing on the '{using}' database.",
+                hint="Run `python manage.py rebuild_search_index` to reinstall them and reindex the books.",
+                id='books.W001',
+            ))
+    return warnings
+
+
+def search_books(query, limit=20, using='default') -> list[Book]:
+    """
+    Returns up to `limit` books matching every term of `query`, best match first.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+    ids = get_search_backend(using).search(terms, limit)
+    books = Book.objects.using(using).select_related('created_by', 'last_modified_by').in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
+
+
+def filter_books(queryset, query):
+    """
+    Narrows a Book queryset to the books matching every term of `query`, using the search index.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset
+    return get_search_backend(queryset.db).filter(queryset, terms)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from utils.fast_serializers import ValuesSerializer
 from .models import Book
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -17,17 +18,13 @@ class BookListSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'author', 'number_of_pages', 'created_by', 'last_modified_by', 'created_at', 'last_modified_at']
         read_only_fields = fields
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if instance.created_by:
-            representation['created_by'] = UserSerializer(instance.created_by).data
-        if instance.last_modified_by:
-            representation['last_modified_by'] = UserSerializer(instance.last_modified_by).data
-        return representation
-
 
 class BookBriefSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'number_of_pages']
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+
+# Fast read path for the book list: same output as BookListSerializer, built from values() rows.
+book_list_rows = ValuesSerializer(BookListSerializer)
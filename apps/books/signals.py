@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from .catalogue import invalidate_catalogue
+from .models import Book, Counter
+
+# Sent with `instance` when a book's details are written with an UPDATE, which post_save does not see.
+book_details_updated = Signal()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleting(sender, instance, **kwargs):
+    # Runs inside the deletion's transaction, against the stored flags rather than the instance's.
+    if Book.objects.filter(pk=instance.pk, is_active=True, is_rented=False).exists():
+        Counter.adjust(Counter.AVAILABLE_BOOKS, -1)
@@ -1,3 +1,597 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from bookmate.load_env_vars import var_settings
+from rentals.models import Rental
+from rentals.services import checkout
+from utils.fast_serializers import ValuesSerializer, render_json
+from utils.log import JsonFormatter
+from .enrichment import arun_enrichment_batch, run_enrichment_batch
+from .importer import BookImporter
+from .isbndb_stub import IsbndbStubServer
+from .lookup_cache import CachedLookupError, IsbndbLookupCache, isbndb_lookup_cache
+from .models import Book, BookEnrichmentTask, IsbndbLookup
+from .serializers import BookBriefSerializer
+from .views import AsyncBookListView, BookListView
+from .search import PostgresSearchBackend, SqliteFtsSearchBackend, check_search_triggers, filter_books, get_search_backend, search_books
+from .utils import CircuitBreaker, CircuitOpenError, IsbndbClient, TokenBucket, fetch_many_book_details_from_isbndb
+import base64, csv, io, json
 
-# Create your tests here.
+User = get_user_model()
+
+
+def titles_one_by_one(request):
+    return JsonResponse({'titles': [Book.objects.get(pk=pk).title for pk in Book.objects.values_list('pk', flat=True)]})
+
+
+def isbndb_lookups(request):
+    return JsonResponse({'found': sorted(title for title, (details, error) in fetch_many_book_details_from_isbndb(['Dune', 'Emma']).items() if details)})
+
+
+# URLconf for RequestMetricsTests: the project's URLs plus two views with known costs.
+urlpatterns = [
+    path('', include('bookmate.urls')),
+    path('titles-one-by-one/', titles_one_by_one, name='titles-one-by-one'),
+    path('isbndb-lookups/', isbndb_lookups, name='isbndb-lookups'),
+]
+
+
+class IsbndbStubTestCase(TestCase):
+    books = {'Dune': {'title': 'Dune', 'authors': ['Frank Herbert'], 'pages': 412}}
+
+    def setUp(self):
+        isbndb_lookup_cache.clear()
+        self.server = IsbndbStubServer(self.books).start()
+        self.addCleanup(self.server.stop)
+        self.client_under_test = IsbndbClient(base_url=self.server.base_url, rate_limit=1000, burst=100)
+        self.addCleanup(self.client_under_test.close)
+        patcher = mock.patch('books.utils.isbndb_client', self.client_under_test)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class BookEnrichmentTests(IsbndbStubTestCase):
+    def test_save_queues_enrichment_without_calling_isbndb(self):
+        book = Book.objects.create(title='Dune')
+
+        self.assertTrue(book.is_enrichment_pending)
+        self.assertEqual(book.enrichment_task.status, BookEnrichmentTask.STATUS_PENDING)
+        self.assertEqual(self.server.requests, [])
+
+    def test_worker_fills_in_book_details(self):
+        book = Book.objects.create(title='Dune')
+
+        stats = run_enrichment_batch()
+
+        book.refresh_from_db()
+        self.assertEqual(stats['enriched'], 1)
+        self.assertEqual(book.author, 'Frank Herbert')
+        self.assertEqual(book.number_of_pages, 412)
+        self.assertEqual(book.title, 'Dune | Dune')
+        self.assertFalse(book.is_enrichment_pending)
+        self.assertEqual(BookEnrichmentTask.objects.get(book=book).status, BookEnrichmentTask.STATUS_DONE)
+
+    def test_worker_retries_with_backoff(self):
+        book = Book.objects.create(title='Dune')
+        self.server.fail_next = 1
+
+        stats = run_enrichment_batch()
+
+        task = BookEnrichmentTask.objects.get(book=book)
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(task.attempts, 1)
+        self.assertGreater(task.next_attempt_at, timezone.now())
+        self.assertEqual(run_enrichment_batch()['claimed'], 0)
+
+        BookEnrichmentTask.objects.filter(pk=task.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_enrichment_batch()['enriched'], 1)
+
+    def test_worker_gives_up_after_max_attempts(self):
+        book = Book.objects.create(title='Dune')
+        self.server.fail_next = 1
+
+        with mock.patch.object(var_settings, 'ENRICHMENT_MAX_ATTEMPTS', 1):
+            stats = run_enrichment_batch()
+
+        book.refresh_from_db()
+        self.assertEqual(stats['failed'], 1)
+        self.assertFalse(book.is_enrichment_pending)
+        self.assertTrue(book.author)
+        self.assertEqual(BookEnrichmentTask.objects.get(book=book).status, BookEnrichmentTask.STATUS_FAILED)
+
+    def test_worker_reprices_open_rentals(self):
+        student = User.objects.create_user('student')
+        book = Book.objects.create(title='Dune')
+        rental = checkout(student, book, rental_date=timezone.now() - timedelta(days=100))
+        self.assertEqual(rental.fee.accrued_fee, 0.0)
+
+        run_enrichment_batch()
+
+        rental.fee.refresh_from_db()
+        self.assertGreater(rental.fee.accrued_fee, 0.0)
+        self.assertEqual(rental.fee.accrued_fee, Rental.objects.get(pk=rental.pk)._rental_fee())
+        self.assertEqual(student.fee_balance.outstanding_fee, rental.fee.accrued_fee)
+
+    def test_worker_looks_up_repeated_titles_once(self):
+        Book.objects.create(title='Dune')
+        Book.objects.create(title='dune ')
+
+        self.assertEqual(run_enrichment_batch()['enriched'], 2)
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_async_worker_fills_in_book_details(self):
+        book = await Book.objects.acreate(title='Dune')
+
+        stats = await arun_enrichment_batch()
+
+        await book.arefresh_from_db()
+        self.assertEqual(stats['enriched'], 1)
+        self.assertEqual((book.author, book.number_of_pages), ('Frank Herbert', 412))
+        self.assertFalse(book.is_enrichment_pending)
+
+
+class IsbndbLookupCacheTests(IsbndbStubTestCase):
+    def test_found_lookup_is_served_from_both_tiers(self):
+        cache = IsbndbLookupCache()
+        self.assertEqual(cache.lookup('Dune').author, 'Frank Herbert')
+        self.assertEqual(cache.lookup('  DUNE').author, 'Frank Herbert')
+        self.assertEqual(IsbndbLookupCache().lookup('dune').number_of_pages, 412)
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+
+    def test_not_found_and_errors_are_negatively_cached(self):
+        cache = IsbndbLookupCache()
+        self.assertIsNone(cache.lookup('Unknown Book'))
+        self.assertIsNone(cache.lookup('Unknown Book'))
+
+        self.server.fail_next = 1
+        with self.assertRaises(Exception):
+            cache.lookup('Dune')
+        with self.assertRaises(CachedLookupError):
+            IsbndbLookupCache().lookup('Dune')
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stats()['negative_hits'], 1)
+
+    def test_expired_entries_are_fetched_again(self):
+        cache = IsbndbLookupCache()
+        cache.lookup('Dune')
+        cache.clear()
+        IsbndbLookup.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        cache.lookup('Dune')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class IsbndbClientTests(IsbndbStubTestCase):
+    books = {
+        'Dune': {'title': 'Dune', 'authors': ['Frank Herbert'], 'pages': 412},
+        'Emma': {'title': 'Emma', 'authors': ['Jane Austen'], 'pages': 474},
+    }
+
+    def test_fetch_many_runs_lookups_in_parallel(self):
+        results = self.client_under_test.fetch_many(['Dune', 'Emma', 'Unknown', 'Dune'])
+
+        self.assertEqual(results['Dune'][0].author, 'Frank Herbert')
+        self.assertEqual(results['Emma'][0].number_of_pages, 474)
+        self.assertEqual(results['Unknown'], (None, None))
+        self.assertEqual(sorted(self.server.requests), ['Dune', 'Emma', 'Unknown'])
+
+    async def test_async_lookups_are_awaitable(self):
+        results = await self.client_under_test.afetch_many(['Dune', 'Emma', 'Unknown', 'Dune'])
+
+        self.assertEqual(results['Emma'][0].author, 'Jane Austen')
+        self.assertEqual(results['Unknown'], (None, None))
+        self.assertEqual(sorted(self.server.requests), ['Dune', 'Emma', 'Unknown'])
+        self.assertTrue((await self.client_under_test.afetch('Unknown')).author.startswith('Author_'))
+
+    def test_circuit_breaker_fails_fast_to_defaults(self):
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=2, reset_timeout=60)
+        client = IsbndbClient(base_url=self.server.base_url, rate_limit=1000, burst=100, circuit_breaker=breaker)
+        self.addCleanup(client.close)
+        self.server.fail_next = 2
+
+        with self.assertLogs('bookmate.isbndb', 'WARNING') as logs:
+            client.fetch('Dune')
+            client.fetch('Dune')
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("'Dune'", logs.records[0].getMessage())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            client.request('Dune')
+        self.assertTrue(client.fetch('Dune').title.startswith('Title_'))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_circuit_breaker_closes_after_successful_probe(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=2, reset_timeout=30, clock=lambda: now[0])
+        breaker.record(False)
+        breaker.record(False)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 31
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_token_bucket_paces_requests(self):
+        now, sleeps = [0.0], []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(sleeps, [0.5, 0.5])
+
+
+class BookImportTests(TestCase):
+    def test_csv_import_dedupes_and_reports_bad_rows(self):
+        Book.objects.create(title='Existing', author='Someone', number_of_pages=10)
+        stream = io.StringIO(
+            "title,author,number_of_pages\n"
+            "Dune,Frank Herbert,412\n"
+            "Existing,,\n"
+            "Dune,,\n"
+            ",No Title,1\n"
+            "Emma,,abc\n"
+            "Persuasion,,\n"
+        )
+
+        report = BookImporter(chunk_size=2).run(stream, 'csv')
+
+        self.assertEqual((report.rows, report.created, report.duplicates, report.failed), (6, 2, 2, 2))
+        self.assertEqual([error['line'] for error in report.errors], [5, 6])
+        self.assertEqual(Book.objects.get(title='Dune').number_of_pages, 412)
+        self.assertFalse(Book.objects.get(title='Dune').is_enrichment_pending)
+        self.assertTrue(BookEnrichmentTask.objects.filter(book__title='Persuasion').exists())
+
+    def test_csv_import_skips_lines_the_csv_module_rejects(self):
+        oversized = 'x' * (csv.field_size_limit() + 1)
+        stream = io.StringIO(f"title,author,number_of_pages\nDune,,\n{oversized},,\nEmma,,\n")
+
+        report = BookImporter().run(stream, 'csv')
+
+        self.assertEqual((report.rows, report.created, report.failed), (3, 2, 1))
+        self.assertEqual(report.errors[0]['line'], 3)
+        self.assertIn('Invalid CSV', report.errors[0]['error'])
+
+    def test_jsonl_import_endpoint(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        lines = [json.dumps({'title': 'Dune', 'author': 'Frank Herbert', 'number_of_pages': 412}), '{broken', json.dumps({'title': 'Emma'})]
+        upload = SimpleUploadedFile('books.jsonl', "\n".join(lines).encode())
+
+        response = self.client.post(reverse('book-import'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['errors'][0]['line'], 2)
+        self.assertEqual(Book.objects.get(title='Emma').created_by, admin)
+
+
+class BookListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('reader', password='reader'))
+        self.books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100) for i in range(5)]
+        # Two books created in the same instant must still page in a stable order.
+        Book.objects.filter(pk__in=[self.books[1].pk, self.books[2].pk]).update(created_at=self.books[1].created_at)
+
+    def titles(self, response):
+        return [book['title'] for book in response.json()['results']]
+
+    def test_pages_walk_the_keyset_forward_and_back(self):
+        first = self.client.get(reverse('book-list'), {'page_size': 2})
+        second = self.client.get(first.json()['next'])
+        third = self.client.get(second.json()['next'])
+
+        self.assertEqual(self.titles(first), ['Book 4', 'Book 3'])
+        self.assertEqual(self.titles(second), ['Book 2', 'Book 1'])
+        self.assertEqual(self.titles(third), ['Book 0'])
+        self.assertIsNone(first.json()['previous'])
+        self.assertIsNone(third.json()['next'])
+        self.assertEqual(self.titles(self.client.get(third.json()['previous'])), ['Book 2', 'Book 1'])
+        self.assertEqual(self.titles(self.client.get(second.json()['previous'])), ['Book 4', 'Book 3'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('book-list'), {'cursor': 'nope'}).status_code, 404)
+
+    async def test_async_view_pages_like_the_drf_view(self):
+        user = await User.objects.aget(username='reader')
+        await self.async_client.aforce_login(user)
+        sync_first = await self.async_client.get(reverse('book-list'), {'page_size': 2})
+        first = await self.async_client.get(reverse('book-list-async'), {'page_size': 2})
+        second = await self.async_client.get(first.json()['next'])
+
+        self.assertEqual(first.json()['results'], sync_first.json()['results'])
+        self.assertEqual(first.json()['next'].split('cursor=')[1], sync_first.json()['next'].split('cursor=')[1])
+        self.assertEqual(self.titles(second), ['Book 2', 'Book 1'])
+        self.assertEqual(first['ETag'], sync_first['ETag'])
+        self.assertEqual((await self.async_client.get(reverse('book-list-async'), headers={'if-none-match': first['ETag']})).status_code, 304)
+        self.assertEqual((await self.async_client.get(reverse('book-list-async'), {'cursor': 'nope'})).json(), {'detail': 'Invalid cursor'})
+
+        await self.async_client.alogout()
+        anonymous = await self.async_client.get(reverse('book-list-async'))
+        self.assertEqual(anonymous.status_code, 403)
+        self.assertEqual(anonymous.content, (await self.async_client.get(reverse('book-list'))).content)
+
+    async def test_async_view_authenticates_like_the_drf_view(self):
+        def basic(password):
+            return {'authorization': 'Basic ' + base64.b64encode(f"reader:{password}".encode()).decode()}
+
+        self.assertEqual((await self.async_client.get(reverse('book-list-async'), headers=basic('reader'))).status_code, 200)
+        for headers in (basic('wrong'), {}):
+            expected = await self.async_client.get(reverse('book-list'), headers=headers)
+            response = await self.async_client.get(reverse('book-list-async'), headers=headers)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+        # With a challenging authenticator first, both answer 401 and ask for credentials.
+        with mock.patch.object(BookListView, 'authentication_classes', [BasicAuthentication, SessionAuthentication]), \
+                mock.patch.object(AsyncBookListView, 'authentication_classes', [BasicAuthentication, SessionAuthentication]):
+            expected = await self.async_client.get(reverse('book-list'))
+            response = await self.async_client.get(reverse('book-list-async'))
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, expected['WWW-Authenticate']))
+        self.assertEqual(response.content, expected.content)
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create_user('creator', first_name='Ren\u00e9e', last_name='\u738b')
+        self.client.force_login(creator)
+        Book.objects.create(title='Line\u2028Separator \U0001F4D6', author=None, number_of_pages=None, created_by=creator)
+        Book.objects.create(title='"Quoted" \\ back\tslash', author='Author', number_of_pages=0, last_modified_by=creator)
+        Book.objects.create(title='Plain', author='', number_of_pages=1200)
+        Book.objects.bulk_create([Book(title=f"Bulk {i}", author='Author', number_of_pages=i) for i in range(3)])
+
+    def pages(self, url_name, **params):
+        contents, url = [], reverse(url_name) + '?page_size=2'
+        while url:
+            cache.clear()
+            response = self.client.get(url, **params)
+            self.assertEqual(response.status_code, 200)
+            contents.append(response.content)
+            url = response.json()['next'] if 'json' in response['Content-Type'] else None
+        return contents
+
+    def test_book_list_renders_the_same_bytes_as_the_model_serializer(self):
+        with mock.patch('utils.fast_serializers.render_json', wraps=render_json) as fast_render:
+            fast = self.pages('book-list')
+        with mock.patch.object(var_settings, 'FAST_SERIALIZERS', False):
+            expected = self.pages('book-list')
+
+        self.assertEqual(len(fast), 3)
+        self.assertEqual(fast, expected)
+        self.assertEqual(fast_render.call_count, 3)
+        self.assertIn(b'\\u2028', fast[-1])
+
+    def test_fast_pages_carry_the_regular_headers(self):
+        def headers(url_name):
+            cache.clear()
+            response = self.client.get(reverse(url_name))
+            return {key: value for key, value in response.headers.items() if key != 'Server-Timing'}
+
+        for url_name in ('book-list', 'rental-list-create'):
+            with mock.patch('utils.fast_serializers.render_json', wraps=render_json) as fast_render:
+                fast = headers(url_name)
+            fast_render.assert_called_once()
+            with mock.patch.object(var_settings, 'FAST_SERIALIZERS', False):
+                self.assertEqual(fast, headers(url_name))
+            self.assertIn('Accept', fast['Vary'])
+            self.assertEqual(fast['Allow'], 'GET, POST, HEAD, OPTIONS')
+
+    def test_other_timezones_and_renderers_match_too(self):
+        with timezone.override('Asia/Kolkata'):
+            fast = self.pages('book-list')
+            with mock.patch.object(var_settings, 'FAST_SERIALIZERS', False):
+                expected = self.pages('book-list')
+        self.assertEqual(fast, expected)
+        self.assertIn(b'+05:30"', fast[0])
+
+        # Indented JSON and the browsable API take the regular DRF path.
+        with mock.patch('utils.fast_serializers.render_json') as fast_render:
+            indented = self.pages('book-list', HTTP_ACCEPT='application/json; indent=2')
+            self.assertContains(self.client.get(reverse('book-list'), HTTP_ACCEPT='text/html'), 'Line')
+        fast_render.assert_not_called()
+        with mock.patch.object(var_settings, 'FAST_SERIALIZERS', False):
+            self.assertEqual(indented, self.pages('book-list', HTTP_ACCEPT='application/json; indent=2'))
+
+    def test_values_serializer_requires_computed_fields(self):
+        class BookTitleSerializer(BookBriefSerializer):
+            shout = serializers.SerializerMethodField()
+
+            class Meta(BookBriefSerializer.Meta):
+                fields = [*BookBriefSerializer.Meta.fields, 'shout']
+
+            def get_shout(self, book):
+                return book.title.upper()
+
+        with self.assertRaises(TypeError):
+            ValuesSerializer(BookTitleSerializer).compile()
+        rows = ValuesSerializer(BookTitleSerializer, computed={'shout': (('title',), str.upper)})
+        self.assertEqual(rows.serialize(Book.objects.filter(title='Plain')), [
+            {'id': Book.objects.get(title='Plain').pk, 'title': 'Plain', 'author': '', 'number_of_pages': 1200, 'shout': 'PLAIN'},
+        ])
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('reader'))
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+
+    def book_queries(self, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(*args, **kwargs)
+        return response, [query['sql'] for query in context.captured_queries if 'books_book' in query['sql']]
+
+    def test_unchanged_catalogue_is_answered_with_304(self):
+        first = self.client.get(reverse('book-list'))
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+
+        by_etag, queries = self.book_queries(reverse('book-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        by_date, _ = self.book_queries(reverse('book-list'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        self.assertEqual((by_etag.status_code, by_date.status_code), (304, 304))
+        self.assertEqual(by_etag['ETag'], first['ETag'])
+        self.assertEqual(queries, [])
+
+    def test_rendered_pages_are_served_from_the_cache(self):
+        first = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        second, queries = self.book_queries(reverse('book-detail', args=[self.book.pk]))
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(queries, [])
+        self.assertEqual(self.client.get(reverse('book-detail', args=[0])).status_code, 404)
+
+    def test_writes_and_bulk_paths_move_the_catalogue_version(self):
+        student = User.objects.create_user('student')
+        writes = [
+            lambda: Book.objects.create(title='Emma', author='Jane Austen', number_of_pages=474),
+            lambda: BookImporter().run(io.StringIO("title,author,number_of_pages\nPersuasion,Jane Austen,249\n"), 'csv'),
+            lambda: checkout(student, self.book),
+            lambda: Book.objects.get(title='Emma').delete(),
+        ]
+        etag = self.client.get(reverse('book-list')).get('ETag')
+        for write in writes:
+            write()
+            response = self.client.get(reverse('book-list'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+        titles = [book['title'] for book in response.json()['results']]
+        self.assertEqual(titles, ['Persuasion', 'Dune'])
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+        Book.objects.create(title='Children of Dune', author='Frank Herbert', number_of_pages=444)
+        Book.objects.create(title='Emma', author='Jane Austen', number_of_pages=474)
+        Book.objects.create(title='Dunes of the Sahara', author='Theodore Monod', number_of_pages=300)
+        Book.objects.create(title='Memoirs', author='Dune Fan', number_of_pages=100)
+
+    def titles(self, query, **kwargs):
+        return [book.title for book in search_books(query, **kwargs)]
+
+    def test_uses_the_fts5_index_on_sqlite(self):
+        self.assertIsInstance(get_search_backend(), SqliteFtsSearchBackend)
+
+    def test_ranks_title_matches_above_author_matches(self):
+        titles = self.titles('dune')
+        self.assertEqual(titles[-1], 'Memoirs')
+        self.assertEqual(set(titles[:-1]), {'Dune', 'Children of Dune', 'Dunes of the Sahara'})
+
+    def test_terms_are_prefix_matched_and_all_required(self):
+        self.assertEqual(self.titles('frank chil'), ['Children of Dune'])
+        self.assertEqual(self.titles('aust'), ['Emma'])
+        self.assertEqual(self.titles('"; DROP TABLE'), [])
+
+    def test_index_follows_updates_deletes_and_bulk_imports(self):
+        Book.objects.filter(title='Emma').update(title='Persuasion')
+        Book.objects.get(title='Dune').delete()
+        BookImporter().run(io.StringIO("title,author,number_of_pages\nSense and Sensibility,Jane Austen,409\n"), 'csv')
+
+        self.assertEqual(self.titles('persua'), ['Persuasion'])
+        self.assertNotIn('Dune', self.titles('dune'))
+        self.assertEqual(set(self.titles('austen')), {'Persuasion', 'Sense and Sensibility'})
+        self.assertEqual(filter_books(Book.objects.all(), 'sens').get().title, 'Sense and Sensibility')
+
+    def test_missing_index_triggers_are_reported_and_reinstalled(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER books_book_fts_update")
+        self.assertEqual([warning.id for warning in check_search_triggers(databases=['default'])], ['books.W001'])
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+
+        self.assertEqual(check_search_triggers(databases=['default']), [])
+        Book.objects.filter(title='Emma').update(title='Persuasion')
+        self.assertEqual(self.titles('persua'), ['Persuasion'])
+
+    def test_backend_is_chosen_per_database_vendor(self):
+        self.assertIsInstance(get_search_backend(), SqliteFtsSearchBackend)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertIsInstance(get_search_backend(), PostgresSearchBackend)
+        self.assertIsInstance(get_search_backend(), SqliteFtsSearchBackend)
+
+    def test_search_endpoint(self):
+        self.client.force_login(User.objects.create_user('reader'))
+
+        response = self.client.get(reverse('book-search'), {'q': 'herbert', 'limit': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]['author'], 'Frank Herbert')
+
+
+@override_settings(ROOT_URLCONF='books.tests')
+class RequestMetricsTests(IsbndbStubTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(User.objects.create_user('reader'))
+        for title in ('Dune', 'Emma', 'Persuasion'):
+            Book.objects.create(title=title, author='Author', number_of_pages=100)
+
+    def request_record(self, url_name):
+        with self.assertLogs('bookmate.requests', 'INFO') as logs:
+            response = self.client.get(reverse(url_name))
+        return response, logs.records
+
+    def test_requests_report_timing_queries_and_isbndb_calls(self):
+        response, records = self.request_record('book-list')
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", isbndb;dur=0\.0;desc="0 calls", total;dur=[\d.]+$')
+        self.assertEqual((records[0].view, records[0].status), ('book-list', 200))
+        self.assertGreater(records[0].db_queries, 0)
+        self.assertEqual(json.loads(JsonFormatter().format(records[0]))['view'], 'book-list')
+
+        response, records = self.request_record('isbndb-lookups')
+        self.assertEqual(response.json(), {'found': ['Dune']})
+        self.assertEqual(records[0].isbndb_calls, 2)
+
+    def test_metrics_endpoint_exposes_the_histograms(self):
+        self.client.get(reverse('book-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        metrics = self.client.get(reverse('metrics'))
+
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = metrics.content.decode()
+        self.assertIn('# TYPE bookmate_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'bookmate_http_request_duration_seconds_bucket\{view="book-list",method="GET",status="200",le="\+Inf"\} \d+')
+        self.assertRegex(body, r'bookmate_isbndb_request_duration_seconds_count\{outcome="found"\} \d+')
+
+        self.client.logout()
+        with mock.patch.object(var_settings, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_slow_queries_and_n_plus_one_are_reported_with_the_view(self):
+        with mock.patch.object(var_settings, 'N_PLUS_ONE_THRESHOLD', 3), mock.patch.object(var_settings, 'SLOW_QUERY_MS', 0):
+            response, records = self.request_record('titles-one-by-one')
+
+        self.assertEqual(response.json()['titles'], ['Dune', 'Emma', 'Persuasion'])
+        warnings = [record.getMessage() for record in records if record.levelname == 'WARNING']
+        self.assertTrue(any(message.startswith('Slow query in titles-one-by-one') for message in warnings))
+        self.assertTrue(any(message.startswith('Possible N+1 in titles-one-by-one: statement ran 3 times') for message in warnings))
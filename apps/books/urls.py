@@ -1,6 +1,10 @@
 from django.urls import path
-from .views import BookListView
+from .views import AsyncBookListView, BookDetailView, BookImportView, BookListView, BookSearchView
 
 urlpatterns = [
     path('book-list/', BookListView.as_view(), name='book-list'),
+    path('book-list-async/', AsyncBookListView.as_view(), name='book-list-async'),
+    path('book-detail/<int:pk>/', BookDetailView.as_view(), name='book-detail'),
+    path('search/', BookSearchView.as_view(), name='book-search'),
+    path('book-import/', BookImportView.as_view(), name='book-import'),
 ]
@@ -1,32 +1,280 @@
 from bookmate.load_env_vars import var_settings
-from pydantic import BaseModel, Field
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ConfigDict, Field
 from django.utils import timezone
-import requests, random
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from utils.metrics import record_isbndb_call
+import asyncio, contextvars, logging, requests, random, threading, time
+
+logger = logging.getLogger('bookmate.isbndb')
 
 
 class FetchBookDetailsFromIsbndb(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     title: str = Field(default=f"Title_{timezone.now().strftime('%Y_%m_%d_%H_%M_%S')}")
     author: str = Field(default=f"Author_{timezone.now().strftime('%Y_%m_%d_%H_%M_%S')}")
     number_of_pages: int = Field(default_factory=lambda: random.randint(1, 500), alias="number of pages of given book")
 
 
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised without touching the network while the ISBNDB circuit breaker is open.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+    acquire() blocks until a token is available, so callers never exceed the API plan.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(capacity or 1, 1)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens once at least `min_calls` of the last `window` calls were made and the share of
+    failures among them reaches `failure_rate`. While open, calls are refused until
+    `reset_timeout` seconds have passed; then a single probe call decides whether it closes again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate, window, min_calls, reset_timeout, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if self._probing or self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and self._clock() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, success):
+        with self._lock:
+            if self._opened_at is not None:
+                # Outcome of the half-open probe.
+                self._probing = False
+                if success:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = self._clock()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._opened_at = self._clock()
+
+
+class IsbndbClient:
+    """
+    Reusable ISBNDB client.
+
+    Lookups share a pooled `requests.Session` (TCP/TLS reuse), are paced by a token bucket
+    matching the API plan (ISBN_API_RATE_LIMIT/ISBN_API_BURST) and guarded by a circuit breaker
+    that fails fast once the recent error rate crosses ISBN_CIRCUIT_FAILURE_RATE.
+    fetch_many() runs lookups in parallel on a pool of ISBN_API_CONCURRENCY threads.
+    The `a`-prefixed methods are their awaitable versions for async code.
+
+    Every option defaults to var_settings, so the client can be pointed at a local stub
+    server by setting ISBN_API_BASE_URL or passing base_url.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=None, rate_limit=None, burst=None, concurrency=None, circuit_breaker=None):
+        self._base_url = base_url
+        self._api_key = api_key
+        self.timeout = timeout or var_settings.ISBN_API_TIMEOUT
+        self.concurrency = concurrency or var_settings.ISBN_API_CONCURRENCY
+        self.rate_limiter = TokenBucket(rate_limit or var_settings.ISBN_API_RATE_LIMIT, burst or var_settings.ISBN_API_BURST)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            failure_rate=var_settings.ISBN_CIRCUIT_FAILURE_RATE,
+            window=var_settings.ISBN_CIRCUIT_WINDOW,
+            min_calls=var_settings.ISBN_CIRCUIT_MIN_CALLS,
+            reset_timeout=var_settings.ISBN_CIRCUIT_RESET_TIMEOUT,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"accept": "application/json"})
+
+    @property
+    def base_url(self) -> str:
+        return (self._base_url or var_settings.ISBN_API_BASE_URL).rstrip('/')
+
+    def request(self, title) -> FetchBookDetailsFromIsbndb | None :
+        """
+        Looks up a single title on ISBNDB.
+        Returns:
+            FetchBookDetailsFromIsbndb: The details of the best match, or None when ISBNDB has no book for the title.
+        Raises:
+            CircuitOpenError: While the circuit breaker is open.
+            requests.RequestException, ValueError, KeyError: On transport errors or malformed responses.
+        """
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError("ISBNDB circuit breaker is open")
+        self.rate_limiter.acquire()
+        url = f"{self.base_url}/books/{quote(title, safe='')}?page=1&pageSize=1&column=title"
+        headers = {"Authorization": self._api_key or var_settings.ISBN_API_KEY}
+        started, outcome = time.perf_counter(), 'error'
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 404:
+                outcome = 'not_found'
+                self.circuit_breaker.record(True)
+                return None
+            response.raise_for_status()
+            data = response.json()
+            book_details = None
+            if data.get('books'):
+                book_data = data['books'][0]
+                book_details = FetchBookDetailsFromIsbndb(
+                        author=(book_data.get('authors') or ['Unknown'])[0],
+                        number_of_pages=book_data.get('pages') or 0,
+                        title=book_data.get('title', title)
+                    )
+            outcome = 'found' if book_details else 'not_found'
+        except (requests.RequestException, ValueError, KeyError):
+            self.circuit_breaker.record(False)
+            raise
+        finally:
+            record_isbndb_call(time.perf_counter() - started, outcome)
+        self.circuit_breaker.record(True)
+        return book_details
+
+    def fetch(self, title) -> FetchBookDetailsFromIsbndb :
+        """
+        Like request(), but falls back to the FetchBookDetailsFromIsbndb defaults on any failure.
+        """
+        try:
+            book_details = self.request(title)
+            if book_details is not None:
+                return book_details
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.warning("Error fetching book details from ISBNDB for %r: %s", title, e)
+        return FetchBookDetailsFromIsbndb()
+
+    def _request_result(self, title):
+        try:
+            return self.request(title), None
+        except (requests.RequestException, ValueError, KeyError) as e:
+            return None, e
+
+    def fetch_many(self, titles) -> dict:
+        """
+        Looks the titles up in parallel.
+        Returns:
+            dict: title -> (FetchBookDetailsFromIsbndb or None, exception or None).
+        """
+        titles = list(dict.fromkeys(titles))
+        if len(titles) <= 1:
+            return {title: self._request_result(title) for title in titles}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(titles))) as executor:
+            # Each lookup runs in a copy of the caller's context so its call is counted on the caller's request.
+            futures = [executor.submit(contextvars.copy_context().run, self._request_result, title) for title in titles]
+            return {title: future.result() for title, future in zip(titles, futures)}
+
+    async def arequest(self, title) -> FetchBookDetailsFromIsbndb | None :
+        """
+        request() for async callers: the blocking lookup, rate limiting included, runs in a worker
+        thread so the event loop keeps serving other requests meanwhile.
+        """
+        return await asyncio.to_thread(self.request, title)
+
+    async def afetch(self, title) -> FetchBookDetailsFromIsbndb :
+        try:
+            book_details = await self.arequest(title)
+            if book_details is not None:
+                return book_details
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.warning("Error fetching book details from ISBNDB for %r: %s", title, e)
+        return FetchBookDetailsFromIsbndb()
+
+    async def _arequest_result(self, title, semaphore):
+        async with semaphore:
+            try:
+                return await self.arequest(title), None
+            except (requests.RequestException, ValueError, KeyError) as e:
+                return None, e
+
+    async def afetch_many(self, titles) -> dict:
+        """
+        fetch_many() for async callers, with at most ISBN_API_CONCURRENCY lookups in flight.
+        """
+        titles = list(dict.fromkeys(titles))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._arequest_result(title, semaphore) for title in titles))
+        return dict(zip(titles, results))
+
+    def close(self):
+        self.session.close()
+
+
+isbndb_client = IsbndbClient()
+
+
+def request_book_details_from_isbndb(title) -> FetchBookDetailsFromIsbndb | None :
+    return isbndb_client.request(title)
+
+
+def fetch_many_book_details_from_isbndb(titles) -> dict:
+    return isbndb_client.fetch_many(titles)
+
+
 def fetch_book_details_from_isbndb(title) -> FetchBookDetailsFromIsbndb :
-    url = f"https://api2.isbndb.com/books/{title}?page=1&pageSize=1&column=title"
-    headers = {
-        "accept": "application/json",
-        "Authorization": var_settings.ISBN_API_KEY
-    }
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data.get('books'):
-            book_data = data['books'][0]
-            return FetchBookDetailsFromIsbndb(
-                    author=book_data.get('authors', ['Unknown'])[0],
-                    number_of_pages=book_data.get('pages', 0),
-                    title=book_data.get('title', title)
-                )
-    except (requests.RequestException, ValueError, KeyError) as e:
-        print(f"Error fetching book details from ISBNDB: {e}")
-    return FetchBookDetailsFromIsbndb.model_dump()
\ No newline at end of file
+    return isbndb_client.fetch(title)
+
+
+async def arequest_book_details_from_isbndb(title) -> FetchBookDetailsFromIsbndb | None :
+    return await isbndb_client.arequest(title)
+
+
+async def afetch_many_book_details_from_isbndb(titles) -> dict:
+    return await isbndb_client.afetch_many(titles)
+
+
+async def afetch_book_details_from_isbndb(title) -> FetchBookDetailsFromIsbndb :
+    return await isbndb_client.afetch(title)
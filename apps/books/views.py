@@ -1,9 +1,97 @@
-from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from bookmate.load_env_vars import var_settings
+from utils.async_views import AsyncReadView
+from utils.fast_serializers import FastListMixin
+from utils.db_router import ReplicaReadMixin, read_alias, replica_reads
+from .catalogue import CatalogueCacheMixin, acatalogue_state, catalogue_etag, catalogue_page_key, may_be_stale, set_catalogue_headers
+from .importer import IMPORT_FORMATS, BookImporter, guess_format
 from .models import Book
-from .serializers import BookListSerializer
+from .search import search_books
+from .serializers import BookListSerializer, book_list_rows
+import io
 
-class BookListView(generics.ListCreateAPIView):
+class BookListView(CatalogueCacheMixin, ReplicaReadMixin, FastListMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
-    queryset = Book.objects.all().order_by('-created_at')
+    queryset = Book.objects.select_related('created_by', 'last_modified_by').order_by('-created_at', '-id')
     serializer_class = BookListSerializer
+    fast_serializer = book_list_rows
+
+
+class AsyncBookListView(AsyncReadView):
+    """
+    Async version of BookListView's GET, with the same pages, ETags and page cache.
+    """
+    queryset = BookListView.queryset
+
+    async def get(self, request, *args, **kwargs):
+        version, modified_at = await acatalogue_state()
+        etag = catalogue_etag(version, 'json')
+
+        response = get_conditional_response(request, etag=etag, last_modified=modified_at)
+        if response is None:
+            key = catalogue_page_key(version, 'json', request)
+            cached = await cache.aget(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                with replica_reads():
+                    read_from = read_alias()
+                    response = self.render(await self.paginated_data(self.queryset.all(), BookListSerializer, book_list_rows))
+                if not may_be_stale(read_from, modified_at):
+                    await cache.aset(key, (response.content, response['Content-Type']), timeout=var_settings.CATALOGUE_CACHE_TTL)
+        return set_catalogue_headers(response, etag, modified_at)
+
+
+class BookDetailView(CatalogueCacheMixin, generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    queryset = Book.objects.select_related('created_by', 'last_modified_by')
+    serializer_class = BookListSerializer
+
+
+class BookSearchView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    Ranked prefix/full-text search on title and author: `?q=<terms>&limit=<n>` (limit capped at 100).
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = BookListSerializer
+    pagination_class = None
+    max_limit = 100
+
+    def get_queryset(self):
+        try:
+            limit = min(max(int(self.request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            limit = 20
+        return search_books(self.request.query_params.get('q', ''), limit=limit, using=self.read_from)
+
+
+class BookImportView(generics.GenericAPIView):
+    """
+    Bulk imports a CSV or JSONL file uploaded as `file`; `input_format` overrides the format guessed from the file name.
+    Responds with the import report, including the per-row errors.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': "Upload the books as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        input_format = request.data.get('input_format') or guess_format(upload.name)
+        if input_format not in IMPORT_FORMATS:
+            return Response({'error': f"Unsupported format '{input_format}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            chunk_size = int(request.data.get('chunk_size') or 0) or None
+        except ValueError:
+            return Response({'error': "chunk_size must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', errors='replace', newline='')
+        report = BookImporter(chunk_size=chunk_size, created_by=request.user).run(stream, input_format)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
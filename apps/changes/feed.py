@@ -0,0 +1,122 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from books.models import Book
+from books.serializers import BookListSerializer, book_list_rows
+from rentals.models import Rental
+from rentals.serializers import RENTAL_LIST_FIELDS, RentalListSerializer, rental_list_rows
+from .models import Change
+
+COMPACT_BATCH_SIZE = 10000
+# How each entity is read back: the queryset and serializers of its list endpoint.
+ENTITIES = {
+    Change.BOOK: (lambda: Book.objects.select_related('created_by', 'last_modified_by'), BookListSerializer, book_list_rows),
+    Change.RENTAL: (lambda: Rental.objects.select_related('student', 'book').only(*RENTAL_LIST_FIELDS), RentalListSerializer, rental_list_rows),
+}
+
+
+def settled_changes(now=None):
+    """
+    The entries old enough to be read. A transaction that commits after a later one would otherwise
+    add an entry behind a cursor a client has already moved past; CHANGE_FEED_SETTLE_SECONDS is the
+    longest a write transaction is expected to take.
+    """
+    return Change.objects.filter(created_at__lte=(now or timezone.now()) - timedelta(seconds=var_settings.CHANGE_FEED_SETTLE_SECONDS))
+
+
+def current_cursor() -> int:
+    """
+    The cursor to sync from after downloading the full lists.
+    """
+    return settled_changes().aggregate(cursor=Max('pk'))['cursor'] or 0
+
+
+def representations(entity, object_ids) -> dict:
+    """
+    The current list-endpoint representation of each object of `object_ids` that still exists, by id.
+    """
+    queryset, serializer_class, fast_serializer = ENTITIES[entity]
+    queryset = queryset().filter(pk__in=object_ids)
+    if var_settings.FAST_SERIALIZERS:
+        rows = fast_serializer.serialize(queryset)
+    else:
+        rows = serializer_class(queryset, many=True).data
+    return {row['id']: row for row in rows}
+
+
+def read_changes(since=0, limit=None, entity=None) -> dict:
+    """
+    The changes after the `since` cursor, oldest first, each object once with its current state.
+
+    Up to `limit` (API_PAGE_SIZE) log entries are read per call; when several name the same object
+    only the latest is returned. An object saved but gone by now is reported as deleted; its delete
+    entry follows. Costs one query for the log and one per entity, whatever the size of the catalogue.
+    Returns:
+        dict: `cursor` to pass as `since` next time, `has_more`, and `changes`: one
+        {id, entity, object_id, deleted, data} per object.
+    """
+    limit = limit or var_settings.API_PAGE_SIZE
+    queryset = settled_changes().filter(pk__gt=since)
+    if entity is not None:
+        queryset = queryset.filter(entity=entity)
+    entries = list(queryset.order_by('pk').values_list('pk', 'entity', 'object_id', 'deleted')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for pk, entry_entity, object_id, deleted in entries:
+        latest.pop((entry_entity, object_id), None)  # Keeps the objects ordered by their latest change.
+        latest[entry_entity, object_id] = (pk, deleted)
+    data = {
+        name: representations(name, [object_id for (entry_entity, object_id), (pk, deleted) in latest.items() if entry_entity == name and not deleted])
+        for name in ENTITIES
+    }
+    changes = []
+    for (entry_entity, object_id), (pk, deleted) in latest.items():
+        row = None if deleted else data[entry_entity].get(object_id)
+        changes.append({'id': pk, 'entity': entry_entity, 'object_id': object_id, 'deleted': row is None, 'data': row})
+    return {'cursor': entries[-1][0] if entries else since, 'has_more': has_more, 'changes': changes}
+
+
+def compact_changes(older_than=None, batch_size=COMPACT_BATCH_SIZE) -> int:
+    """
+    Deletes the entries older than `older_than` (CHANGE_LOG_COMPACT_AFTER_DAYS by default) that a
+    newer entry of the same object supersedes, `batch_size` ids per transaction. A client behind
+    them still ends up with the same state, as the feed reads objects as they are now.
+    Returns:
+        int: The number of entries deleted.
+    """
+    older_than = timedelta(days=var_settings.CHANGE_LOG_COMPACT_AFTER_DAYS) if older_than is None else older_than
+    bounds = Change.objects.filter(created_at__lt=timezone.now() - older_than).aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    newer = Change.objects.filter(entity=OuterRef('entity'), object_id=OuterRef('object_id'), pk__gt=OuterRef('pk'))
+    deleted = 0
+    for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            batch = Change.objects.filter(pk__gte=low, pk__lte=min(low + batch_size - 1, bounds['high']))
+            deleted += batch.filter(Exists(newer)).delete()[0]
+    return deleted
+
+
+def purge_deletions(older_than=None, batch_size=COMPACT_BATCH_SIZE) -> int:
+    """
+    Deletes the delete entries older than `older_than` (CHANGE_LOG_DELETION_RETENTION_DAYS by default),
+    `batch_size` ids per transaction. compact_changes() keeps the latest entry of every object, so
+    without this the entries of deleted and archived objects would stay forever. A client whose cursor
+    is older than them misses those deletions and has to download the lists again.
+    Returns:
+        int: The number of entries deleted.
+    """
+    older_than = timedelta(days=var_settings.CHANGE_LOG_DELETION_RETENTION_DAYS) if older_than is None else older_than
+    expired = Change.objects.filter(deleted=True, created_at__lt=timezone.now() - older_than)
+    bounds = expired.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    deleted = 0
+    for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            deleted += expired.filter(pk__gte=low, pk__lte=min(low + batch_size - 1, bounds['high'])).delete()[0]
+    return deleted
@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from bookmate.load_env_vars import var_settings
+from changes.feed import COMPACT_BATCH_SIZE, compact_changes, purge_deletions
+import time
+
+
+class Command(BaseCommand):
+    help = "Drop change-log entries superseded by a newer change of the same object, and delete entries past their retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=var_settings.CHANGE_LOG_COMPACT_AFTER_DAYS, help="Only compact entries older than this many days.")
+        parser.add_argument('--deletions-older-than', type=int, default=var_settings.CHANGE_LOG_DELETION_RETENTION_DAYS, help="Drop delete entries older than this many days.")
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE, help="Entry ids compacted per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = compact_changes(timedelta(days=options['older_than']), batch_size=options['batch_size'])
+        purged = purge_deletions(timedelta(days=options['deletions_older_than']), batch_size=options['batch_size'])
+        self.stdout.write(f"Removed {deleted} superseded changes and {purged} expired deletions in {time.perf_counter() - started:.1f}s.")
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('book', 'Book'), ('rental', 'Rental')], help_text='The kind of object that changed.', max_length=16)),
+                ('object_id', models.BigIntegerField(help_text='The id of the object that changed.')),
+                ('deleted', models.BooleanField(default=False, help_text='Whether the object was deleted.')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the change was recorded.')),
+            ],
+            options={
+                'verbose_name': 'Change',
+                'verbose_name_plural': 'Changes',
+                'db_table': 'changes_change',
+                'indexes': [models.Index(fields=['entity', 'object_id', 'id'], name='change_object_idx')],
+            },
+        ),
+    ]
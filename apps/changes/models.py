@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+from django.utils.translation import gettext_lazy as _
+from django.db import models
+from django.utils import timezone
+
+
+class Change(models.Model):
+    """
+    Change-log (outbox) entry: a book or rental was created, updated or deleted.
+
+    Entries are written in the same transaction as the change itself, by the model signals and
+    explicitly by the bulk paths that skip them (imports, enrichment, checkouts and returns,
+    archiving). The id is the cursor clients sync from, see changes.feed. Entries only name the
+    object; the feed reads its current state, so compaction can keep just the latest entry per object.
+
+    Attributes:
+        entity (CharField): Change.BOOK or Change.RENTAL.
+        object_id (BigIntegerField): The id of the book or rental.
+        deleted (BooleanField): Whether the object was deleted (or archived) rather than saved.
+        created_at (DateTimeField): When the change was recorded.
+
+    Meta:
+        db_table: "changes_change"
+    """
+
+    BOOK = 'book'
+    RENTAL = 'rental'
+    ENTITY_CHOICES = [(BOOK, _('Book')), (RENTAL, _('Rental'))]
+
+    entity = models.CharField(max_length=16, choices=ENTITY_CHOICES, help_text=_("The kind of object that changed."))
+    object_id = models.BigIntegerField(help_text=_("The id of the object that changed."))
+    deleted = models.BooleanField(default=False, help_text=_("Whether the object was deleted."))
+    created_at = models.DateTimeField(default=timezone.now, help_text=_("When the change was recorded."))
+
+    class Meta:
+        db_table = "changes_change"
+        verbose_name = _('Change')
+        verbose_name_plural = _('Changes')
+        indexes = [
+            # Compaction: the newer entries of the same object.
+            models.Index(fields=['entity', 'object_id', 'id'], name='change_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.entity} {self.object_id}{' deleted' if self.deleted else ''}"
+
+    @classmethod
+    def record(cls, entity, object_ids, deleted=False):
+        """
+        Records a change of each of `object_ids` with one bulk INSERT; call it inside the transaction making the change.
+        """
+        now = timezone.now()
+        cls.objects.bulk_create([cls(entity=entity, object_id=object_id, deleted=deleted, created_at=now) for object_id in object_ids])
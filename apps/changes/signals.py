@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from books.models import Book
+from rentals.models import Rental
+from .models import Change
+
+ENTITY_BY_MODEL = {Book: Change.BOOK, Rental: Change.RENTAL}
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Rental)
+def object_saved(sender, instance, **kwargs):
+    Change.record(ENTITY_BY_MODEL[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Rental)
+def object_deleted(sender, instance, **kwargs):
+    Change.record(ENTITY_BY_MODEL[sender], [instance.pk], deleted=True)
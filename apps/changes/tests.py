@@ -0,0 +1,152 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from books.importer import BookImporter
+from books.models import Book
+from books.serializers import BookListSerializer
+from rentals.archive import archive_rentals
+from rentals.models import Rental
+from rentals.services import checkout, checkout_many, return_many, return_rental
+from .feed import compact_changes, current_cursor, purge_deletions, read_changes
+from .models import Change
+import io
+
+User = get_user_model()
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(var_settings, 'CHANGE_FEED_SETTLE_SECONDS', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.student = User.objects.create_user('student')
+        self.books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100 + i) for i in range(3)]
+
+    def sync(self, since=0, **kwargs):
+        """
+        Follows the feed from `since` to its end, as a client would; returns the last state of each object and the cursor.
+        """
+        state = {}
+        while True:
+            page = read_changes(since=since, **kwargs)
+            for change in page['changes']:
+                state[change['entity'], change['object_id']] = change['data']
+            since = page['cursor']
+            if not page['has_more']:
+                return state, since
+
+    def test_saves_and_deletes_are_reported_once_per_object_with_their_current_state(self):
+        cursor = current_cursor()
+        self.books[0].title = 'Dune'
+        self.books[0].save()
+        deleted_pk = self.books[1].pk
+        self.books[1].delete()
+        self.books[0].save()
+
+        page = read_changes(since=cursor)
+
+        self.assertEqual([(change['object_id'], change['deleted']) for change in page['changes']], [(deleted_pk, True), (self.books[0].pk, False)])
+        self.assertEqual(page['changes'][1]['data'], BookListSerializer(Book.objects.get(pk=self.books[0].pk)).data)
+        self.assertIsNone(page['changes'][0]['data'])
+        self.assertEqual(read_changes(since=page['cursor'])['changes'], [])
+
+    def test_bulk_paths_are_recorded(self):
+        cursor = current_cursor()
+        BookImporter().run(io.StringIO("title,author,number_of_pages\nEmma,Jane Austen,474\n"), 'csv')
+        rental = checkout(self.student, self.books[0])
+        return_rental(rental)
+        results = checkout_many([(self.student.pk, self.books[1].pk), (self.student.pk, self.books[2].pk)])
+        return_many([results[0]['rental']])
+        Rental.objects.filter(pk=rental.pk).update(return_date=timezone.now() - timedelta(days=400), rental_date=timezone.now() - timedelta(days=410))
+        archive_rentals(timedelta(days=90))
+
+        state, cursor = self.sync(cursor)
+
+        emma = Book.objects.get(title='Emma')
+        self.assertEqual(set(state), {
+            ('book', emma.pk), ('book', self.books[0].pk), ('book', self.books[1].pk), ('book', self.books[2].pk),
+            ('rental', rental.pk), ('rental', results[0]['rental']), ('rental', results[1]['rental']),
+        })
+        self.assertIsNone(state['rental', rental.pk])
+        self.assertEqual(state['book', emma.pk]['title'], 'Emma')
+        self.assertEqual(state['rental', results[1]['rental']]['returned'], False)
+        self.assertEqual(state['rental', results[0]['rental']]['returned'], True)
+
+    def test_pages_filters_and_settling(self):
+        cursor = current_cursor()
+        for book in self.books:
+            book.save()
+        checkout(self.student, self.books[0])
+
+        first = read_changes(since=cursor, limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changes']), 2)
+        state, _ = self.sync(cursor, limit=2)
+        self.assertEqual(len(state), 4)
+        self.assertEqual({change['entity'] for change in read_changes(since=cursor, entity='rental')['changes']}, {'rental'})
+
+        with mock.patch.object(var_settings, 'CHANGE_FEED_SETTLE_SECONDS', 60):
+            self.assertEqual(read_changes(since=cursor), {'cursor': cursor, 'has_more': False, 'changes': []})
+            self.assertEqual(current_cursor(), 0)
+
+    def test_reading_costs_the_same_queries_whatever_changed(self):
+        def queries(since):
+            with CaptureQueriesContext(connection) as captured:
+                read_changes(since=since, limit=500)
+            return len(captured)
+
+        cursor = current_cursor()
+        checkout(self.student, self.books[0])
+        few = queries(cursor)
+        checkout_many([(self.student.pk, book.pk) for book in self.books[1:]])
+        self.assertEqual(queries(0), few)
+        self.assertEqual(few, 3)
+
+    def test_compaction_keeps_the_latest_change_of_each_object(self):
+        for _ in range(3):
+            for book in self.books:
+                book.save()
+        self.books[2].delete()
+        before, cursor = self.sync()
+        entries = Change.objects.count()
+
+        self.assertEqual(compact_changes(timedelta(days=0), batch_size=4), entries - 3)
+        self.assertEqual(Change.objects.count(), 3)
+        self.assertEqual(self.sync(), (before, cursor))
+
+        output = io.StringIO()
+        call_command('compact_changes', stdout=output)
+        self.assertIn("Removed 0 superseded changes and 0 expired deletions", output.getvalue())
+
+    def test_deletions_past_their_retention_are_purged(self):
+        cursor = current_cursor()
+        deleted_pk = self.books[2].pk
+        self.books[2].delete()
+        self.books[0].save()
+
+        self.assertEqual(purge_deletions(), 0)
+        self.assertEqual(purge_deletions(timedelta(days=0), batch_size=1), 1)
+        self.assertEqual(set(self.sync(cursor)[0]), {('book', self.books[0].pk)})
+        self.assertFalse(Change.objects.filter(object_id=deleted_pk, deleted=True).exists())
+
+    def test_endpoints(self):
+        url = reverse('change-feed')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.student)
+
+        cursor = self.client.get(reverse('change-cursor')).json()['cursor']
+        self.books[0].save()
+        response = self.client.get(url, {'since': cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change['object_id'] for change in response.json()['changes']], [self.books[0].pk])
+        self.assertEqual(response.json()['changes'][0]['data']['title'], 'Book 0')
+        self.assertEqual(self.client.get(url, {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'entity': 'student'}).status_code, 400)
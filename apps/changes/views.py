@@ -0,0 +1,41 @@
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from bookmate.load_env_vars import var_settings
+from .feed import current_cursor, read_changes
+from .models import Change
+
+
+class ChangeFeedView(generics.GenericAPIView):
+    """
+    Book and rental changes after a cursor, for clients keeping a local copy of the lists in sync.
+
+    Query params:
+        since: The `cursor` of the previous response, or of /api/changes/cursor/ after a full download.
+        entity: `book` or `rental`; both by default.
+        page_size: Log entries read, API_PAGE_SIZE by default and at most API_MAX_PAGE_SIZE.
+    Keep requesting with the returned cursor while `has_more` is true.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        entity = params.get('entity') or None
+        if entity is not None and entity not in dict(Change.ENTITY_CHOICES):
+            return Response({'error': f"Unknown entity '{entity}'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = max(int(params.get('since') or 0), 0)
+            page_size = min(max(int(params.get('page_size') or var_settings.API_PAGE_SIZE), 1), var_settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': "since and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(read_changes(since=since, limit=page_size, entity=entity))
+
+
+class ChangeCursorView(generics.GenericAPIView):
+    """
+    The current cursor: read it before downloading the full lists, then sync from it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'cursor': current_cursor()})
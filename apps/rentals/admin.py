@@ -6,9 +6,13 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django import forms
 from books.models import Book
+from books.search import filter_books
+from .dashboard import get_student_dashboard
+from utils.db_router import replica_reads
+from utils.pagination import EstimatedCountPaginator
 from .models import Rental
-from .serializers import StudentRentalSerializer
-from django.db.models import Prefetch, Q
+from .services import return_rentals
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -20,8 +24,9 @@ class RentalAdminForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # The widgets only render the selected rows; the querysets validate the submitted ids.
         if self.instance.pk:  # Editing an existing rental
-            self.fields['book'].queryset = Book.objects.filter(is_active=True).filter(Q(is_rented=False) | Q(id=self.instance.book.pk))
+            self.fields['book'].queryset = Book.objects.filter(is_active=True).filter(Q(is_rented=False) | Q(id=self.instance.book_id))
         else:  # Creating a new rental
             self.fields['book'].queryset = Book.objects.filter(is_rented=False, is_active=True)
         self.fields['created_by'].queryset = User.objects.filter(is_staff=True, is_active=True)
@@ -32,37 +37,60 @@ class RentalAdminForm(forms.ModelForm):
 class RentalAdmin(admin.ModelAdmin):
     form = RentalAdminForm
     list_display = ['student', 'get_book_link', 'rental_date', 'return_date', 'returned', 'get_rental_duration', 'get_rental_fee']
-    search_fields = ['student__username', 'student__email', 'book__title']
+    search_fields = ['student__username', 'student__email']
     list_filter = ['rental_date', 'returned']
     readonly_fields = ['get_rental_duration', 'get_rental_fee']
+    # Books are searched through the full-text index; users are looked up by id.
+    autocomplete_fields = ['book']
+    raw_id_fields = ['student', 'created_by', 'last_modified_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_returned']
     change_list_template = 'admin/rental_changelist.html'
 
     def get_book_link(self, obj):
         url = reverse("admin:books_book_change", args=[obj.book.id])
-        return format_html('<a href="{}">{}: {} pages</a>', 
-                            url, 
-                            obj.book.title, 
+        return format_html('<a href="{}">{}: {} pages</a>',
+                            url,
+                            obj.book.title,
                             obj.book.number_of_pages)
     get_book_link.short_description = 'Book (Title: Pages)'
     get_book_link.admin_order_field = 'book__title'  # Allows column ordering
 
     def get_rental_duration(self, obj):
+        # Computed in SQL by get_queryset(); an unsaved rental falls back to the model method.
+        duration = getattr(obj, 'rental_duration', None)
         try:
-            return f"{obj._rental_duration()} days"
-        except ValueError as e:
+            return f"{obj._rental_duration() if duration is None else duration} days"
+        except (TypeError, ValueError) as e:
             return str(e)
     get_rental_duration.short_description = 'Rental Duration'
+    get_rental_duration.admin_order_field = 'rental_duration'
 
     def get_rental_fee(self, obj):
+        fee = getattr(obj, 'rental_fee', None)
         try:
-            return f"${obj._rental_fee():.2f}"
-        except (ValueError, Rental.book.RelatedObjectDoesNotExist) as e:
+            return f"${obj._rental_fee() if fee is None else fee:.2f}"
+        except (TypeError, ValueError, Rental.book.RelatedObjectDoesNotExist) as e:
             return str(e)
     get_rental_fee.short_description = 'Rental Fee'
+    get_rental_fee.admin_order_field = 'rental_fee'
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.select_related('student', 'book')
+        return queryset.select_related('student', 'book').with_duration().with_fee()
+
+    def get_search_results(self, request, queryset, search_term):
+        # Students are matched on search_fields; books through the full-text index instead of a LIKE over the join.
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results = results | queryset.filter(book__in=filter_books(Book.objects.all(), search_term))
+        return results, may_have_duplicates
+
+    @admin.action(description="Mark selected rentals as returned")
+    def mark_returned(self, request, queryset):
+        returned = return_rentals(queryset, modified_by=request.user)
+        self.message_user(request, f"{returned} rental(s) marked as returned.")
 
     def get_urls(self):
         urls = super().get_urls()
@@ -78,13 +106,6 @@ class RentalAdmin(admin.ModelAdmin):
             self.admin_site.each_context(request),
             title="Student Rental Dashboard"
         )
-
-        students = User.objects.prefetch_related(
-            Prefetch('rental_set', 
-                     queryset=Rental.objects.filter(returned=False).select_related('book'),
-                     to_attr='rentals'
-                    )
-        )
-        serializer = StudentRentalSerializer(students, many=True)
-        context['student_rentals'] = serializer.data
+        with replica_reads():
+            context.update(get_student_dashboard(request.GET.get('page', 1)))
         return render(request, 'admin/student_dashboard.html', context)
\ No newline at end of file
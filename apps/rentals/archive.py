@@ -0,0 +1,99 @@
+from datetime import timedelta
+from django.db import connections, router, transaction
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from changes.models import Change
+from .models import ArchivedRental, Rental, RentalFee
+import heapq, operator
+
+# Columns copied from rentals_rental into rentals_rental_archive, which keeps the rental's id.
+ARCHIVED_COLUMNS = [
+    'id', 'student_id', 'book_id', 'rental_date', 'return_date', 'returned',
+    'created_by_id', 'last_modified_by_id', 'is_active', 'created_at', 'last_modified_at',
+]
+HISTORY_COLUMNS = [
+    'id', 'student_id', 'book_id', 'book__title', 'book__author',
+    'rental_date', 'return_date', 'returned', 'rental_duration', 'rental_fee',
+]
+
+
+def archivable(older_than=None, now=None):
+    """
+    Returned rentals whose return date is more than `older_than` (a timedelta, RENTAL_ARCHIVE_AFTER_DAYS by default) ago.
+    """
+    older_than = timedelta(days=var_settings.RENTAL_ARCHIVE_AFTER_DAYS) if older_than is None else older_than
+    return Rental.objects.filter(returned=True, return_date__lt=(now or timezone.now()) - older_than)
+
+
+def _move(ids, archived_at, using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ARCHIVED_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    # The ledger entries of returned rentals no longer count towards any balance.
+    RentalFee.objects.using(using).filter(rental_id__in=ids).delete()
+    with connection.cursor() as cursor:
+        # One INSERT ... SELECT: the rows do not travel through Python, and created_at is kept as it was.
+        cursor.execute(
+            f"INSERT INTO {quote(ArchivedRental._meta.db_table)} ({columns}, {quote('archived_at')}) "
+            f"SELECT {columns}, %s FROM {quote(Rental._meta.db_table)} WHERE {quote('id')} IN ({placeholders})",
+            [connection.ops.adapt_datetimefield_value(archived_at), *ids],
+        )
+        # A plain DELETE: Rental.delete() would run the delete signals, which count the rentals out of
+        # the counters and the ledger, but archived rentals still count as history (see rentals.counters).
+        # Nothing else references the rentals once their ledger entries are gone.
+        cursor.execute(f"DELETE FROM {quote(Rental._meta.db_table)} WHERE {quote('id')} IN ({placeholders})", ids)
+    # They leave the rental list, so clients syncing it drop them.
+    Change.objects.using(using).bulk_create([Change(entity=Change.RENTAL, object_id=pk, deleted=True, created_at=archived_at) for pk in ids])
+
+
+def archive_rentals(older_than=None, batch_size=None, limit=None, progress=None) -> int:
+    """
+    Moves the archivable() rentals to ArchivedRental, `batch_size` (RENTAL_ARCHIVE_BATCH_SIZE) per
+    transaction and in id order. Each batch commits on its own, so an interrupted run loses nothing
+    and running again picks up where it stopped. `progress(archived_so_far)` is called after each batch.
+    Returns:
+        int: The number of rentals archived, at most `limit`.
+    """
+    batch_size = batch_size or var_settings.RENTAL_ARCHIVE_BATCH_SIZE
+    candidates = archivable(older_than).order_by('pk')
+    using = router.db_for_write(Rental)
+    total, last_pk = 0, 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        with transaction.atomic(using=using):
+            ids = list(candidates.using(using).filter(pk__gt=last_pk).select_for_update().values_list('pk', flat=True)[:size])
+            if not ids:
+                break
+            _move(ids, timezone.now(), using)
+        last_pk = ids[-1]
+        total += len(ids)
+        if progress:
+            progress(total)
+    return total
+
+
+def rental_history(student=None, book=None, before=None, limit=50, now=None) -> list[dict]:
+    """
+    Rentals from both the working table and the archive, newest (highest id) first, with their
+    duration and fee computed in SQL. One indexed query per table; the results are merged by id.
+
+    Args:
+        student, book: Only the rentals of this student or book id.
+        before: Only rentals with a lower id, i.e. the `id` of the last row of the previous page.
+        limit: Rows to return.
+    Returns:
+        list[dict]: HISTORY_COLUMNS and `archived`, whether the row came from the archive.
+    """
+    now = now or timezone.now()
+    pages = []
+    for model, archived in ((Rental, False), (ArchivedRental, True)):
+        queryset = model.objects.with_duration(now=now).with_fee(now=now)
+        if student is not None:
+            queryset = queryset.filter(student_id=student)
+        if book is not None:
+            queryset = queryset.filter(book_id=book)
+        if before is not None:
+            queryset = queryset.filter(pk__lt=before)
+        pages.append([dict(row, archived=archived) for row in queryset.order_by('-id').values(*HISTORY_COLUMNS)[:limit]])
+    return list(heapq.merge(*pages, key=operator.itemgetter('id'), reverse=True))[:limit]
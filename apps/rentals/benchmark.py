@@ -0,0 +1,404 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from books.models import Book
+from books.serializers import BookListSerializer, book_list_rows
+from utils.fast_serializers import render_json
+from .models import Rental, StudentFeeBalance
+from .serializers import RENTAL_LIST_FIELDS, RentalListSerializer, rental_list_rows
+import asyncio, math, platform, random, re, requests, statistics, threading, time
+
+User = get_user_model()
+BENCHMARK_USERNAME = 'benchmark_admin'
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)]
+
+
+def sample_ids(model, size, rng) -> list[int]:
+    bounds = model.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    candidates = {rng.randint(bounds['low'], bounds['high']) for _ in range(size * 2)}
+    ids = sorted(model.objects.filter(id__in=candidates).values_list('id', flat=True)[:size])
+    return ids or [bounds['low']]
+
+
+def benchmark_targets(rng, sample_size=1000, async_views=False) -> dict:
+    """
+    The endpoints under test, each as a function returning the next path to request.
+    Detail requests spread over a random sample of ids; dashboard requests over its pages.
+    With `async_views`, book_list, rental_list and rental_detail hit the async versions of the views.
+    """
+    book_ids = sample_ids(Book, sample_size, rng)
+    rental_ids = sample_ids(Rental, sample_size, rng)
+    dashboard_pages = max(math.ceil(StudentFeeBalance.objects.filter(open_rentals__gt=0).count() / 25), 1)
+    targets = {
+        'book_list': lambda: reverse('book-list-async' if async_views else 'book-list'),
+        'book_search': lambda: f"{reverse('book-search')}?q=book",
+        'rental_list': lambda: reverse('rental-list-async' if async_views else 'rental-list-create'),
+        'student_dashboard': lambda: f"{reverse('admin:rental_student_dashboard')}?page={rng.randint(1, dashboard_pages)}",
+    }
+    if book_ids:
+        targets['book_detail'] = lambda: reverse('book-detail', args=[rng.choice(book_ids)])
+    if rental_ids:
+        targets['rental_detail'] = lambda: reverse('rental-detail-async' if async_views else 'rental-detail', args=[rng.choice(rental_ids)])
+    return targets
+
+
+def session_cookie(user) -> dict:
+    """
+    Logs `user` in once; every benchmark thread then shares the session instead of writing its own.
+    """
+    client = Client(SERVER_NAME='localhost')
+    client.force_login(user)
+    return {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+
+
+class InProcessTransport:
+    """
+    Sends requests through Django's test client, counting the SQL queries of each one.
+    """
+
+    def __init__(self, user):
+        self.cookies = session_cookie(user)
+        self.local = threading.local()
+
+    def client(self) -> Client:
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client(SERVER_NAME='localhost')
+            self.local.client.cookies.load(self.cookies)
+        return self.local.client
+
+    def get(self, path):
+        client = self.client()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries)
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """
+    Sends real HTTP requests over pooled keep-alive connections, authenticated with a session cookie.
+    Query counts are read from the Server-Timing header of RequestMetricsMiddleware.
+    """
+
+    def __init__(self, user, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = session_cookie(user)
+        self.local = threading.local()
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.cookies.update(self.cookies)
+        return self.local.session
+
+    def get(self, path):
+        started = time.perf_counter()
+        response = self.session().get(self.base_url + path, timeout=60)
+        elapsed = time.perf_counter() - started
+        queries = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        return response.status_code, elapsed, int(queries.group(1)) if queries else None
+
+    def close(self):
+        if hasattr(self.local, 'session'):
+            self.local.session.close()
+        connection.close()
+
+
+class AsgiTransport:
+    """
+    Calls the project's ASGI application directly, the way uvicorn does for each request, from
+    tasks sharing one event loop. Query counts are read from the Server-Timing header.
+    """
+
+    def __init__(self, user):
+        self.application = get_asgi_application()
+        self.cookie = '; '.join(f"{name}={value}" for name, value in session_cookie(user).items()).encode()
+
+    def scope(self, path) -> dict:
+        path, _, query = path.partition('?')
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie)],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+
+    async def get(self, path):
+        request_sent, response_done = False, asyncio.Event()
+        response = {}
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client stays connected until the whole response is sent.
+            await response_done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode().lower(): value.decode() for name, value in message['headers']}
+            elif not message.get('more_body'):
+                response_done.set()
+
+        started = time.perf_counter()
+        await self.application(self.scope(path), receive, send)
+        elapsed = time.perf_counter() - started
+        queries = SERVER_TIMING_QUERIES.search(response['headers'].get('server-timing', ''))
+        return response['status'], elapsed, int(queries.group(1)) if queries else None
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Without TCP_NODELAY, keep-alive responses wait on delayed ACKs (~40 ms per request).
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """
+    The project's WSGI application served by the runserver machinery on a free local port, in a background thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = ThreadedWSGIServer((host, port), QuietRequestHandler, allow_reuse_address=True)
+        self.server.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def summarize(samples, wall_time) -> dict:
+    latencies = sorted(elapsed * 1000 for status, elapsed, queries in samples)
+    queries = [queries for status, elapsed, queries in samples if queries is not None]
+    ok = sum(1 for status, elapsed, queries in samples if status < 400)
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - ok,
+        'status_codes': {str(code): sum(1 for sample in samples if sample[0] == code) for code in sorted({sample[0] for sample in samples})},
+        'mean_ms': round(statistics.mean(latencies), 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        'max_ms': round(latencies[-1], 3) if latencies else None,
+        'throughput_rps': round(ok / wall_time, 2) if wall_time else None,
+        'queries_mean': round(statistics.mean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def run_target(transport, next_path, requests_count, concurrency, warmup=0) -> dict:
+    """
+    Issues `requests_count` requests (after `warmup` unrecorded ones) from `concurrency` threads.
+    """
+    for _ in range(warmup):
+        transport.get(next_path())
+    lock = threading.Lock()
+    paths = iter([next_path() for _ in range(requests_count)])
+    samples = []
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    path = next(paths, None)
+                if path is None:
+                    return
+                sample = transport.get(path)
+                with lock:
+                    samples.append(sample)
+        finally:
+            transport.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def arun_target(transport, next_path, requests_count, concurrency, warmup=0) -> dict:
+    """
+    run_target() for AsgiTransport: `concurrency` tasks on one event loop instead of threads.
+    """
+    for _ in range(warmup):
+        await transport.get(next_path())
+    paths = iter([next_path() for _ in range(requests_count)])
+    samples = []
+
+    async def worker():
+        for path in paths:
+            samples.append(await transport.get(path))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_benchmark(mode='inprocess', requests_count=200, concurrency=1, warmup=10, targets=None, base_url=None, random_seed=0, async_views=False) -> dict:
+    """
+    Benchmarks the API and dashboard endpoints and returns a JSON-serializable report:
+    latency percentiles, throughput and (in process) SQL queries per request, by endpoint.
+
+    Args:
+        mode: `inprocess` (Django test client, WSGI), `asgi` (the ASGI application, in process)
+            or `http` (a local WSGI server, or `base_url`).
+        targets: Names of the endpoints to run; all of them by default.
+        async_views: Request the async versions of the list and detail views.
+    """
+    rng = random.Random(random_seed)
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    available = benchmark_targets(rng, async_views=async_views)
+    selected = {name: available[name] for name in (targets or available) if name in available}
+
+    def run_all(transport):
+        return {name: run_target(transport, next_path, requests_count, concurrency, warmup) for name, next_path in selected.items()}
+
+    if mode == 'http' and base_url:
+        results = run_all(HttpTransport(user, base_url))
+    elif mode == 'http':
+        with LocalServer() as server:
+            base_url = server.base_url
+            results = run_all(HttpTransport(user, base_url))
+    elif mode == 'asgi':
+        transport = AsgiTransport(user)
+
+        async def run_all_async():
+            return {name: await arun_target(transport, next_path, requests_count, concurrency, warmup) for name, next_path in selected.items()}
+
+        results = asyncio.run(run_all_async())
+    else:
+        results = run_all(InProcessTransport(user))
+
+    return {
+        'meta': {
+            'mode': mode,
+            'base_url': base_url,
+            'requests': requests_count,
+            'warmup': warmup,
+            'concurrency': concurrency,
+            'async_views': async_views,
+            'random_seed': random_seed,
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'python': platform.python_version(),
+            'dataset': {'books': Book.objects.count(), 'rentals': Rental.objects.count(), 'users': User.objects.count()},
+            'finished_at': timezone.now().isoformat(),
+        },
+        'results': results,
+    }
+
+
+def serializer_targets() -> dict:
+    """
+    The list querysets with their DRF serializer and fast (values()-based) counterpart, as the list views build them.
+    """
+    return {
+        'book_list': (
+            Book.objects.select_related('created_by', 'last_modified_by').order_by('-created_at', '-id'),
+            BookListSerializer, book_list_rows,
+        ),
+        'rental_list': (
+            Rental.objects.select_related('student', 'book').order_by('-created_at', '-id').only(*RENTAL_LIST_FIELDS),
+            RentalListSerializer, rental_list_rows,
+        ),
+    }
+
+
+def run_serializer_benchmark(rows=10000, repeat=5) -> dict:
+    """
+    Times reading, serializing and rendering `rows` list rows through ModelSerializer + JSONRenderer
+    against the values()-based serializers + render_json(), best of `repeat` runs each, and checks
+    that both produce the same bytes.
+    """
+    renderer = JSONRenderer()
+    results = {}
+    for name, (queryset, serializer_class, fast_serializer) in serializer_targets().items():
+        queryset = queryset[:rows]
+        paths = {
+            'drf': lambda: renderer.render(serializer_class(queryset.all(), many=True).data),
+            'fast': lambda: render_json(fast_serializer.serialize(queryset.all())),
+        }
+        timings, outputs = {}, {}
+        for path, render in paths.items():
+            outputs[path] = render()
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                render()
+                samples.append(time.perf_counter() - started)
+            timings[path] = min(samples) * 1000
+        results[name] = {
+            'rows': queryset.count(),
+            'bytes': len(outputs['drf']),
+            'identical': outputs['drf'] == outputs['fast'],
+            'drf_ms': round(timings['drf'], 3),
+            'fast_ms': round(timings['fast'], 3),
+            'speedup': round(timings['drf'] / timings['fast'], 2) if timings['fast'] else None,
+        }
+    return results
+
+
+def compare_reports(current, baseline) -> dict:
+    """
+    Relative change (in percent) of latency and throughput per endpoint against a previous report.
+    """
+    comparison = {}
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        comparison[name] = {
+            key: round((result[key] - previous[key]) / previous[key] * 100, 1)
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_mean')
+            if result.get(key) is not None and previous.get(key)
+        }
+    return comparison
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from books.models import Book, Counter
+from .models import ArchivedRental, Rental, StudentRentalCount, User
+
+RECOUNT_BATCH_SIZE = 10000
+
+
+def available_books() -> int:
+    """
+    Active books that are not rented: one primary-key read, counted only if the counter is missing.
+    """
+    value = Counter.read(Counter.AVAILABLE_BOOKS)
+    if value is None:
+        return Book.objects.filter(is_active=True, is_rented=False).count()
+    return value
+
+
+def student_rentals(student_id) -> tuple[int, int]:
+    """
+    The (total, open) rentals of a student, read from StudentRentalCount.
+    """
+    return StudentRentalCount.objects.filter(student_id=student_id).values_list('total_rentals', 'open_rentals').first() or (0, 0)
+
+
+def _pk_batches(model, batch_size):
+    bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+        yield low, low + batch_size
+
+
+def recount_books(fix=True, batch_size=RECOUNT_BATCH_SIZE) -> dict:
+    """
+    Compares every Book.rental_count with its rentals, archived ones included, `batch_size` books per transaction, and corrects the drifted ones.
+    """
+    stats = {'checked': 0, 'drifted': 0, 'drift': 0}
+    for low, high in _pk_batches(Book, batch_size):
+        with transaction.atomic():
+            # Locked, so a checkout cannot move a count between reading and correcting it.
+            stored = list(Book.objects.select_for_update().filter(pk__gte=low, pk__lt=high).values_list('pk', 'rental_count'))
+            actual = defaultdict(int)
+            for model in (Rental, ArchivedRental):
+                for book_id, count in model.objects.filter(book_id__gte=low, book_id__lt=high).order_by().values('book').annotate(count=Count('pk')).values_list('book', 'count'):
+                    actual[book_id] += count
+            drifted = [Book(pk=pk, rental_count=actual.get(pk, 0)) for pk, count in stored if count != actual.get(pk, 0)]
+            stats['checked'] += len(stored)
+            stats['drifted'] += len(drifted)
+            stats['drift'] += sum(abs(count - actual.get(pk, 0)) for pk, count in stored)
+            if fix and drifted:
+                Book.objects.bulk_update(drifted, ['rental_count'])
+    return stats
+
+
+def recount_students(fix=True, batch_size=RECOUNT_BATCH_SIZE) -> dict:
+    """
+    Compares the StudentRentalCount rows with the rentals, `batch_size` users per transaction,
+    and corrects or creates the drifted ones.
+    """
+    stats = {'checked': 0, 'drifted': 0, 'drift': 0}
+    for low, high in _pk_batches(User, batch_size):
+        with transaction.atomic():
+            stored = {
+                student_id: (total, open_rentals)
+                for student_id, total, open_rentals in StudentRentalCount.objects.select_for_update()
+                .filter(student_id__gte=low, student_id__lt=high).values_list('student_id', 'total_rentals', 'open_rentals')
+            }
+            actual = {
+                student_id: (total, open_rentals)
+                for student_id, total, open_rentals in Rental.objects.filter(student_id__gte=low, student_id__lt=high).order_by()
+                .values('student').annotate(total=Count('pk'), open=Count('pk', filter=Q(returned=False))).values_list('student', 'total', 'open')
+            }
+            # Archived rentals are returned ones: they only add to the totals.
+            for student_id, archived in ArchivedRental.objects.filter(student_id__gte=low, student_id__lt=high).order_by().values('student').annotate(count=Count('pk')).values_list('student', 'count'):
+                total, open_rentals = actual.get(student_id, (0, 0))
+                actual[student_id] = (total + archived, open_rentals)
+            drifted = {
+                student_id: actual.get(student_id, (0, 0))
+                for student_id in stored.keys() | actual.keys()
+                if stored.get(student_id, (0, 0)) != actual.get(student_id, (0, 0))
+            }
+            stats['checked'] += len(stored.keys() | actual.keys())
+            stats['drifted'] += len(drifted)
+            stats['drift'] += sum(
+                abs(a - b) for student_id in drifted for a, b in zip(stored.get(student_id, (0, 0)), drifted[student_id])
+            )
+            if fix and drifted:
+                StudentRentalCount.objects.bulk_create(
+                    [StudentRentalCount(student_id=student_id, total_rentals=total, open_rentals=open_rentals) for student_id, (total, open_rentals) in drifted.items()],
+                    update_conflicts=True,
+                    unique_fields=['student'],
+                    update_fields=['total_rentals', 'open_rentals', 'last_modified_at'],
+                )
+    return stats
+
+
+def recount_available_books(fix=True) -> dict:
+    with transaction.atomic():
+        stored = Counter.objects.select_for_update().filter(name=Counter.AVAILABLE_BOOKS).values_list('value', flat=True).first()
+        actual = Book.objects.filter(is_active=True, is_rented=False).count()
+        if fix and stored != actual:
+            Counter.objects.update_or_create(name=Counter.AVAILABLE_BOOKS, defaults={'value': actual})
+    return {'stored': stored, 'actual': actual, 'drift': abs(actual - (stored or 0))}
+
+
+def recount(fix=True, batch_size=RECOUNT_BATCH_SIZE) -> dict:
+    """
+    Rebuilds every rental counter from the tables they summarize and reports the drift found,
+    e.g. after bulk loads or a restore. With fix=False only the report is produced.
+    Returns:
+        dict: Per counter, the rows checked, how many had drifted and by how much in total.
+    """
+    return {
+        'books': recount_books(fix=fix, batch_size=batch_size),
+        'students': recount_students(fix=fix, batch_size=batch_size),
+        'available_books': recount_available_books(fix=fix),
+    }
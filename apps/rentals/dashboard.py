@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from .models import Rental, StudentFeeBalance
+
+DASHBOARD_VERSION_KEY = 'rentals:student_dashboard:version'
+
+
+def dashboard_version() -> int:
+    version = cache.get(DASHBOARD_VERSION_KEY)
+    if version is None:
+        cache.add(DASHBOARD_VERSION_KEY, 1, timeout=None)
+        version = cache.get(DASHBOARD_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_student_dashboard():
+    """
+    Drops every cached dashboard page by moving to a new version; called whenever a rental changes.
+    """
+    try:
+        cache.incr(DASHBOARD_VERSION_KEY)
+    except ValueError:
+        cache.add(DASHBOARD_VERSION_KEY, 1, timeout=None)
+
+
+def build_student_dashboard(page_number, page_size=None) -> dict:
+    """
+    Builds one page of the dashboard: students with pending rentals, ordered by username.
+    Totals and fees are read from the fee ledger (see rentals.ledger): one balance row per
+    student on the page, and only the rentals of those students, with their ledger entry.
+    """
+    now = timezone.now()
+    totals = (
+        StudentFeeBalance.objects.filter(open_rentals__gt=0)
+        .order_by('student__username', 'student')
+        .values('student', 'student__username', 'student__email', 'outstanding_fee')
+    )
+    page = Paginator(totals, page_size or var_settings.DASHBOARD_PAGE_SIZE).get_page(page_number)
+
+    students = {
+        row['student']: {
+            'id': row['student'],
+            'username': row['student__username'],
+            'email': row['student__email'],
+            'total_fee': row['outstanding_fee'],
+            'rentals': [],
+        }
+        for row in page.object_list
+    }
+    rentals = (
+        Rental.objects.open()
+        .filter(student__in=students.keys())
+        .select_related('book', 'fee')
+        .only(
+            'id', 'student_id', 'rental_date', 'return_date', 'returned',
+            'book__id', 'book__title', 'book__author', 'book__number_of_pages', 'fee__accrued_fee',
+        )
+        .with_duration(now=now)
+        .order_by('rental_date', 'id')
+    )
+    for rental in rentals:
+        students[rental.student_id]['rentals'].append({
+            'id': rental.id,
+            'book': {'id': rental.book.id, 'title': rental.book.title, 'author': rental.book.author, 'number_of_pages': rental.book.number_of_pages},
+            'rental_date': rental.rental_date,
+            'return_date': rental.return_date,
+            'returned': rental.returned,
+            'rental_duration': rental.rental_duration,
+            'pending_fee': rental.fee.accrued_fee if hasattr(rental, 'fee') else 0.0,
+        })
+
+    return {
+        'student_rentals': list(students.values()),
+        'page_number': page.number,
+        'num_pages': page.paginator.num_pages,
+        'student_count': page.paginator.count,
+        'start_index': page.start_index(),
+        'has_previous': page.has_previous(),
+        'has_next': page.has_next(),
+        'generated_at': now,
+    }
+
+
+def get_student_dashboard(page_number, page_size=None) -> dict:
+    page_size = page_size or var_settings.DASHBOARD_PAGE_SIZE
+    key = f"rentals:student_dashboard:{dashboard_version()}:{page_size}:{page_number}"
+    dashboard = cache.get(key)
+    if dashboard is None:
+        dashboard = build_student_dashboard(page_number, page_size)
+        cache.set(key, dashboard, timeout=var_settings.DASHBOARD_CACHE_TTL)
+    return dashboard
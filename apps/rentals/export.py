@@ -0,0 +1,127 @@
+from datetime import datetime, time
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from bookmate.load_env_vars import var_settings
+from .models import ArchivedRental, Rental
+import csv, json
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('student_id', 'student_id'),
+    ('student_username', 'student__username'),
+    ('student_email', 'student__email'),
+    ('book_id', 'book_id'),
+    ('book_title', 'book__title'),
+    ('book_author', 'book__author'),
+    ('book_pages', 'book__number_of_pages'),
+    ('rental_date', 'rental_date'),
+    ('return_date', 'return_date'),
+    ('returned', 'returned'),
+    ('rental_duration', 'rental_duration'),
+    ('rental_fee', 'rental_fee'),
+    ('outstanding_fee', 'outstanding_fee'),
+]
+
+
+class Echo:
+    """
+    File-like object handing back what csv.writer writes, so every row can be yielded as it is formatted.
+    """
+
+    def write(self, value):
+        return value
+
+
+def parse_boundary(value, field):
+    """
+    Parses a date or datetime filter value; a bare date means midnight in the current timezone.
+    Raises:
+        ValueError: If the value is neither.
+    """
+    if value in (None, '') or isinstance(value, datetime):
+        return value or None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{field} must be a date or datetime in ISO 8601 format.")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_returned(value):
+    if value is None or isinstance(value, bool):
+        return value
+    lowered = str(value).lower()
+    if lowered == '':
+        return None
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError("returned must be true or false.")
+
+
+def export_queryset(date_from=None, date_to=None, returned=None, student=None, now=None):
+    """
+    Rentals to export as plain rows, with duration and fee computed in SQL and ordered by id.
+    Archived rentals are included (they are all returned, so open-only exports skip the archive).
+
+    Args:
+        date_from, date_to: Rental date range, inclusive start and exclusive end.
+        returned: Only returned (True) or open (False) rentals.
+        student: A student id or username.
+    """
+    now = now or timezone.now()
+    columns = [path for column, path in EXPORT_COLUMNS if column != 'outstanding_fee']
+    querysets = []
+    for model in (Rental, ArchivedRental) if returned is not False else (Rental,):
+        queryset = model.objects.with_duration(now=now).with_fee(now=now)
+        if date_from:
+            queryset = queryset.filter(rental_date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(rental_date__lt=date_to)
+        if returned is not None:
+            queryset = queryset.filter(returned=returned)
+        if student not in (None, ''):
+            student = str(student)
+            condition = Q(student__username=student)
+            if student.isdigit():
+                condition |= Q(student_id=int(student))
+            queryset = queryset.filter(condition)
+        querysets.append(queryset.order_by().values(*columns))
+    if len(querysets) == 1:
+        return querysets[0].order_by('id')
+    return querysets[0].union(querysets[1], all=True).order_by('id')
+
+
+def export_row(row) -> dict:
+    row['rental_fee'] = round(row['rental_fee'], 2)
+    row['outstanding_fee'] = 0.0 if row['returned'] else row['rental_fee']
+    return {column: row[path] for column, path in EXPORT_COLUMNS}
+
+
+def iter_export(queryset, output_format, chunk_size=None):
+    """
+    Yields the export one line at a time. Rows are read with iterator(chunk_size), which uses a
+    server-side cursor where the database supports it, so memory stays flat whatever the row count.
+    """
+    rows = (export_row(row) for row in queryset.iterator(chunk_size=chunk_size or var_settings.EXPORT_CHUNK_SIZE))
+    if output_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, path in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else ('' if value is None else value)
+            for value in row.values()
+        ])
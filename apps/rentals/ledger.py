@@ -0,0 +1,131 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from bookmate.load_env_vars import var_settings
+from changes.models import Change
+from .models import Rental, RentalFee, StudentFeeBalance
+import datetime
+
+LEDGER_BATCH_SIZE = 1000
+
+
+def next_accrual_on(rental_date, duration):
+    """
+    The UTC date on which a rental of `duration` days enters its next billed month, i.e. the
+    first day Rental._rental_fee() gives another result.
+    """
+    free_period = var_settings.FREE_RENTAL_PERIOD
+    billed_months = -(-(duration - free_period) // 30) if duration > free_period else 0
+    return rental_date.astimezone(datetime.timezone.utc).date() + timedelta(days=free_period + 30 * billed_months + 1)
+
+
+def refresh_student_balances(student_ids):
+    """
+    Recomputes the balances of `student_ids` from their ledger entries, one grouped query for all of them.
+    """
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    totals = {
+        row['student']: row
+        for row in RentalFee.objects.filter(student__in=student_ids, outstanding=True).values('student').annotate(
+            total=Sum('accrued_fee'), count=Count('rental'),
+        )
+    }
+    StudentFeeBalance.objects.bulk_create(
+        [
+            StudentFeeBalance(
+                student_id=student_id,
+                outstanding_fee=totals.get(student_id, {}).get('total') or 0.0,
+                open_rentals=totals.get(student_id, {}).get('count') or 0,
+            )
+            for student_id in student_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=['outstanding_fee', 'open_rentals', 'last_modified_at'],
+    )
+
+
+@transaction.atomic
+def sync_rental_fees(rental_ids, now=None) -> int:
+    """
+    Brings the ledger entries of `rental_ids` up to date and refreshes the balances of their students,
+    including the previous student of a rental that changed hands. Fees are computed in SQL.
+    Returns:
+        int: The number of entries written.
+    """
+    rental_ids = list(rental_ids)
+    if not rental_ids:
+        return 0
+    now = now or timezone.now()
+    rows = list(
+        Rental.objects.filter(pk__in=rental_ids)
+        .with_duration(now=now)
+        .with_fee(now=now)
+        .values_list('id', 'student_id', 'returned', 'rental_date', 'rental_duration', 'rental_fee', 'fee__student_id')
+    )
+    students = {previous_student_id for *_, previous_student_id in rows if previous_student_id is not None}
+    entries = [
+        RentalFee(
+            rental_id=rental_id,
+            student_id=student_id,
+            accrued_fee=fee,
+            outstanding=not returned,
+            next_accrual_on=None if returned else next_accrual_on(rental_date, duration),
+        )
+        for rental_id, student_id, returned, rental_date, duration, fee, previous_student_id in rows
+    ]
+    RentalFee.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['rental'],
+        update_fields=['student', 'accrued_fee', 'outstanding', 'next_accrual_on', 'last_modified_at'],
+    )
+    refresh_student_balances(students | {entry.student_id for entry in entries})
+    return len(entries)
+
+
+def accrue_fees(now=None, batch_size=LEDGER_BATCH_SIZE) -> dict:
+    """
+    The periodic ledger job: re-accrues the open rentals whose next_accrual_on has come, then
+    adds entries for open rentals that have none yet (bulk-loaded ones). Every other entry is
+    left alone, so a daily run touches only the rentals that crossed a billing boundary. Their fee
+    is part of the rental list, so they are recorded in the change feed as well.
+    Returns:
+        dict: The number of entries accrued and created.
+    """
+    now = now or timezone.now()
+    today = now.astimezone(datetime.timezone.utc).date()
+    stats = {'accrued': 0, 'created': 0}
+    # Each batch moves next_accrual_on past today or adds the missing entries, so both loops end.
+    while True:
+        due = list(
+            RentalFee.objects.filter(outstanding=True, next_accrual_on__lte=today)
+            .order_by('next_accrual_on').values_list('rental_id', flat=True)[:batch_size]
+        )
+        if not due:
+            break
+        with transaction.atomic():
+            stats['accrued'] += sync_rental_fees(due, now=now)
+            Change.record(Change.RENTAL, due)
+    while True:
+        missing = list(Rental.objects.open().filter(fee__isnull=True).order_by().values_list('id', flat=True)[:batch_size])
+        if not missing:
+            break
+        with transaction.atomic():
+            stats['created'] += sync_rental_fees(missing, now=now)
+            Change.record(Change.RENTAL, missing)
+    return stats
+
+
+def rebuild_ledger(now=None, batch_size=LEDGER_BATCH_SIZE) -> int:
+    """
+    Recomputes every ledger entry and balance, e.g. after FREE_RENTAL_PERIOD changed.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        RentalFee.objects.all().delete()
+        StudentFeeBalance.objects.all().delete()
+        return accrue_fees(now=now, batch_size=batch_size)['created']
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from rentals.dashboard import invalidate_student_dashboard
+from rentals.ledger import LEDGER_BATCH_SIZE, accrue_fees, rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = "Bring the fee ledger up to date; only rentals that entered a new billed month since the last run are touched. Run daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=LEDGER_BATCH_SIZE, help="Rentals re-accrued per transaction.")
+        parser.add_argument('--rebuild', action='store_true', help="Recompute every entry, e.g. after FREE_RENTAL_PERIOD changed.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            created = rebuild_ledger(batch_size=options['batch_size'])
+            self.stdout.write(f"Rebuilt the fee ledger with {created} rentals.")
+        else:
+            stats = accrue_fees(batch_size=options['batch_size'])
+            self.stdout.write(f"Accrued {stats['accrued']} rentals and added {stats['created']} new ones to the fee ledger.")
+        invalidate_student_dashboard()
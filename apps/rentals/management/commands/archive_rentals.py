@@ -0,0 +1,29 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from bookmate.load_env_vars import var_settings
+from rentals.archive import archivable, archive_rentals
+import time
+
+
+class Command(BaseCommand):
+    help = "Move returned rentals older than --older-than days to the archive table, in batches; safe to interrupt and run again."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=var_settings.RENTAL_ARCHIVE_AFTER_DAYS, help="Days since the return.")
+        parser.add_argument('--batch-size', type=int, default=var_settings.RENTAL_ARCHIVE_BATCH_SIZE, help="Rentals moved per transaction.")
+        parser.add_argument('--limit', type=int, help="Stop after archiving this many rentals.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rentals that would be archived.")
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['older_than'])
+        if options['dry_run']:
+            self.stdout.write(f"{archivable(older_than).count()} rentals returned more than {options['older_than']} days ago can be archived.")
+            return
+        started = time.perf_counter()
+
+        def progress(archived):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Archived {archived} rentals")
+
+        archived = archive_rentals(older_than, batch_size=options['batch_size'], limit=options['limit'], progress=progress)
+        self.stdout.write(f"Archived {archived} rentals in {time.perf_counter() - started:.1f}s.")
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from books.models import Book
+from rentals.models import Rental
+import json, statistics, time
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure queries and latency of Rental.save()/delete(); all rows are rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def measure(self, samples, operation):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - started
+        samples.append((len(queries), elapsed))
+
+    def summarize(self, samples):
+        queries = [count for count, _ in samples]
+        latencies = sorted(elapsed * 1000 for _, elapsed in samples)
+        return {
+            'queries_per_op': statistics.mean(queries),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        }
+
+    def handle(self, *args, **options):
+        results = {'create': [], 'return': [], 'delete': []}
+        try:
+            with transaction.atomic():
+                student = User.objects.create_user(f"bench_student_{time.time_ns()}")
+                for i in range(options['iterations']):
+                    book = Book.objects.create(title=f"bench-{time.time_ns()}-{i}", author='Author', number_of_pages=100)
+                    rental = Rental(student=student, book=book)
+                    self.measure(results['create'], rental.save)
+                    rental = Rental.objects.get(pk=rental.pk)
+                    rental.return_date = timezone.now()
+                    self.measure(results['return'], rental.save)
+                    rental = Rental.objects.get(pk=rental.pk)
+                    self.measure(results['delete'], rental.delete)
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(json.dumps({name: self.summarize(samples) for name, samples in results.items()}, indent=2))
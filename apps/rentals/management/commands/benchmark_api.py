@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rentals.benchmark import compare_reports, run_benchmark, run_serializer_benchmark
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the book, rental and dashboard endpoints in process or over HTTP and print "
+        "p50/p95/p99 latency, throughput and SQL queries per request as JSON. Seed data first with `manage.py seed`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('inprocess', 'asgi', 'http'), default='inprocess', help="asgi serves the requests from the ASGI application on one event loop.")
+        parser.add_argument('--base-url', help="Server to benchmark in http mode; a local one is started when omitted.")
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per endpoint sent first.")
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--async-views', action='store_true', help="Request the async versions of book_list, rental_list and rental_detail.")
+        parser.add_argument('--target', action='append', dest='targets', help="Endpoint to run (repeatable); all by default.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the ids and pages requested.")
+        parser.add_argument('--serializer-rows', type=int, help="Also time the DRF and the fast list serializers on this many rows (e.g. 10000).")
+        parser.add_argument('--output', help="Write the report to this file as well.")
+        parser.add_argument('--compare', help="A previous report to compare against; adds percentage changes.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as stream:
+                    baseline = json.load(stream)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        # The benchmark talks to the project under local host names whatever ALLOWED_HOSTS says.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost', '127.0.0.1']):
+            report = run_benchmark(
+                mode=options['mode'],
+                requests_count=options['requests'],
+                concurrency=options['concurrency'],
+                warmup=options['warmup'],
+                targets=options['targets'],
+                base_url=options['base_url'],
+                random_seed=options['seed'],
+                async_views=options['async_views'],
+            )
+        if options['serializer_rows']:
+            report['serializers'] = run_serializer_benchmark(rows=options['serializer_rows'])
+        if baseline is not None:
+            report['comparison'] = compare_reports(report, baseline)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+        self.stdout.write(output)
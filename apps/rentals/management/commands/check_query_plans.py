@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from books.models import Book
+from rentals.models import ArchivedRental, Rental, RentalFee
+from rentals.seeding import seed_dataset
+import re
+
+User = get_user_model()
+
+# A table read without any index: "SCAN t" on SQLite (not "SCAN t USING INDEX i"), "Seq Scan on t" on PostgreSQL.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)(?! USING (?:COVERING )?INDEX)\s*$', re.MULTILINE),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+CHECKED_TABLES = {Book._meta.db_table, Rental._meta.db_table, RentalFee._meta.db_table, ArchivedRental._meta.db_table}
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """
+    The queries behind the hot paths, built the same way the views, admin and services build them.
+    """
+    rental = Rental.objects.open().order_by('id').first()
+    book = Book.objects.order_by('-created_at', '-id')[100]
+    student_ids = list(Rental.objects.open().order_by().values_list('student_id', flat=True).distinct()[:25])
+    keyset = Q(created_at__lte=book.created_at) & (Q(created_at__lt=book.created_at) | Q(pk__lt=book.pk))
+    return {
+        'book_list': Book.objects.select_related('created_by', 'last_modified_by').order_by('-created_at', '-id')[:51],
+        'book_list_next_page': Book.objects.filter(keyset).order_by('-created_at', '-id')[:51],
+        'rental_list': Rental.objects.select_related('student', 'book').order_by('-created_at', '-id')[:51],
+        'rental_duplicate_check': Rental.objects.filter(student=rental.student_id, book=rental.book_id, returned=False),
+        'dashboard_page_rentals': Rental.objects.open().filter(student__in=student_ids).select_related('book'),
+        'available_books': Book.objects.filter(is_rented=False, is_active=True).order_by('title')[:20],
+        'book_by_title': Book.objects.filter(title=book.title),
+        'fee_accrual_due': RentalFee.objects.filter(outstanding=True, next_accrual_on__lte=rental.rental_date.date()).order_by('next_accrual_on')[:1000],
+        'fee_ledger_missing': Rental.objects.open().filter(fee__isnull=True).order_by()[:1000],
+        'rental_history': Rental.objects.filter(student=rental.student_id).with_fee().order_by('-id')[:51],
+        'archived_rental_history': ArchivedRental.objects.filter(student=rental.student_id).with_fee().order_by('-id')[:51],
+    }
+
+
+class Command(BaseCommand):
+    help = "Seed a large dataset, EXPLAIN every hot query and fail if one of them falls back to a full table scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rentals', type=int, default=100000, help="Rentals to seed (books and students scale with it).")
+        parser.add_argument('--no-seed', action='store_true', help="Explain against the existing data instead of seeding.")
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Query plan checks are not supported on {connection.vendor}.")
+
+        failures = []
+        try:
+            with transaction.atomic():
+                if not options['no_seed']:
+                    rentals = options['rentals']
+                    seed_dataset(users=max(rentals // 20, 1), books=max(rentals // 4, 200), rentals=rentals, prefix='plancheck')
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                for name, queryset in hot_queries().items():
+                    plan = queryset.explain()
+                    scanned = sorted({match.group('table') for match in pattern.finditer(plan)} & CHECKED_TABLES)
+                    status = self.style.ERROR('FULL SCAN') if scanned else self.style.SUCCESS('ok')
+                    self.stdout.write(f"{name}: {status}")
+                    if options['verbosity'] > 1 or scanned:
+                        self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+                    if scanned:
+                        failures.append(f"{name} ({', '.join(scanned)})")
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"Full table scans in: {', '.join(failures)}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookmate.load_env_vars import var_settings
+from utils.db_router import read_alias, replica_reads
+from rentals.export import EXPORT_FORMATS, export_queryset, iter_export, parse_boundary, parse_returned
+
+
+class Command(BaseCommand):
+    help = "Stream rentals with their duration and fees as CSV or JSONL, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="File to write, or - for stdout.")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--from', dest='date_from', help="Only rentals from this date or datetime on.")
+        parser.add_argument('--to', dest='date_to', help="Only rentals before this date or datetime.")
+        parser.add_argument('--returned', choices=('true', 'false'), help="Only returned (true) or open (false) rentals.")
+        parser.add_argument('--student', help="Student id or username.")
+        parser.add_argument('--chunk-size', type=int, default=var_settings.EXPORT_CHUNK_SIZE, help="Rentals fetched per round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            with replica_reads():
+                queryset = export_queryset(
+                    date_from=parse_boundary(options['date_from'], '--from'),
+                    date_to=parse_boundary(options['date_to'], '--to'),
+                    returned=parse_returned(options['returned']),
+                    student=options['student'],
+                ).using(read_alias())
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = iter_export(queryset, options['format'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+            stream.writelines(lines)
+        self.stderr.write(f"Exported rentals to {options['output']}.")
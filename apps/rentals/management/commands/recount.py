@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from books.catalogue import invalidate_catalogue
+from rentals.counters import RECOUNT_BATCH_SIZE, recount
+from rentals.dashboard import invalidate_student_dashboard
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rental counters (per book, per student and available books) and report how far they had drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECOUNT_BATCH_SIZE, help="Books or users recounted per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report the drift; leave the counters as they are.")
+
+    def handle(self, *args, **options):
+        report = recount(fix=not options['dry_run'], batch_size=options['batch_size'])
+        action = "found" if options['dry_run'] else "corrected"
+        for name, label in (('books', 'book rental counts'), ('students', 'student rental counts')):
+            stats = report[name]
+            self.stdout.write(f"Checked {stats['checked']} {label}: {action} {stats['drifted']} drifted by {stats['drift']} in total.")
+        available = report['available_books']
+        self.stdout.write(f"Available books: counter {available['stored']}, actual {available['actual']} ({action} drift {available['drift']}).")
+        if not options['dry_run']:
+            invalidate_catalogue()
+            invalidate_student_dashboard()
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books.catalogue import invalidate_catalogue
+from rentals.counters import recount
+from rentals.dashboard import invalidate_student_dashboard
+from rentals.ledger import accrue_fees
+from rentals.seeding import seed_dataset
+import time
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a reproducible synthetic dataset of students, books and rentals, e.g. for benchmark_api."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--rentals', type=int, default=100000)
+        parser.add_argument('--open-ratio', type=float, default=0.1, help="Share of rentals that are still open.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same dataset.")
+        parser.add_argument('--prefix', default='seed', help="Prefix of the generated usernames and titles; use a new one to seed again.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument('--no-ledger', action='store_true', help="Skip filling the fee ledger for the new rentals.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(model_name, written):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{model_name}: {written} rows")
+
+        with transaction.atomic():
+            counts = seed_dataset(
+                users=options['users'],
+                books=options['books'],
+                rentals=options['rentals'],
+                open_ratio=options['open_ratio'],
+                random_seed=options['seed'],
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+                progress=progress,
+            )
+        seeded = time.perf_counter() - started
+        self.stdout.write(f"Seeded {counts['users']} users, {counts['books']} books and {counts['rentals']} rentals in {seeded:.1f}s.")
+
+        # bulk_create skips the signals that keep the ledger and the caches in step.
+        if not options['no_ledger']:
+            stats = accrue_fees()
+            self.stdout.write(f"Added {stats['created']} open rentals to the fee ledger in {time.perf_counter() - started - seeded:.1f}s.")
+        recount()
+        invalidate_catalogue()
+        invalidate_student_dashboard()
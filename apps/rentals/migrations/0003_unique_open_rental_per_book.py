@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_isbndb_lookup'),
+        ('rentals', '0002_alter_rental_book_alter_rental_created_by_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned', False)), fields=('book',), name='unique_open_rental_per_book'),
+        ),
+    ]
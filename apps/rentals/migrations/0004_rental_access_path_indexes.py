@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_book_access_path_indexes'),
+        ('rentals', '0003_unique_open_rental_per_book'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['-created_at', '-id'], name='rental_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['student', 'book'], name='rental_open_student_idx'),
+        ),
+    ]
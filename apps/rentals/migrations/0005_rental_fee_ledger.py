@@ -0,0 +1,83 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+from rentals.ledger import next_accrual_on
+from rentals.models import rental_duration_expression, rental_fee_expression
+
+
+def accrue_open_rentals(apps, schema_editor):
+    # The ledger entries and balances of the rentals already open; from here on the write paths and accrue_fees keep them up to date.
+    Rental = apps.get_model('rentals', 'Rental')
+    RentalFee = apps.get_model('rentals', 'RentalFee')
+    StudentFeeBalance = apps.get_model('rentals', 'StudentFeeBalance')
+
+    now = timezone.now()
+    rentals = (
+        Rental.objects.filter(returned=False)
+        .annotate(rental_duration=rental_duration_expression(now), rental_fee=rental_fee_expression(now))
+        .values_list('id', 'student_id', 'rental_date', 'rental_duration', 'rental_fee')
+    )
+    RentalFee.objects.bulk_create(
+        (
+            RentalFee(rental_id=rental_id, student_id=student_id, accrued_fee=fee, outstanding=True, next_accrual_on=next_accrual_on(rental_date, duration))
+            for rental_id, student_id, rental_date, duration, fee in rentals.iterator()
+        ),
+        batch_size=5000,
+    )
+    balances = RentalFee.objects.order_by().values('student').annotate(total=Sum('accrued_fee'), count=Count('rental')).values_list('student', 'total', 'count')
+    StudentFeeBalance.objects.bulk_create(
+        (StudentFeeBalance(student_id=student_id, outstanding_fee=total, open_rentals=count) for student_id, total, count in balances.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('rentals', '0004_rental_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentFeeBalance',
+            fields=[
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(help_text='The student the balance belongs to.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('outstanding_fee', models.FloatField(default=0.0, help_text="Total fee of the student's open rentals.")),
+                ('open_rentals', models.PositiveIntegerField(default=0, help_text='Number of open rentals.')),
+            ],
+            options={
+                'verbose_name': 'Student Fee Balance',
+                'verbose_name_plural': 'Student Fee Balances',
+                'db_table': 'rentals_student_fee_balance',
+            },
+        ),
+        migrations.CreateModel(
+            name='RentalFee',
+            fields=[
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('rental', models.OneToOneField(help_text='The rental the fee belongs to.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee', serialize=False, to='rentals.rental')),
+                ('accrued_fee', models.FloatField(default=0.0, help_text='The fee accrued so far.')),
+                ('outstanding', models.BooleanField(default=True, help_text='Whether the rental is still open.')),
+                ('next_accrual_on', models.DateField(blank=True, help_text='The date the fee next changes; empty once the rental is returned.', null=True)),
+                ('student', models.ForeignKey(help_text='The student who owes the fee.', on_delete=django.db.models.deletion.CASCADE, related_name='rental_fees', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Rental Fee',
+                'verbose_name_plural': 'Rental Fees',
+                'db_table': 'rentals_rental_fee',
+                'indexes': [models.Index(condition=models.Q(('outstanding', True)), fields=['next_accrual_on'], name='rental_fee_due_idx')],
+            },
+        ),
+        migrations.RunPython(accrue_open_rentals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rentals(apps, schema_editor):
+    # The counters of the rows that already exist; from here on they are maintained incrementally.
+    Book = apps.get_model('books', 'Book')
+    Counter = apps.get_model('books', 'Counter')
+    Rental = apps.get_model('rentals', 'Rental')
+    StudentRentalCount = apps.get_model('rentals', 'StudentRentalCount')
+
+    rentals = Rental.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(count=Count('pk')).values('count')
+    Book.objects.update(rental_count=Coalesce(Subquery(rentals), 0))
+    students = (
+        Rental.objects.order_by().values('student')
+        .annotate(total=Count('pk'), open=Count('pk', filter=Q(returned=False))).values_list('student', 'total', 'open')
+    )
+    StudentRentalCount.objects.bulk_create(
+        (StudentRentalCount(student_id=student_id, total_rentals=total, open_rentals=open_rentals) for student_id, total, open_rentals in students.iterator()),
+        batch_size=5000,
+    )
+    Counter.objects.update_or_create(name='available_books', defaults={'value': Book.objects.filter(is_active=True, is_rented=False).count()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0008_rental_counters'),
+        ('rentals', '0005_rental_fee_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRentalCount',
+            fields=[
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(help_text='The student the counters belong to.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rental_count', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_rentals', models.IntegerField(default=0, help_text='Number of rentals the student has had.')),
+                ('open_rentals', models.IntegerField(default=0, help_text='Number of rentals not returned yet.')),
+            ],
+            options={
+                'verbose_name': 'Student Rental Count',
+                'verbose_name_plural': 'Student Rental Counts',
+                'db_table': 'rentals_student_rental_count',
+            },
+        ),
+        migrations.RunPython(count_rentals, migrations.RunPython.noop),
+    ]
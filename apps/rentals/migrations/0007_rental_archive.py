@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_rental_counters'),
+        ('rentals', '0006_rental_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRental',
+            fields=[
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True)),
+                ('id', models.BigIntegerField(help_text='The id of the archived rental.', primary_key=True, serialize=False)),
+                ('rental_date', models.DateTimeField(help_text='The date and time when the book was rented.')),
+                ('return_date', models.DateTimeField(blank=True, help_text='The date and time when the book was returned.', null=True)),
+                ('returned', models.BooleanField(default=True, help_text='Whether the book was returned; always true once archived.')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the rental was archived.')),
+                ('book', models.ForeignKey(help_text='The book that was rented.', on_delete=django.db.models.deletion.CASCADE, related_name='archived_rentals', to='books.book')),
+                ('created_by', models.ForeignKey(blank=True, help_text='The user who created the rental record.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_rental_created_by', to=settings.AUTH_USER_MODEL)),
+                ('last_modified_by', models.ForeignKey(blank=True, help_text='The user who last modified the rental record.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_rental_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(help_text='The student who rented the book.', on_delete=django.db.models.deletion.CASCADE, related_name='archived_rentals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archived Rental',
+                'verbose_name_plural': 'Archived Rentals',
+                'db_table': 'rentals_rental_archive',
+                'indexes': [models.Index(fields=['student', '-id'], name='archived_rental_student_idx'), models.Index(fields=['rental_date'], name='archived_rental_date_idx')],
+            },
+        ),
+    ]
@@ -1,15 +1,123 @@
 from __future__ import unicode_literals
 from django.utils.translation import gettext_lazy as _
-from books.models import Book
+from books.catalogue import invalidate_catalogue
+from books.models import Book, Counter
+from changes.models import Change
 from utils.models import CommonFieldModel
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from bookmate.load_env_vars import var_settings
 from django.core.exceptions import ValidationError
-import math
+from collections import defaultdict
+import datetime, logging, math
 
 User = get_user_model()
+logger = logging.getLogger('bookmate.rentals')
+
+
+class DaysBetween(models.Func):
+    """
+    Whole days from `start` to `end`, both dates; the SQL equivalent of `(end - start).days`.
+    """
+    arity = 2
+    output_field = models.IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL and Oracle return the day count when subtracting dates.
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+def rental_duration(rental_date, return_date=None) -> int:
+    """
+    Days from the rental date to the return date (or now); 0 when the return date precedes the rental date.
+    """
+    end_date = return_date if return_date else timezone.now()
+    if end_date < rental_date :
+        logger.debug("Return date %s is earlier than rental date %s; duration taken as 0.", return_date, rental_date)
+        return 0
+    return (end_date.date() - rental_date.date()).days
+
+
+def rental_fee(rental_date, return_date, number_of_pages):
+    """
+    `ceil(extra_days / 30) * pages / 100` past FREE_RENTAL_PERIOD, or 0 when it cannot be computed.
+    Shared by Rental._rental_fee() and the fast list serializers, which only have the column values.
+    """
+    try:
+        free_period = var_settings.FREE_RENTAL_PERIOD  # Free period in days
+        duration = rental_duration(rental_date, return_date)
+        if duration > free_period:
+            extra_days = duration - free_period
+            return math.ceil(extra_days / 30) * (number_of_pages / 100)
+        return 0.0
+    except Exception as e:
+        logger.debug("Could not calculate the rental fee, taken as 0: %s", e)
+        return 0
+
+
+def rental_duration_expression(now=None):
+    """
+    SQL version of Rental._rental_duration(): days from the rental date to the return date
+    (or `now`), compared as UTC dates, and 0 when the return date precedes the rental date.
+    """
+    end_date = Coalesce('return_date', Value(now or timezone.now(), output_field=models.DateTimeField()))
+    return Case(
+        When(rental_date__gt=end_date, then=Value(0)),
+        default=DaysBetween(TruncDate(end_date, tzinfo=datetime.timezone.utc), TruncDate('rental_date', tzinfo=datetime.timezone.utc)),
+        output_field=models.IntegerField(),
+    )
+
+
+def rental_fee_expression(now=None):
+    """
+    SQL version of Rental._rental_fee(): `ceil(extra_days / 30) * pages / 100` past FREE_RENTAL_PERIOD,
+    evaluated in the same order as the Python method so both give the same float.
+    """
+    free_period = var_settings.FREE_RENTAL_PERIOD
+    duration = rental_duration_expression(now)
+    billed_months = (duration - Value(free_period) + Value(29)) / Value(30)
+    fee = billed_months * (Cast('book__number_of_pages', models.FloatField()) / Value(100.0))
+    return Case(
+        When(book__number_of_pages__isnull=True, then=Value(0.0)),
+        When(GreaterThan(duration, Value(free_period)), then=fee),
+        default=Value(0.0),
+        output_field=models.FloatField(),
+    )
+
+
+class RentalQuerySet(models.QuerySet):
+    """
+    Database-side rental duration and fee, so rentals can be filtered, sorted and summed by fee.
+
+    Usage:
+        Rental.objects.open().with_fee().filter(rental_fee__gt=10)
+        Rental.objects.open().fees_by_student().filter(total_fee__gt=25)
+    """
+
+    def open(self):
+        return self.filter(returned=False)
+
+    def with_duration(self, now=None):
+        return self.annotate(rental_duration=rental_duration_expression(now))
+
+    def with_fee(self, now=None):
+        return self.annotate(rental_fee=rental_fee_expression(now))
+
+    def fees_by_student(self, *fields, now=None):
+        return self.order_by().values('student', *fields).annotate(total_fee=models.Sum(rental_fee_expression(now)), rentals=models.Count('id'))
+
+    def total_fee(self, now=None) -> float:
+        return self.aggregate(total_fee=Coalesce(models.Sum(rental_fee_expression(now)), Value(0.0)))['total_fee']
 
 class Rental(CommonFieldModel):
     """
@@ -24,6 +132,9 @@ class Rental(CommonFieldModel):
         created_by (ForeignKey): User who created this record.
         last_modified_by (ForeignKey): User who last modified this record.
 
+    Managers:
+        objects (RentalQuerySet): Adds with_duration()/with_fee() annotations computing the same values in SQL.
+
     Methods:
         clean(): Validates the model before saving.
         save(*args, **kwargs): Custom save logic for return status.
@@ -36,6 +147,10 @@ class Rental(CommonFieldModel):
     Save Behavior:
         - Sets 'returned' to True when a valid return_date is provided.
         - Handles both creation and update scenarios.
+        - Tracks the book and returned state loaded from the database, so the book's is_rented flag
+          is updated with a single-column UPDATE and only when it has to change.
+        - Moves the rental counters (Book.rental_count, StudentRentalCount and the available-books
+          Counter) with F() updates in the same transaction; deletions are counted by rentals.signals.
 
     Exceptions:
         ValidationError: For invalid dates.
@@ -55,6 +170,11 @@ class Rental(CommonFieldModel):
     created_by = models.ForeignKey(User, related_name='rental_created_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who created this rental record."))
     last_modified_by = models.ForeignKey(User, related_name='rental_modified_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who last modified this rental record."))
 
+    objects = RentalQuerySet.as_manager()
+
+    # The fields the rental fee is computed from, besides the book's page count.
+    FEE_FIELDS = ('student_id', 'book_id', 'rental_date', 'return_date', 'returned')
+
     def _rental_duration(self):
         """
         Calculates the rental duration in days.
@@ -63,11 +183,7 @@ class Rental(CommonFieldModel):
         Raises:
             ValueError: If the return date is earlier than the rental date.
         """
-        end_date = self.return_date if self.return_date else timezone.now()
-        if end_date < self.rental_date :
-            print("Return date cannot be earlier than rental date.")
-            return 0
-        return (end_date.date() - self.rental_date.date()).days
+        return rental_duration(self.rental_date, self.return_date)
 
     def _rental_fee(self):
         """
@@ -78,15 +194,11 @@ class Rental(CommonFieldModel):
             Book.DoesNotExist: If the associated book is not found.
         """
         try:
-            free_period = var_settings.FREE_RENTAL_PERIOD  # Free period in days
-            duration = self._rental_duration()
-            if duration > free_period:
-                extra_days = duration - free_period
-                return math.ceil(extra_days / 30) * (self.book.number_of_pages / 100)
-            return 0.0
+            number_of_pages = self.book.number_of_pages
         except Exception as e:
-            print(f"Error calculating rental fee: {e}")
+            logger.debug("Could not calculate the fee of rental %s, taken as 0: %s", self.pk, e)
             return 0
+        return rental_fee(self.rental_date, self.return_date, number_of_pages)
 
     def clean(self):
         """
@@ -101,37 +213,71 @@ class Rental(CommonFieldModel):
             if self.return_date > timezone.now():
                 raise ValidationError("Return date cannot be in the future.")
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded state so save()/delete() know what changed without re-fetching the row.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _fee_inputs_changed(self) -> bool:
+        """
+        Whether any field the fee depends on differs from what was loaded, so the fee ledger needs a refresh.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        return any(field not in loaded or loaded[field] != getattr(self, field) for field in self.FEE_FIELDS)
+
+    def _loaded_state(self):
+        """
+        Returns the (student_id, book_id, returned) stored in the database, or Nones for a new rental.
+        """
+        if self._state.adding or self.pk is None:
+            return None, None, None
+        loaded = getattr(self, '_loaded_values', {})
+        if all(field in loaded for field in ('student_id', 'book_id', 'returned')):
+            return loaded['student_id'], loaded['book_id'], loaded['returned']
+        return Rental.objects.filter(pk=self.pk).values_list('student_id', 'book_id', 'returned').first() or (None, None, None)
+
+    def _set_book_rented(self, book_id, is_rented, rentals=0):
+        """
+        Sets the book's is_rented flag when it differs, moving the available-books counter with it,
+        and adds `rentals` to its rental_count in the same UPDATE.
+        """
+        counted = {'rental_count': F('rental_count') + rentals} if rentals else {}
+        flipped = Book.objects.filter(pk=book_id).exclude(is_rented=is_rented).update(is_rented=is_rented, last_modified_at=timezone.now(), **counted)
+        if flipped:
+            Counter.adjust_available_books([book_id], -1 if is_rented else 1)
+            Change.record(Change.BOOK, [book_id])
+        elif counted:
+            Book.objects.filter(pk=book_id).update(**counted)
+        invalidate_catalogue()  # last_modified_at is part of the book API
+        if book_id == self.book_id and Rental.book.is_cached(self):
+            self.book.is_rented = is_rented
+
     @transaction.atomic
     def delete(self, *args, **kwargs):
-        self.book.is_rented = False # Update the book's is_rented status before deleting the rental
-        self.book.save()        
-        super().delete(*args, **kwargs)
+        _, _, was_returned = self._loaded_state()
+        if not (self.returned if was_returned is None else was_returned):
+            self._set_book_rented(self.book_id, False)  # Free the book of an open rental before deleting it
+        return super().delete(*args, **kwargs)
 
     @transaction.atomic
-    def save(self, *args, **kwargs):
+    def save(self, *args, sync_book=True, **kwargs):
+        """
+        Saves the rental and keeps the book's is_rented flag and the rental counters in step with it.
+        Only the affected books are written, with single-column updates, and only when the
+        rental's book or returned state actually changed since it was loaded.
+        Pass sync_book=False when the caller has already updated the book, is_rented and
+        rental_count included (see rentals.services).
+        """
         self.clean()
 
         # Check if this is an update operation
         update_fields = kwargs.get('update_fields')
 
         # Automatically set returned based on the presence and validity of return_date
-        if self.return_date and self.return_date <= timezone.now() and self.return_date >= self.rental_date:
-            self.returned = True
-            self.book.is_rented = False
-            self.book.save()
-        else:
-            self.returned = False
-            self.book.is_rented = True
-            self.book.save()
-
-        is_update = self.pk is not None
-        if is_update:
-            original_rental = Rental.objects.get(pk=self.pk)
-            old_book = original_rental.book
-
-            if is_update and old_book != self.book:
-                old_book.is_rented = False
-                old_book.save()
+        self.returned = bool(self.return_date and self.return_date <= timezone.now() and self.return_date >= self.rental_date)
+        old_student_id, old_book_id, was_returned = self._loaded_state()
 
         # If this is an update operation, add 'returned' to update_fields
         if update_fields is not None:
@@ -140,6 +286,28 @@ class Rental(CommonFieldModel):
             kwargs['update_fields'] = update_fields
 
         super().save(*args, **kwargs)
+        self._loaded_values = {field: getattr(self, field) for field in self.FEE_FIELDS}
+
+        book_rentals = {}
+        if old_book_id != self.book_id:
+            book_rentals = {old_book_id: -1, self.book_id: 1} if old_book_id is not None else {self.book_id: 1}
+        if sync_book:
+            if old_book_id is not None and old_book_id != self.book_id and not was_returned:
+                self._set_book_rented(old_book_id, False, book_rentals.pop(old_book_id))
+            if old_book_id != self.book_id or was_returned != self.returned:
+                self._set_book_rented(self.book_id, not self.returned, book_rentals.pop(self.book_id, 0))
+        else:
+            book_rentals.pop(self.book_id, None)
+        for book_id, rentals in book_rentals.items():
+            Book.objects.filter(pk=book_id).update(rental_count=F('rental_count') + rentals)
+
+        student_rentals = defaultdict(lambda: [0, 0])
+        if old_student_id is not None:
+            student_rentals[old_student_id][0] -= 1
+            student_rentals[old_student_id][1] -= not was_returned
+        student_rentals[self.student_id][0] += 1
+        student_rentals[self.student_id][1] += not self.returned
+        StudentRentalCount.adjust(student_rentals)
 
     def __str__(self):
         username = self.student.username or self.student.email
@@ -150,7 +318,163 @@ class Rental(CommonFieldModel):
         db_table = "rentals_rental"
         verbose_name = _('Rental')
         verbose_name_plural = _('Rentals')
+        indexes = [
+            # Keyset pagination of the rental list.
+            models.Index(fields=['-created_at', '-id'], name='rental_created_idx'),
+            # Open rentals by student: the duplicate-rental check and the dashboard.
+            models.Index(fields=['student', 'book'], condition=models.Q(returned=False), name='rental_open_student_idx'),
+        ]
+        constraints = [
+            # A book can only be out on one rental at a time.
+            models.UniqueConstraint(fields=['book'], condition=models.Q(returned=False), name='unique_open_rental_per_book'),
+        ]
     
     def __repr__(self):
         username = self.student.username or self.student.email
-        return f"<Rental: {username} -> Book: {self.book.title}>"
\ No newline at end of file
+        return f"<Rental: {username} -> Book: {self.book.title}>"
+
+
+class ArchivedRental(CommonFieldModel):
+    """
+    A returned rental moved out of `rentals_rental` by rentals.archive, so the hot paths scan only
+    the working set. Rows keep the rental's id and columns; history reads and exports cover both tables.
+
+    Attributes:
+        id (BigIntegerField): The id the rental had.
+        student, book, rental_date, return_date, returned, created_by, last_modified_by: As on Rental.
+        archived_at (DateTimeField): When the rental was archived.
+
+    Managers:
+        objects (RentalQuerySet): The same with_duration()/with_fee() annotations as Rental.
+    """
+
+    id = models.BigIntegerField(primary_key=True, help_text=_("The id of the archived rental."))
+    student = models.ForeignKey(User, related_name='archived_rentals', on_delete=models.CASCADE, help_text=_("The student who rented the book."))
+    book = models.ForeignKey(Book, related_name='archived_rentals', on_delete=models.CASCADE, help_text=_("The book that was rented."))
+    rental_date = models.DateTimeField(help_text=_("The date and time when the book was rented."))
+    return_date = models.DateTimeField(null=True, blank=True, help_text=_("The date and time when the book was returned."))
+    returned = models.BooleanField(default=True, help_text=_("Whether the book was returned; always true once archived."))
+    created_by = models.ForeignKey(User, related_name='archived_rental_created_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who created the rental record."))
+    last_modified_by = models.ForeignKey(User, related_name='archived_rental_modified_by', on_delete=models.SET_NULL, null=True, blank=True, help_text=_("The user who last modified the rental record."))
+    archived_at = models.DateTimeField(default=timezone.now, help_text=_("When the rental was archived."))
+
+    objects = RentalQuerySet.as_manager()
+
+    class Meta:
+        db_table = "rentals_rental_archive"
+        verbose_name = _('Archived Rental')
+        verbose_name_plural = _('Archived Rentals')
+        indexes = [
+            # Rental history of a student, newest first.
+            models.Index(fields=['student', '-id'], name='archived_rental_student_idx'),
+            # Exports by rental date.
+            models.Index(fields=['rental_date'], name='archived_rental_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} -> {self.book_id} (archived)"
+
+
+class RentalFee(CommonFieldModel):
+    """
+    Fee ledger entry of a rental: the fee accrued so far, maintained by rentals.ledger.
+
+    Fees are a step function of the rental duration, so an entry stays exact until
+    next_accrual_on, the day the rental enters another billed month. Entries are refreshed
+    whenever their rental changes and by the `accrue_fees` job once that day has come.
+
+    Attributes:
+        rental (OneToOneField): The rental the fee belongs to.
+        student (ForeignKey): The rental's student, copied for the per-student totals.
+        accrued_fee (FloatField): The fee as computed by Rental._rental_fee().
+        outstanding (BooleanField): Whether the rental is still open, i.e. the fee is still due and growing.
+        next_accrual_on (DateField): The UTC date the fee next changes; null once the rental is returned.
+    """
+
+    rental = models.OneToOneField(Rental, primary_key=True, related_name='fee', on_delete=models.CASCADE, help_text=_("The rental the fee belongs to."))
+    student = models.ForeignKey(User, related_name='rental_fees', on_delete=models.CASCADE, help_text=_("The student who owes the fee."))
+    accrued_fee = models.FloatField(default=0.0, help_text=_("The fee accrued so far."))
+    outstanding = models.BooleanField(default=True, help_text=_("Whether the rental is still open."))
+    next_accrual_on = models.DateField(null=True, blank=True, help_text=_("The date the fee next changes; empty once the rental is returned."))
+
+    class Meta:
+        db_table = "rentals_rental_fee"
+        verbose_name = _('Rental Fee')
+        verbose_name_plural = _('Rental Fees')
+        indexes = [
+            # The accrue_fees job: open rentals whose fee is due to change.
+            models.Index(fields=['next_accrual_on'], condition=models.Q(outstanding=True), name='rental_fee_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rental_id}: {self.accrued_fee}"
+
+
+class StudentFeeBalance(CommonFieldModel):
+    """
+    Per-student totals of the fee ledger, read by the dashboard in one row per student.
+
+    Attributes:
+        student (OneToOneField): The student.
+        outstanding_fee (FloatField): Sum of the accrued fees of the student's open rentals.
+        open_rentals (PositiveIntegerField): Number of open rentals.
+    """
+
+    student = models.OneToOneField(User, primary_key=True, related_name='fee_balance', on_delete=models.CASCADE, help_text=_("The student the balance belongs to."))
+    outstanding_fee = models.FloatField(default=0.0, help_text=_("Total fee of the student's open rentals."))
+    open_rentals = models.PositiveIntegerField(default=0, help_text=_("Number of open rentals."))
+
+    class Meta:
+        db_table = "rentals_student_fee_balance"
+        verbose_name = _('Student Fee Balance')
+        verbose_name_plural = _('Student Fee Balances')
+
+    def __str__(self):
+        return f"{self.student_id}: {self.outstanding_fee}"
+
+
+class StudentRentalCount(CommonFieldModel):
+    """
+    Per-student rental counters, maintained with F() updates by Rental.save(), the checkout and
+    return services and the rental delete signal; `manage.py recount` rebuilds them.
+
+    Attributes:
+        student (OneToOneField): The student.
+        total_rentals (IntegerField): Rentals the student has ever had.
+        open_rentals (IntegerField): Rentals not returned yet.
+    """
+
+    student = models.OneToOneField(User, primary_key=True, related_name='rental_count', on_delete=models.CASCADE, help_text=_("The student the counters belong to."))
+    total_rentals = models.IntegerField(default=0, help_text=_("Number of rentals the student has had."))
+    open_rentals = models.IntegerField(default=0, help_text=_("Number of rentals not returned yet."))
+
+    class Meta:
+        db_table = "rentals_student_rental_count"
+        verbose_name = _('Student Rental Count')
+        verbose_name_plural = _('Student Rental Counts')
+
+    def __str__(self):
+        return f"{self.student_id}: {self.open_rentals}/{self.total_rentals}"
+
+    @classmethod
+    def adjust(cls, changes):
+        """
+        Applies `changes`, a mapping of student ids to (total, open) deltas. Students sharing a delta
+        are updated in one UPDATE; a student's first rental creates the row.
+        """
+        groups = defaultdict(list)
+        for student_id, (total, open_rentals) in changes.items():
+            if total or open_rentals:
+                groups[total, open_rentals].append(student_id)
+        for (total, open_rentals), student_ids in groups.items():
+            counted = {'total_rentals': F('total_rentals') + total, 'open_rentals': F('open_rentals') + open_rentals}
+            updated = cls.objects.filter(student_id__in=student_ids).update(**counted)
+            if updated == len(student_ids) or total < 0 or open_rentals < 0:
+                continue
+            existing = set(cls.objects.filter(student_id__in=student_ids).values_list('student_id', flat=True))
+            for student_id in set(student_ids) - existing:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(student_id=student_id, total_rentals=total, open_rentals=open_rentals)
+                except IntegrityError:  # Created by a concurrent rental.
+                    cls.objects.filter(student_id=student_id).update(**counted)
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from books.models import Book
+from .models import Rental
+import random
+
+User = get_user_model()
+
+
+def seed_dataset(users, books, rentals, open_ratio=0.1, random_seed=0, prefix='seed', batch_size=5000, progress=None) -> dict:
+    """
+    Bulk-generates a synthetic catalogue: `users` students, `books` books and `rentals` rentals.
+
+    The data is reproducible for a given `random_seed`. Rentals are spread over the last year;
+    `open_ratio` of them are still open, each on its own book (which is marked as rented), and the
+    rest are returned after a random number of days. Rows are written with bulk_create in
+    `batch_size` chunks; `progress(model_name, rows_written)` is called after each chunk.
+    Returns:
+        dict: The number of rows created per model.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    password = make_password(None)
+
+    def write(model, objects):
+        batch, written = [], 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+                if progress:
+                    progress(model.__name__, written)
+        if batch:
+            model.objects.bulk_create(batch)
+            written += len(batch)
+            if progress:
+                progress(model.__name__, written)
+
+    open_rentals = min(int(rentals * open_ratio), books)
+    write(User, (User(username=f"{prefix}_student_{i}", password=password) for i in range(users)))
+    write(Book, (
+        Book(
+            title=f"{prefix} book {i}",
+            author=f"{prefix} author {rng.randrange(max(books // 10, 1))}",
+            number_of_pages=rng.randint(50, 1200),
+            is_rented=i < open_rentals,
+        )
+        for i in range(books)
+    ))
+
+    user_ids = list(User.objects.filter(username__startswith=f"{prefix}_student_").values_list('id', flat=True))
+    book_ids = list(Book.objects.filter(title__startswith=f"{prefix} book ").order_by('id').values_list('id', flat=True))
+    if not user_ids or not book_ids:
+        return {'users': users, 'books': books, 'rentals': 0}
+
+    def generate_rentals():
+        for i in range(rentals):
+            rental_date = now - timedelta(days=rng.uniform(0, 365))
+            if i < open_rentals:
+                yield Rental(student_id=rng.choice(user_ids), book_id=book_ids[i], rental_date=rental_date)
+            else:
+                return_date = min(rental_date + timedelta(days=rng.uniform(0, 90)), now)
+                yield Rental(student_id=rng.choice(user_ids), book_id=rng.choice(book_ids), rental_date=rental_date, return_date=return_date, returned=True)
+
+    write(Rental, generate_rentals())
+    return {'users': users, 'books': books, 'rentals': rentals}
@@ -1,11 +1,21 @@
 
 from rest_framework import serializers
-from .models import Rental
+from bookmate.load_env_vars import var_settings
+from utils.fast_serializers import ValuesSerializer
+from .models import Rental, rental_fee
 from books.serializers import BookBriefSerializer, UserSerializer
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
+# Columns RentalListSerializer reads; loaded together with the student and book in a single query.
+RENTAL_LIST_FIELDS = [
+    'id', 'rental_date', 'return_date', 'returned', 'created_at',
+    'student__id', 'student__username', 'student__first_name', 'student__last_name',
+    'book__id', 'book__title', 'book__author', 'book__number_of_pages',
+]
+
+
 class RentalListSerializer(serializers.ModelSerializer):
     student = UserSerializer(read_only=True)
     book = BookBriefSerializer(read_only=True)
@@ -15,6 +25,12 @@ class RentalListSerializer(serializers.ModelSerializer):
         fields = ['id', 'student', 'book', 'rental_date', 'returned', '_rental_fee']
 
 
+# Fast read path for the rental list: same output as RentalListSerializer, built from values() rows.
+rental_list_rows = ValuesSerializer(RentalListSerializer, computed={
+    '_rental_fee': (('rental_date', 'return_date', 'book__number_of_pages'), rental_fee),
+})
+
+
 class RentalUpdateCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rental
@@ -27,6 +43,36 @@ class RentalUpdateCreateSerializer(serializers.ModelSerializer):
         }
 
 
+class BulkCheckoutItemSerializer(serializers.Serializer):
+    # Plain ids: the bulk services look students and books up for the whole request at once.
+    student = serializers.IntegerField(min_value=1)
+    book = serializers.IntegerField(min_value=1)
+
+
+class BulkCheckoutSerializer(serializers.Serializer):
+    rental_date = serializers.DateTimeField(required=False)
+    items = BulkCheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        if len(items) > var_settings.BULK_RENTAL_MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {var_settings.BULK_RENTAL_MAX_ITEMS} books can be rented at once.")
+        return items
+
+
+class BulkReturnSerializer(serializers.Serializer):
+    return_date = serializers.DateTimeField(required=False)
+    rentals = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    items = BulkCheckoutItemSerializer(many=True, required=False, default=list)
+
+    def validate(self, attrs):
+        count = len(attrs['rentals']) + len(attrs['items'])
+        if not count:
+            raise serializers.ValidationError("Give the rentals to return in `rentals` or as student/book `items`.")
+        if count > var_settings.BULK_RENTAL_MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {var_settings.BULK_RENTAL_MAX_ITEMS} rentals can be returned at once.")
+        return attrs
+
+
 class RentalSerializer(serializers.ModelSerializer):
     book = BookBriefSerializer(read_only=True)  # Remove 'many=True'
     rental_duration = serializers.SerializerMethodField()
@@ -40,7 +86,8 @@ class RentalSerializer(serializers.ModelSerializer):
         return obj._rental_duration()
 
     def get_pending_fee(self, obj):
-        return obj._rental_fee()
+        fee = getattr(obj, 'fee', None)
+        return fee.accrued_fee if fee is not None else obj._rental_fee()
 
 
 class StudentRentalSerializer(serializers.ModelSerializer):
@@ -52,4 +99,11 @@ class StudentRentalSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'rentals', 'total_fee']
 
     def get_total_fee(self, obj):
-        return sum(rental._rental_fee() for rental in obj.rental_set.filter(returned=0))
\ No newline at end of file
+        # The fee ledger keeps the total per student; fall back to the rentals for students it has not seen yet.
+        balance = getattr(obj, 'fee_balance', None)
+        if balance is not None:
+            return balance.outstanding_fee
+        rentals = getattr(obj, 'rentals', None)
+        if rentals is None:
+            rentals = obj.rental_set.filter(returned=False).select_related('book')
+        return sum(rental._rental_fee() for rental in rentals if not rental.returned)
\ No newline at end of file
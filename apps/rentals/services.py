@@ -0,0 +1,255 @@
+from django.core.exceptions import ValidationError
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from books.catalogue import invalidate_catalogue
+from books.models import Book, Counter
+from changes.models import Change
+from .dashboard import invalidate_student_dashboard
+from .ledger import LEDGER_BATCH_SIZE, sync_rental_fees
+from .models import Rental, StudentRentalCount, User
+
+
+def checkout(student, book, rental_date=None, created_by=None) -> Rental:
+    """
+    Rents `book` to `student` without racing other checkouts.
+
+    The book is claimed with a conditional `UPDATE books_book SET is_rented = true WHERE id = %s
+    AND is_rented = false`: only one concurrent caller can match the row, and the partial unique
+    constraint on open rentals backs it up. Only is_rented and rental_count are written on the
+    book, and nothing inside the transaction talks to the network. Inactive books cannot be
+    rented, as with checkout_many().
+    Raises:
+        ValidationError: If the book is inactive or already rented (or the dates are invalid).
+    """
+    rental = Rental(student=student, book=book, rental_date=rental_date or timezone.now(), created_by=created_by, last_modified_by=created_by)
+    rental.clean()
+    try:
+        with transaction.atomic():
+            claimed = Book.objects.filter(pk=book.pk, is_active=True, is_rented=False).update(
+                is_rented=True, rental_count=F('rental_count') + 1, last_modified_at=timezone.now(),
+            )
+            if not claimed:
+                raise _unavailable(student, book)
+            Counter.adjust_available_books([book.pk], -1)
+            Change.record(Change.BOOK, [book.pk])
+            invalidate_catalogue()
+            rental.save(sync_book=False)
+    except IntegrityError:
+        raise _unavailable(student, book)
+    book.is_rented = True
+    transaction.on_commit(invalidate_student_dashboard)
+    return rental
+
+
+def _unavailable(student, book) -> ValidationError:
+    if not Book.objects.filter(pk=book.pk, is_active=True).exists():
+        return ValidationError("Book not found.")
+    if Rental.objects.filter(student=student, book=book, returned=False).exists():
+        return ValidationError("You have already rented this book.")
+    return ValidationError("This book is already rented.")
+
+
+def record_returned_rental(student, book, rental_date, return_date, created_by=None) -> Rental:
+    """
+    Records a rental that is already over, e.g. one entered after the fact. The book is neither
+    claimed nor freed, so this works whoever holds the book now; only its rental_count moves.
+    Raises:
+        ValidationError: If the dates are invalid.
+    """
+    rental = Rental(student=student, book=book, rental_date=rental_date, return_date=return_date, created_by=created_by, last_modified_by=created_by)
+    with transaction.atomic():
+        rental.save(sync_book=False)
+        Book.objects.filter(pk=book.pk).update(rental_count=F('rental_count') + 1)
+    return rental
+
+
+def return_rental(rental, return_date=None, modified_by=None) -> Rental:
+    """
+    Marks an open rental as returned and frees its book with two single-row updates.
+    Raises:
+        ValidationError: If the rental was already returned or the return date is invalid.
+    """
+    rental.return_date = return_date or timezone.now()
+    rental.clean()
+    now = timezone.now()
+    with transaction.atomic():
+        returned = Rental.objects.filter(pk=rental.pk, returned=False).update(
+            returned=True, return_date=rental.return_date, last_modified_by=modified_by, last_modified_at=now,
+        )
+        if not returned:
+            raise ValidationError("This rental has already been returned.")
+        if Book.objects.filter(pk=rental.book_id, is_rented=True).update(is_rented=False, last_modified_at=now):
+            Counter.adjust_available_books([rental.book_id], 1)
+            Change.record(Change.BOOK, [rental.book_id])
+        Change.record(Change.RENTAL, [rental.pk])
+        StudentRentalCount.adjust({rental.student_id: (0, -1)})
+        invalidate_catalogue()
+        sync_rental_fees([rental.pk])
+    rental.returned = True
+    rental.last_modified_by = modified_by
+    # As in Rental.save(): the stored row is returned now, so a later save() must not count the return again.
+    rental._loaded_values = {**getattr(rental, '_loaded_values', {}), 'returned': True, 'return_date': rental.return_date}
+    transaction.on_commit(invalidate_student_dashboard)
+    return rental
+
+
+def return_rentals(rentals, return_date=None, modified_by=None, batch_size=LEDGER_BATCH_SIZE) -> int:
+    """
+    Marks the open rentals of the `rentals` queryset as returned, `batch_size` at a time: per batch
+    one UPDATE of the rentals and one freeing their books, then the ledger entries and the rental
+    counters are brought in step. Rentals that started after `return_date` are left open.
+    Returns:
+        int: The number of rentals returned.
+    """
+    return_date = return_date or timezone.now()
+    if return_date > timezone.now():
+        raise ValidationError("Return date cannot be in the future.")
+    # A plain query on the ids, so the rows can be locked whatever joins `rentals` carries.
+    candidates = Rental.objects.filter(pk__in=rentals.values('pk'), returned=False, rental_date__lte=return_date).order_by('pk')
+    total, last_pk = 0, 0
+    while True:
+        with transaction.atomic():
+            rows = list(candidates.filter(pk__gt=last_pk).select_for_update().values_list('pk', 'student_id', 'book_id')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            returned = _close_rentals(rows, return_date, modified_by)
+        total += returned
+    if total:
+        transaction.on_commit(invalidate_student_dashboard)
+    return total
+
+
+def _close_rentals(rows, return_date, modified_by) -> int:
+    """
+    Returns the open rentals of `rows` ((pk, student_id, book_id), locked by the caller) with one UPDATE
+    of the rentals and one freeing their books, then brings the counters and the ledger in step.
+    """
+    now = timezone.now()
+    ids = [pk for pk, student_id, book_id in rows]
+    returned = Rental.objects.filter(pk__in=ids).update(
+        returned=True, return_date=return_date, last_modified_by=modified_by, last_modified_at=now,
+    )
+    # The rentals were the books' open ones (one per book), so every book still flagged is freed.
+    freed = list(Book.objects.select_for_update().filter(pk__in={book_id for pk, student_id, book_id in rows}, is_rented=True).values_list('pk', flat=True))
+    Book.objects.filter(pk__in=freed).update(is_rented=False, last_modified_at=now)
+    Counter.adjust_available_books(freed, 1)
+    Change.record(Change.RENTAL, ids)
+    Change.record(Change.BOOK, freed)
+    closed = defaultdict(int)
+    for pk, student_id, book_id in rows:
+        closed[student_id] += 1
+    StudentRentalCount.adjust({student_id: (0, -count) for student_id, count in closed.items()})
+    invalidate_catalogue()
+    sync_rental_fees(ids)
+    return returned
+
+
+def checkout_many(items, rental_date=None, created_by=None) -> list[dict]:
+    """
+    Rents books to students in bulk: `items` are (student_id, book_id) pairs.
+
+    Everything is checked with set-based queries while the books are locked, then the valid items
+    are applied together: one UPDATE claiming the books, one bulk INSERT of the rentals, and the
+    counters and fee ledger in step. Invalid items are reported and skipped; the others still go through.
+    Returns:
+        list[dict]: One result per item, in order: {'student', 'book', 'rental'} or {'student', 'book', 'error'}.
+    """
+    rental_date = rental_date or timezone.now()
+    items = [(int(student_id), int(book_id)) for student_id, book_id in items]
+    results = [{'student': student_id, 'book': book_id} for student_id, book_id in items]
+    students = set(User.objects.filter(pk__in={student_id for student_id, book_id in items}).values_list('pk', flat=True))
+    with transaction.atomic():
+        books = {
+            pk: (is_active, is_rented)
+            for pk, is_active, is_rented in Book.objects.select_for_update().filter(pk__in={book_id for student_id, book_id in items})
+            .values_list('pk', 'is_active', 'is_rented')
+        }
+        rented = [pk for pk, (is_active, is_rented) in books.items() if is_rented]
+        holders = dict(Rental.objects.open().filter(book_id__in=rented).values_list('book_id', 'student_id')) if rented else {}
+        claimed = {}
+        for index, (student_id, book_id) in enumerate(items):
+            if student_id not in students:
+                results[index]['error'] = "Student not found."
+            elif book_id not in books or not books[book_id][0]:
+                results[index]['error'] = "Book not found."
+            elif book_id in claimed:
+                results[index]['error'] = "This book appears more than once in the request."
+            elif books[book_id][1]:
+                results[index]['error'] = "You have already rented this book." if holders.get(book_id) == student_id else "This book is already rented."
+            else:
+                claimed[book_id] = index
+        if claimed:
+            now = timezone.now()
+            Book.objects.filter(pk__in=claimed).update(is_rented=True, rental_count=F('rental_count') + 1, last_modified_at=now)
+            Counter.adjust_available_books(list(claimed), -1)
+            rentals = Rental.objects.bulk_create([
+                Rental(student_id=items[index][0], book_id=book_id, rental_date=rental_date, created_by=created_by, last_modified_by=created_by)
+                for book_id, index in claimed.items()
+            ])
+            opened = defaultdict(int)
+            for rental, index in zip(rentals, claimed.values()):
+                results[index]['rental'] = rental.pk
+                opened[rental.student_id] += 1
+            StudentRentalCount.adjust({student_id: (count, count) for student_id, count in opened.items()})
+            Change.record(Change.BOOK, list(claimed))
+            Change.record(Change.RENTAL, [rental.pk for rental in rentals])
+            invalidate_catalogue()
+            sync_rental_fees([rental.pk for rental in rentals])
+            transaction.on_commit(invalidate_student_dashboard)
+    return results
+
+
+def return_many(rental_ids=(), pairs=(), return_date=None, modified_by=None) -> list[dict]:
+    """
+    Returns rentals in bulk, given by id in `rental_ids` or as the open rental of each (student_id, book_id) in `pairs`.
+
+    The rentals are looked up and locked with one query, checked, and the valid ones closed together
+    (see return_rentals()). Invalid items are reported and skipped; the others still go through.
+    Returns:
+        list[dict]: One result per item, ids first then pairs: {'rental', 'returned': True} or {'rental', 'error'},
+        carrying 'student' and 'book' for the pairs.
+    Raises:
+        ValidationError: If the return date is in the future.
+    """
+    return_date = return_date or timezone.now()
+    if return_date > timezone.now():
+        raise ValidationError("Return date cannot be in the future.")
+    pairs = [(int(student_id), int(book_id)) for student_id, book_id in pairs]
+    results = [{'rental': int(pk)} for pk in rental_ids] + [{'student': student_id, 'book': book_id, 'rental': None} for student_id, book_id in pairs]
+    if pairs:
+        open_rentals = {
+            (student_id, book_id): pk
+            for pk, student_id, book_id in Rental.objects.open()
+            .filter(student_id__in={student_id for student_id, book_id in pairs}, book_id__in={book_id for student_id, book_id in pairs})
+            .values_list('pk', 'student_id', 'book_id')
+        }
+        for result, pair in zip(results[len(rental_ids):], pairs):
+            result['rental'] = open_rentals.get(pair)
+    with transaction.atomic():
+        rows = {
+            pk: (student_id, book_id, returned, rental_date)
+            for pk, student_id, book_id, returned, rental_date in Rental.objects.select_for_update()
+            .filter(pk__in={result['rental'] for result in results if result['rental'] is not None})
+            .values_list('pk', 'student_id', 'book_id', 'returned', 'rental_date')
+        }
+        closing = {}
+        for result in results:
+            pk = result['rental']
+            if pk not in rows:
+                result['error'] = "No open rental for this student and book." if 'book' in result else "Rental not found."
+            elif pk in closing:
+                result['error'] = "This rental appears more than once in the request."
+            elif rows[pk][2]:
+                result['error'] = "This rental has already been returned."
+            elif rows[pk][3] > return_date:
+                result['error'] = "Return date cannot be earlier than rental date."
+            else:
+                closing[pk] = (pk, *rows[pk][:2])
+                result['returned'] = True
+        if closing:
+            _close_rentals(list(closing.values()), return_date, modified_by)
+            transaction.on_commit(invalidate_student_dashboard)
+    return results
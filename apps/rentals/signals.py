@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from books.models import Book
+from books.signals import book_details_updated
+from .dashboard import invalidate_student_dashboard
+from .ledger import refresh_student_balances, sync_rental_fees
+from .models import Rental, StudentRentalCount
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_delete, sender=Rental)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(book_details_updated, sender=Book)
+def rental_changed(sender, **kwargs):
+    # Fees depend on the rental dates and on the book's page count.
+    invalidate_student_dashboard()
+
+
+@receiver(post_save, sender=Rental)
+def rental_saved(sender, instance, created, **kwargs):
+    # Runs before save() refreshes the loaded state, so the comparison is against the stored row.
+    if created or instance._fee_inputs_changed():
+        sync_rental_fees([instance.pk])
+
+
+@receiver(post_delete, sender=Rental)
+def rental_deleted(sender, instance, origin=None, **kwargs):
+    # The ledger entry goes with the rental; when the student is being deleted too, so are the balance and counters.
+    Book.objects.filter(pk=instance.book_id).update(rental_count=F('rental_count') - 1)
+    origin_model = getattr(origin, 'model', None) or type(origin)
+    if not issubclass(origin_model, User):
+        refresh_student_balances([instance.student_id])
+        StudentRentalCount.adjust({instance.student_id: (-1, -(not instance.returned))})
+
+
+@receiver(post_save, sender=Book)
+@receiver(book_details_updated, sender=Book)
+def book_saved(sender, instance, created=False, **kwargs):
+    # The page count prices the open rentals of the book.
+    if not created:
+        sync_rental_fees(Rental.objects.open().filter(book=instance).values_list('pk', flat=True))
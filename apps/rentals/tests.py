@@ -1,3 +1,927 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.models import Max
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from books.catalogue import catalogue_state
+from books.importer import BookImporter
+from books.models import Book
+from changes.models import Change
+from .archive import archive_rentals, rental_history
+from .counters import available_books, recount, student_rentals
+from .export import export_queryset, iter_export
+from .ledger import accrue_fees, rebuild_ledger
+from .models import ArchivedRental, Rental, RentalFee, StudentFeeBalance, StudentRentalCount
+from .services import checkout, checkout_many, return_many, return_rental, return_rentals
+from bookmate.load_env_vars import var_settings
+from utils.db_router import REPLICA_ALIAS, ReplicaRouter, replica_reads
+from utils.middleware import DatabaseRoutingMiddleware
+import csv, io, json, threading, time
 
-# Create your tests here.
+User = get_user_model()
+LEDGER_TABLES = ('rentals_rental_fee', 'rentals_student_fee_balance')
+COUNTER_TABLES = ('books_counter', 'rentals_student_rental_count')
+CHANGE_LOG_TABLE = 'changes_change'
+
+
+def create_rentals(count, prefix='Book'):
+    rentals = []
+    for i in range(count):
+        student = User.objects.create_user(f"{prefix.lower()}_student_{i}", first_name='Student')
+        book = Book.objects.create(title=f"{prefix} {i}", author='Author', number_of_pages=100 + i)
+        rentals.append(Rental.objects.create(student=student, book=book))
+    return rentals
+
+
+class RentalQueryCountTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_rental_list_query_count_does_not_grow_with_rows(self):
+        create_rentals(2, prefix='First')
+        few = self.count_queries(reverse('rental-list-create'))
+        create_rentals(8, prefix='Second')
+        many = self.count_queries(reverse('rental-list-create'))
+
+        self.assertEqual(few, many)
+
+    def test_book_list_query_count_does_not_grow_with_rows(self):
+        staff = User.objects.get(username='staff')
+        Book.objects.create(title='Lonely', author='Author', number_of_pages=10, created_by=staff, last_modified_by=staff)
+        few = self.count_queries(reverse('book-list'))
+        for i in range(8):
+            Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=10, created_by=staff, last_modified_by=staff)
+        many = self.count_queries(reverse('book-list'))
+
+        self.assertEqual(few, many)
+
+    def test_rental_detail_loads_student_and_book_with_the_rental(self):
+        rental = create_rentals(1)[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('rental-detail', args=[rental.pk]))
+
+        self.assertEqual(response.json()['book']['number_of_pages'], 100)
+        rental_queries = [query['sql'] for query in queries if 'rentals_rental' in query['sql']]
+        self.assertEqual(len(rental_queries), 1)
+        self.assertIn('books_book', rental_queries[0])
+        self.assertFalse(any(query['sql'].startswith('SELECT') and 'FROM "books_book"' in query['sql'] for query in queries))
+
+
+class RentalAnnotationParityTests(TestCase):
+    now = datetime(2024, 6, 1, 0, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        student = User.objects.create_user('student')
+        cases = [
+            # (days rented before now, days kept, pages)
+            (0, None, 100),
+            (30, None, 250),
+            (31, None, 333),
+            (95, None, 480),
+            (120, 40, 150),
+            (200, 200, 99),
+            (45, None, None),
+        ]
+        for i, (rented_days_ago, kept_days, pages) in enumerate(cases):
+            book = Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=pages)
+            rental = Rental.objects.create(student=student, book=book)
+            rental_date = self.now - timedelta(days=rented_days_ago, minutes=2)
+            return_date = rental_date + timedelta(days=kept_days) if kept_days is not None else None
+            Rental.objects.filter(pk=rental.pk).update(rental_date=rental_date, return_date=return_date, returned=return_date is not None)
+        # A return date before the rental date counts as zero days.
+        Rental.objects.filter(book__title='Book 1').update(return_date=self.now - timedelta(days=40))
+
+    def test_sql_duration_and_fee_match_python_methods(self):
+        rentals = Rental.objects.select_related('book').with_duration(now=self.now).with_fee(now=self.now)
+        with mock.patch('rentals.models.timezone.now', return_value=self.now):
+            for rental in rentals:
+                self.assertEqual(rental.rental_duration, rental._rental_duration(), rental.book.title)
+                self.assertEqual(rental.rental_fee, rental._rental_fee(), rental.book.title)
+
+    def test_fee_totals_are_single_aggregate_queries(self):
+        with mock.patch('rentals.models.timezone.now', return_value=self.now):
+            expected = sum(rental._rental_fee() for rental in Rental.objects.open().select_related('book'))
+
+        with self.assertNumQueries(1):
+            total = Rental.objects.open().total_fee(now=self.now)
+        self.assertAlmostEqual(total, expected)
+        self.assertGreater(total, 0)
+
+        with self.assertNumQueries(1):
+            owing = list(Rental.objects.open().fees_by_student(now=self.now).filter(total_fee__gt=1))
+        self.assertEqual(len(owing), 1)
+
+    def test_fast_list_serializer_renders_the_same_bytes(self):
+        User.objects.filter(username='student').update(first_name='Zo\u00eb \u2028', last_name='\U0001F4DA')
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+        def pages(url):
+            contents = []
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                contents.append(response.content)
+                url = response.json()['next']
+            return contents
+
+        with mock.patch('rentals.models.timezone.now', return_value=self.now):
+            fast = pages(reverse('rental-list-create') + '?page_size=3')
+            with mock.patch.object(var_settings, 'FAST_SERIALIZERS', False):
+                expected = pages(reverse('rental-list-create') + '?page_size=3')
+
+        self.assertEqual(len(fast), 3)
+        self.assertEqual(fast, expected)
+        self.assertIn(b'\\u2028', fast[0])
+        self.assertIn('\U0001F4DA'.encode(), fast[0])
+
+
+class RentalAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rentals = create_rentals(3)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.url = reverse('admin:rentals_rental_changelist')
+        # An overdue rental, so the fee column has something to sort.
+        Rental.objects.filter(pk=self.rentals[0].pk).update(rental_date=timezone.now() - timedelta(days=200))
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_fee_and_duration_are_sorted_in_sql_without_exact_counts(self):
+        few = len(self.changelist(o='-7')[1])
+        create_rentals(5, prefix='More')
+        response, queries = self.changelist(o='-7')
+
+        self.assertEqual(len(queries), few)
+        self.assertEqual(response.context['cl'].result_list[0].pk, self.rentals[0].pk)
+        self.assertContains(response, '200 days')
+        self.assertEqual(response.context['cl'].result_count, 8)
+        for sql in queries:
+            if 'COUNT(' in sql:
+                self.assertIn('LIMIT', sql)
+
+    def test_counts_past_the_limit_are_estimated(self):
+        Rental.objects.filter(pk=self.rentals[1].pk).delete()
+        with mock.patch.object(var_settings, 'ADMIN_EXACT_COUNT_LIMIT', 1):
+            self.assertEqual(self.changelist()[0].context['cl'].result_count, 3)  # The span of the ids.
+            self.assertEqual(self.changelist(returned__exact=0)[0].context['cl'].result_count, 1)
+        self.assertEqual(self.changelist()[0].context['cl'].result_count, 2)
+
+    def test_mark_returned_updates_all_selected_rentals_at_once(self):
+        selected = [rental.pk for rental in self.rentals[:2]]
+        version = catalogue_state()[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'action': 'mark_returned', '_selected_action': selected}, follow=True)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+
+        self.assertContains(response, '2 rental(s) marked as returned.')
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "rentals_rental"')]), 1)
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "books_book"')]), 1)
+        self.assertEqual(list(Rental.objects.filter(returned=True).order_by('pk').values_list('pk', flat=True)), selected)
+        self.assertEqual(Book.objects.filter(is_rented=True).count(), 1)
+        self.assertEqual(RentalFee.objects.filter(outstanding=True).count(), 1)
+        self.assertEqual(RentalFee.objects.get(rental=self.rentals[0]).accrued_fee, self.rentals[0].book.number_of_pages * 6 / 100)
+        self.assertGreater(catalogue_state()[0], version)
+
+        again = self.client.post(self.url, {'action': 'mark_returned', '_selected_action': selected}, follow=True)
+        self.assertContains(again, '0 rental(s) marked as returned.')
+
+    def test_forms_look_up_users_and_books_instead_of_listing_them(self):
+        Book.objects.create(title='Book available', author='Author', number_of_pages=10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:rentals_rental_add'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Book available')
+        self.assertFalse([query for query in queries.captured_queries if 'FROM "books_book"' in query['sql']])
+
+        response = self.client.get(reverse('admin:autocomplete'), {'app_label': 'rentals', 'model_name': 'rental', 'field_name': 'book', 'term': 'book'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Book available'])
+        self.assertContains(self.client.get(reverse('admin:rentals_rental_change', args=[self.rentals[0].pk])), 'Book 0')
+
+
+class StudentDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.url = reverse('admin:rental_student_dashboard')
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_lists_only_students_with_pending_rentals_in_constant_queries(self):
+        create_rentals(2, prefix='First')
+        User.objects.create_user('no_rentals')
+        response, few = self.dashboard_queries()
+        self.assertEqual(response.context['student_count'], 2)
+        self.assertNotIn('no_rentals', [student['username'] for student in response.context['student_rentals']])
+
+        cache.clear()
+        create_rentals(8, prefix='Second')
+        response, many = self.dashboard_queries()
+        self.assertEqual(response.context['student_count'], 10)
+        self.assertEqual(few, many)
+
+    def test_pages_are_cached_until_a_rental_changes(self):
+        rental = create_rentals(1)[0]
+        first, uncached = self.dashboard_queries()
+        second, cached = self.dashboard_queries()
+        self.assertLess(cached, uncached)
+        self.assertEqual(second.context['student_count'], 1)
+
+        rental.return_date = rental.rental_date
+        rental.save()
+        third, _ = self.dashboard_queries()
+        self.assertEqual(third.context['student_count'], 0)
+
+
+class AsyncRentalViewTests(TestCase):
+    def setUp(self):
+        self.rentals = create_rentals(3)
+        self.user = User.objects.create_user('staff', is_staff=True)
+
+    async def test_async_views_return_what_the_drf_views_do(self):
+        await self.async_client.aforce_login(self.user)
+        rental = self.rentals[1]
+
+        pairs = [
+            (reverse('rental-list-create'), reverse('rental-list-async')),
+            (reverse('rental-list-create') + '?page_size=2', reverse('rental-list-async') + '?page_size=2'),
+            (reverse('rental-detail', args=[rental.pk]), reverse('rental-detail-async', args=[rental.pk])),
+        ]
+        for sync_url, async_url in pairs:
+            expected = await self.async_client.get(sync_url)
+            response = await self.async_client.get(async_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'])
+            self.assertEqual(response.content.replace(b'rental-list-async', b'rental-list-create'), expected.content)
+
+        missing = await self.async_client.get(reverse('rental-detail-async', args=[0]))
+        self.assertEqual((missing.status_code, missing.json()), (404, {'error': 'Rental not found'}))
+
+    async def test_async_views_are_counted_by_the_request_metrics(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('rental-list-async'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+class CheckoutServiceTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student')
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+
+    def test_checkout_and_return_only_touch_the_rows_involved(self):
+        with CaptureQueriesContext(connection) as queries:
+            rental = checkout(self.student, self.book)
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_rented)
+        book_writes = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "books_book"')]
+        self.assertEqual(len(book_writes), 1)
+        self.assertIn('"is_rented" = ', book_writes[0])
+        self.assertNotIn('"title"', book_writes[0])
+
+        return_rental(rental)
+        rental.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertTrue(rental.returned)
+        self.assertFalse(self.book.is_rented)
+        with self.assertRaises(ValidationError):
+            return_rental(rental)
+
+    def test_saving_a_returned_rental_does_not_count_the_return_twice(self):
+        rental = return_rental(checkout(self.student, self.book))
+        checkout(User.objects.create_user('other'), self.book)
+
+        rental.save()
+
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_rented)
+        self.assertEqual(StudentRentalCount.objects.get(student=self.student).open_rentals, 0)
+
+    def test_rented_book_cannot_be_checked_out_again(self):
+        checkout(self.student, self.book)
+        other = User.objects.create_user('other')
+
+        with self.assertRaisesMessage(ValidationError, "This book is already rented."):
+            checkout(other, self.book)
+        with self.assertRaisesMessage(ValidationError, "You have already rented this book."):
+            checkout(self.student, self.book)
+
+    def test_inactive_book_cannot_be_checked_out(self):
+        Book.objects.filter(pk=self.book.pk).update(is_active=False)
+
+        with self.assertRaisesMessage(ValidationError, "Book not found."):
+            checkout(self.student, self.book)
+        self.assertEqual(checkout_many([(self.student.pk, self.book.pk)])[0]['error'], "Book not found.")
+
+    def test_open_rentals_are_unique_per_book_in_the_database(self):
+        checkout(self.student, self.book)
+        Book.objects.filter(pk=self.book.pk).update(is_rented=False)
+
+        with self.assertRaises(ValidationError):
+            checkout(User.objects.create_user('other'), self.book)
+        with self.assertRaises(IntegrityError):
+            Rental.objects.bulk_create([Rental(student=self.student, book=self.book)])
+
+    def test_api_rejects_renting_a_rented_book(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        other = User.objects.create_user('other')
+        url = reverse('rental-list-create')
+        payload = {'student': self.student.pk, 'book': self.book.pk, 'rental_date': '2024-01-01T00:00:00Z'}
+
+        self.assertEqual(self.client.post(url, payload).status_code, 201)
+        self.assertEqual(self.client.post(url, dict(payload, student=other.pk)).status_code, 400)
+        self.assertEqual(Rental.objects.filter(book=self.book).count(), 1)
+
+    def test_api_records_a_past_rental_of_a_rented_book(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        holder = checkout(User.objects.create_user('holder'), self.book)
+        url = reverse('rental-list-create')
+        payload = {'student': self.student.pk, 'book': self.book.pk, 'rental_date': '2024-01-01T00:00:00Z', 'return_date': '2024-01-20T00:00:00Z'}
+
+        response = self.client.post(url, payload)
+
+        self.assertEqual(response.status_code, 201)
+        past = Rental.objects.get(student=self.student)
+        self.assertTrue(past.returned)
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_rented)
+        self.assertEqual(self.book.rental_count, 2)
+        self.assertEqual(Rental.objects.open().get(book=self.book), holder)
+        self.assertEqual(StudentRentalCount.objects.get(student=self.student).open_rentals, 0)
+        self.assertEqual(self.client.post(url, dict(payload, return_date='2023-12-01T00:00:00Z')).status_code, 400)
+
+
+class RentalWritePathTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student')
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+        self.other_book = Book.objects.create(title='Emma', author='Jane Austen', number_of_pages=474)
+
+    def is_rented(self, book):
+        return Book.objects.values_list('is_rented', flat=True).get(pk=book.pk)
+
+    def statements(self, operation, ledger=False):
+        with CaptureQueriesContext(connection) as queries:
+            operation()
+        return [
+            query['sql'].split()[0] for query in queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE')) and ledger == any(table in query['sql'] for table in LEDGER_TABLES)
+            and not any(f'UPDATE "{table}"' in query['sql'] for table in COUNTER_TABLES)
+            and f'INSERT INTO "{CHANGE_LOG_TABLE}"' not in query['sql']
+        ]
+
+    def test_save_writes_only_the_rental_and_the_books_flag(self):
+        rental = Rental.objects.create(student=self.student, book=self.book)
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.return_date = timezone.now()
+
+        self.assertEqual(self.statements(rental.save), ['UPDATE', 'UPDATE'])
+        self.assertFalse(self.is_rented(self.book))
+
+        rental.last_modified_by = self.student
+        self.assertEqual(self.statements(rental.save), ['UPDATE'])
+        self.assertEqual(self.statements(rental.save, ledger=True), [])
+
+    def test_moving_a_rental_to_another_book_frees_the_old_one(self):
+        rental = Rental.objects.create(student=self.student, book=self.book)
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.book = self.other_book
+        rental.save()
+
+        self.assertFalse(self.is_rented(self.book))
+        self.assertTrue(self.is_rented(self.other_book))
+
+    def test_deleting_an_open_rental_frees_the_book(self):
+        rental = Rental.objects.create(student=self.student, book=self.book)
+        Rental.objects.get(pk=rental.pk).delete()
+
+        self.assertFalse(self.is_rented(self.book))
+
+
+class BulkRentalTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.students = [User.objects.create_user(f"student_{i}") for i in range(3)]
+        self.books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100 + i) for i in range(25)]
+
+    def class_set(self, count):
+        return [(self.students[i % 3].pk, book.pk) for i, book in enumerate(self.books[:count])]
+
+    def test_checkout_many_reports_each_item_and_applies_the_valid_ones(self):
+        checkout(self.students[0], self.books[0])
+        checkout(self.students[1], self.books[1])
+        items = [
+            (self.students[0].pk, self.books[0].pk), (self.students[0].pk, self.books[1].pk), (0, self.books[2].pk),
+            (self.students[2].pk, self.books[3].pk), (self.students[1].pk, self.books[3].pk), (self.students[2].pk, self.books[4].pk),
+        ]
+
+        results = checkout_many(items, created_by=self.staff)
+
+        self.assertEqual([result.get('error') for result in results], [
+            "You have already rented this book.", "This book is already rented.", "Student not found.",
+            None, "This book appears more than once in the request.", None,
+        ])
+        rentals = Rental.objects.filter(pk__in=[results[3]['rental'], results[5]['rental']])
+        self.assertEqual(set(rentals.values_list('student', 'book', 'created_by')), {
+            (self.students[2].pk, self.books[3].pk, self.staff.pk), (self.students[2].pk, self.books[4].pk, self.staff.pk),
+        })
+        self.assertEqual(RentalFee.objects.filter(rental__in=rentals).count(), 2)
+        self.assertEqual(student_rentals(self.students[2].pk), (2, 2))
+        self.assertEqual(recount(fix=False)['available_books']['drift'], 0)
+
+    def test_statements_do_not_grow_with_the_batch(self):
+        def bulk_statements(operation):
+            with CaptureQueriesContext(connection) as queries:
+                operation()
+            return [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+        small = bulk_statements(lambda: checkout_many(self.class_set(2)))
+        large = bulk_statements(lambda: checkout_many(self.class_set(25)[2:]))
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(sum(sql.startswith('UPDATE "books_book"') for sql in large), 1)
+
+        # Student counters take one UPDATE per distinct delta, so both batches return as many rentals per student.
+        rental_ids = list(Rental.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(len(bulk_statements(lambda: return_many(rental_ids[:3]))), len(bulk_statements(lambda: return_many(rental_ids[3:24]))))
+
+    def test_return_many_takes_ids_and_student_book_pairs(self):
+        results = checkout_many(self.class_set(4))
+        rental_ids = [result['rental'] for result in results]
+        return_rental(Rental.objects.get(pk=rental_ids[3]))
+
+        results = return_many(
+            rental_ids=[rental_ids[0], rental_ids[0], rental_ids[3], 0],
+            pairs=[(self.students[1].pk, self.books[1].pk), (self.students[0].pk, self.books[2].pk)],
+            modified_by=self.staff,
+        )
+
+        self.assertEqual([result.get('error') for result in results], [
+            None, "This rental appears more than once in the request.", "This rental has already been returned.",
+            "Rental not found.", None, "No open rental for this student and book.",
+        ])
+        self.assertEqual(results[4]['rental'], rental_ids[1])
+        self.assertEqual(list(Rental.objects.filter(returned=True).order_by('pk').values_list('pk', flat=True)), [rental_ids[0], rental_ids[1], rental_ids[3]])
+        self.assertEqual(list(Book.objects.filter(is_rented=True).values_list('pk', flat=True)), [self.books[2].pk])
+        self.assertEqual(Rental.objects.get(pk=rental_ids[0]).last_modified_by, self.staff)
+        drift = recount(fix=False)
+        self.assertEqual((drift['books']['drift'], drift['students']['drift'], drift['available_books']['drift']), (0, 0, 0))
+        with self.assertRaisesMessage(ValidationError, "Return date cannot be in the future."):
+            return_many([rental_ids[2]], return_date=timezone.now() + timedelta(days=1))
+
+    def test_endpoints(self):
+        self.client.force_login(self.staff)
+        checkout_url, return_url = reverse('rental-bulk-checkout'), reverse('rental-bulk-return')
+        items = [{'student': student_id, 'book': book_id} for student_id, book_id in self.class_set(3)]
+
+        response = self.client.post(checkout_url, {'rental_date': '2024-01-01T00:00:00Z', 'items': items + items[:1]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['succeeded'], response.json()['failed']), (3, 1))
+
+        response = self.client.post(return_url, {'items': items[:2], 'rentals': [response.json()['results'][2]['rental']]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['succeeded'], 3)
+        self.assertFalse(Book.objects.filter(is_rented=True).exists())
+
+        self.assertEqual(self.client.post(checkout_url, {'items': []}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(return_url, {}, content_type='application/json').status_code, 400)
+        with mock.patch.object(var_settings, 'BULK_RENTAL_MAX_ITEMS', 2):
+            self.assertEqual(self.client.post(checkout_url, {'items': items}, content_type='application/json').status_code, 400)
+
+
+class RentalCounterTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student')
+        self.other = User.objects.create_user('other')
+        self.books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100 + i) for i in range(3)]
+
+    def rental_counts(self):
+        return list(Book.objects.order_by('pk').values_list('rental_count', flat=True))
+
+    def assert_counters_match_a_recount(self):
+        drift = recount(fix=False)
+        self.assertEqual((drift['books']['drift'], drift['students']['drift'], drift['available_books']['drift']), (0, 0, 0))
+
+    def test_checkout_return_and_bulk_return_keep_the_counters(self):
+        self.assertEqual(available_books(), 3)
+        rental = checkout(self.student, self.books[0])
+        checkout(self.student, self.books[1])
+        checkout(self.other, self.books[2])
+        self.assertEqual((available_books(), student_rentals(self.student.pk), self.rental_counts()), (0, (2, 2), [1, 1, 1]))
+
+        return_rental(rental)
+        self.assertEqual((available_books(), student_rentals(self.student.pk)), (1, (2, 1)))
+        checkout(self.other, self.books[0])
+        self.assertEqual((available_books(), student_rentals(self.other.pk), self.rental_counts()), (0, (2, 2), [2, 1, 1]))
+
+        self.assertEqual(return_rentals(Rental.objects.all()), 3)
+        self.assertEqual((available_books(), student_rentals(self.student.pk), student_rentals(self.other.pk)), (3, (2, 0), (2, 0)))
+        self.assert_counters_match_a_recount()
+
+    def test_saving_moving_and_deleting_rentals_and_books_keep_the_counters(self):
+        rental = Rental.objects.create(student=self.student, book=self.books[0])
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.book, rental.student = self.books[1], self.other
+        rental.save()
+        self.assertEqual((self.rental_counts(), student_rentals(self.student.pk), student_rentals(self.other.pk)), ([0, 1, 0], (0, 0), (1, 1)))
+        self.assertEqual(available_books(), 2)
+
+        # A stale copy of the book must not write its rental_count back.
+        book = Book.objects.get(pk=self.books[2].pk)
+        return_rental(checkout(self.student, self.books[2]))
+        book.is_active = False
+        book.save()
+        self.assertEqual((self.rental_counts(), available_books()), ([0, 1, 1], 1))
+
+        Rental.objects.get(pk=rental.pk).delete()
+        self.books[0].delete()
+        self.assertEqual((self.rental_counts(), available_books()), ([0, 1], 1))
+        self.assertEqual((student_rentals(self.student.pk), student_rentals(self.other.pk)), ((1, 0), (0, 0)))
+        self.assert_counters_match_a_recount()
+
+    def test_imported_books_are_counted_as_available(self):
+        BookImporter().run(io.StringIO("title,author,number_of_pages\nEmma,Jane Austen,474\nDune,Frank Herbert,412\n"), 'csv')
+
+        self.assertEqual(available_books(), 5)
+        self.assert_counters_match_a_recount()
+
+    def test_recount_reports_and_fixes_drift(self):
+        checkout(self.student, self.books[0])
+        Book.objects.filter(pk=self.books[1].pk).update(rental_count=4)
+        Book.objects.filter(pk=self.books[2].pk).update(is_rented=True)
+        StudentRentalCount.objects.filter(student=self.student).delete()
+
+        output = io.StringIO()
+        call_command('recount', dry_run=True, stdout=output)
+        self.assertIn("Checked 3 book rental counts: found 1 drifted by 4 in total.", output.getvalue())
+        self.assertIn("Checked 1 student rental counts: found 1 drifted by 2 in total.", output.getvalue())
+        self.assertIn("Available books: counter 2, actual 1 (found drift 1).", output.getvalue())
+        self.assertEqual(self.rental_counts(), [1, 4, 0])
+
+        call_command('recount', batch_size=2, stdout=io.StringIO())
+        self.assertEqual((self.rental_counts(), student_rentals(self.student.pk), available_books()), ([1, 0, 0], (1, 1), 1))
+        self.assert_counters_match_a_recount()
+
+
+class FeeLedgerTests(TestCase):
+    now = datetime(2024, 6, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.student = User.objects.create_user('student')
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=400)
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            self.rental = Rental.objects.create(student=self.student, book=self.book, rental_date=self.now - timedelta(days=25))
+
+    def balance(self):
+        return StudentFeeBalance.objects.values_list('outstanding_fee', 'open_rentals').get(student=self.student)
+
+    def test_accrual_only_touches_rentals_crossing_a_billing_boundary(self):
+        entry = RentalFee.objects.get(rental=self.rental)
+        self.assertEqual((entry.accrued_fee, entry.next_accrual_on), (0.0, (self.now + timedelta(days=6)).date()))
+        cursor = Change.objects.aggregate(cursor=Max('pk'))['cursor']
+        self.assertEqual(accrue_fees(now=self.now + timedelta(days=5)), {'accrued': 0, 'created': 0})
+        self.assertFalse(Change.objects.filter(pk__gt=cursor).exists())
+
+        self.assertEqual(accrue_fees(now=self.now + timedelta(days=6)), {'accrued': 1, 'created': 0})
+        self.assertEqual(self.balance(), (4.0, 1))
+        # Clients syncing the rental list pick up the new fee.
+        self.assertEqual(list(Change.objects.filter(pk__gt=cursor).values_list('entity', 'object_id')), [(Change.RENTAL, self.rental.pk)])
+        self.assertEqual(RentalFee.objects.get(rental=self.rental).next_accrual_on, (self.now + timedelta(days=36)).date())
+
+        later = self.now + timedelta(days=40)
+        accrue_fees(now=later)
+        with mock.patch('rentals.models.timezone.now', return_value=later):
+            self.assertEqual(self.balance(), (Rental.objects.get()._rental_fee(), 1))
+
+    def test_rental_and_book_changes_update_the_ledger(self):
+        self.book.number_of_pages = 800
+        self.book.save()
+        self.assertEqual(self.balance()[0], Rental.objects.get()._rental_fee())
+        self.assertGreater(self.balance()[0], 0)
+
+        return_rental(self.rental, return_date=timezone.now())
+        self.assertEqual(self.balance(), (0.0, 0))
+        self.assertFalse(RentalFee.objects.get(rental=self.rental).outstanding)
+
+        Rental.objects.create(student=self.student, book=Book.objects.create(title='Emma', author='Jane Austen', number_of_pages=474))
+        self.assertEqual(self.balance(), (0.0, 1))
+        Rental.objects.get(book__title='Emma').delete()
+        self.assertEqual(self.balance(), (0.0, 0))
+
+        self.student.delete()
+        self.assertFalse(StudentFeeBalance.objects.exists())
+
+    def test_bulk_loaded_rentals_are_picked_up_by_the_job(self):
+        other = User.objects.create_user('other')
+        Rental.objects.bulk_create([Rental(student=other, book=Book.objects.create(title='Emma', number_of_pages=200), rental_date=self.now - timedelta(days=90))])
+
+        self.assertEqual(accrue_fees(now=self.now), {'accrued': 0, 'created': 1})
+        self.assertEqual(StudentFeeBalance.objects.get(student=other).outstanding_fee, 4.0)
+        self.assertEqual(rebuild_ledger(now=self.now), 2)
+
+        output = io.StringIO()
+        call_command('accrue_fees', stdout=output)
+        self.assertIn('Accrued', output.getvalue())
+
+
+class RentalExportTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.alice = User.objects.create_user('alice', email='alice@example.com')
+        bob = User.objects.create_user('bob')
+        dune = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+        emma = Book.objects.create(title='Emma', author='Jane Austen', number_of_pages=474)
+        self.overdue = Rental.objects.create(student=self.alice, book=dune, rental_date=now - timedelta(days=100))
+        self.returned = Rental.objects.create(student=bob, book=emma, rental_date=now - timedelta(days=10), return_date=now - timedelta(days=2))
+
+    def export(self, output_format='csv', **params):
+        self.client.force_login(User.objects.get_or_create(username='finance', is_staff=True)[0])
+        response = self.client.get(reverse('rental-export'), dict(params, output_format=output_format))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_has_one_row_per_rental_with_its_fees(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+
+        self.assertEqual([int(row['id']) for row in rows], [self.overdue.pk, self.returned.pk])
+        self.assertEqual(rows[0]['student_email'], 'alice@example.com')
+        self.assertEqual(float(rows[0]['rental_fee']), round(self.overdue._rental_fee(), 2))
+        self.assertEqual(float(rows[0]['outstanding_fee']), float(rows[0]['rental_fee']))
+        self.assertEqual((rows[1]['returned'], rows[1]['rental_duration'], rows[1]['outstanding_fee']), ('True', '8', '0.0'))
+
+    def test_jsonl_export_applies_the_filters(self):
+        def ids(**params):
+            return [json.loads(line)['id'] for line in self.export('jsonl', **params).splitlines()]
+
+        self.assertEqual(ids(returned='false'), [self.overdue.pk])
+        self.assertEqual(ids(student='bob'), [self.returned.pk])
+        self.assertEqual(ids(student=self.alice.pk), [self.overdue.pk])
+        self.assertEqual(ids(date_from=(timezone.now() - timedelta(days=30)).date().isoformat()), [self.returned.pk])
+        self.assertEqual(ids(date_to=(timezone.now() - timedelta(days=30)).isoformat()), [self.overdue.pk])
+
+    def test_export_is_restricted_and_validated(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(reverse('rental-export')).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('finance', is_staff=True))
+        self.assertEqual(self.client.get(reverse('rental-export'), {'output_format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('rental-export'), {'date_from': 'yesterday'}).status_code, 400)
+
+    def test_command_streams_the_same_rows(self):
+        output = io.StringIO()
+        call_command('export_rentals', format='jsonl', returned='true', chunk_size=1, stdout=output)
+
+        self.assertEqual([json.loads(line)['book_title'] for line in output.getvalue().splitlines()], ['Emma'])
+
+
+class RentalArchiveTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.student = User.objects.create_user('student')
+        self.books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100 + 100 * i) for i in range(4)]
+        self.old = [
+            Rental.objects.create(student=self.student, book=book, rental_date=now - timedelta(days=400 + i), return_date=now - timedelta(days=300 + i))
+            for i, book in enumerate(self.books[:3])
+        ]
+        self.recent = Rental.objects.create(student=self.student, book=self.books[0], rental_date=now - timedelta(days=50), return_date=now - timedelta(days=5))
+        self.open = Rental.objects.create(student=self.student, book=self.books[3], rental_date=now - timedelta(days=60))
+
+    def test_archiving_moves_old_returned_rentals_in_resumable_batches(self):
+        history = rental_history(student=self.student.pk)
+        created_at = Rental.objects.get(pk=self.old[0].pk).created_at
+
+        self.assertEqual(archive_rentals(timedelta(days=90), batch_size=2, limit=1), 1)
+        self.assertEqual(archive_rentals(timedelta(days=90), batch_size=2), 2)
+        self.assertEqual(archive_rentals(timedelta(days=90)), 0)
+
+        self.assertEqual(set(Rental.objects.values_list('pk', flat=True)), {self.recent.pk, self.open.pk})
+        archived = ArchivedRental.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.book_id, archived.returned, archived.created_at), (self.books[0].pk, True, created_at))
+        self.assertFalse(RentalFee.objects.filter(rental_id__in=[rental.pk for rental in self.old]).exists())
+        # Archived rentals stay part of the history and of the counters.
+        self.assertEqual(rental_history(student=self.student.pk), [dict(row, archived=row['id'] in {r.pk for r in self.old}) for row in history])
+        self.assertEqual(student_rentals(self.student.pk), (5, 1))
+        drift = recount(fix=False)
+        self.assertEqual((drift['books']['drift'], drift['students']['drift']), (0, 0))
+
+    def test_history_endpoint_pages_across_both_tables(self):
+        archive_rentals(timedelta(days=90))
+        self.client.force_login(self.student)
+
+        response = self.client.get(reverse('rental-history'), {'student': self.student.pk, 'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        response = self.client.get(first['next'])
+        second = response.json()
+
+        rows = first['results'] + second['results']
+        self.assertEqual([row['id'] for row in rows], [self.open.pk, self.recent.pk] + [rental.pk for rental in reversed(self.old)])
+        self.assertEqual([row['archived'] for row in rows], [False, False, True, True, True])
+        self.assertIsNone(second['next'])
+        self.assertEqual(rows[-1]['rental_fee'], self.old[0]._rental_fee())
+        self.assertEqual([row['id'] for row in self.client.get(reverse('rental-history'), {'book': self.books[0].pk}).json()['results']], [self.recent.pk, self.old[0].pk])
+        self.assertEqual(self.client.get(reverse('rental-history'), {'before': 'x'}).status_code, 400)
+
+    def test_exports_include_the_archive(self):
+        expected = list(iter_export(export_queryset(now=timezone.now()), 'csv'))
+        archive_rentals(timedelta(days=90))
+
+        self.assertEqual(len(list(iter_export(export_queryset(now=timezone.now()), 'csv'))), len(expected))
+        self.assertEqual([row['id'] for row in export_queryset(returned=True, student='student')], [rental.pk for rental in self.old] + [self.recent.pk])
+        self.assertEqual([row['id'] for row in export_queryset(returned=False)], [self.open.pk])
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('archive_rentals', older_than=90, dry_run=True, stdout=output)
+        self.assertIn("3 rentals returned more than 90 days ago can be archived.", output.getvalue())
+        self.assertEqual(ArchivedRental.objects.count(), 0)
+
+        call_command('archive_rentals', older_than=90, batch_size=2, stdout=output)
+        self.assertIn("Archived 3 rentals", output.getvalue())
+        self.assertEqual(ArchivedRental.objects.count(), 3)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes_on_a_seeded_dataset(self):
+        output = io.StringIO()
+        call_command('check_query_plans', rentals=5000, stdout=output)
+
+        self.assertNotIn('FULL SCAN', output.getvalue())
+        self.assertFalse(Rental.objects.exists())
+
+
+class SeedAndBenchmarkTests(TransactionTestCase):
+    def test_seed_then_benchmark_in_process_and_over_http(self):
+        call_command('seed', users=5, books=40, rentals=60, stdout=io.StringIO())
+        self.assertEqual((User.objects.count(), Book.objects.count(), Rental.objects.count()), (5, 40, 60))
+        self.assertEqual(RentalFee.objects.count(), 6)
+        self.assertEqual(recount(fix=False)['books']['drift'], 0)
+        self.assertEqual(sum(Book.objects.values_list('rental_count', flat=True)), 60)
+
+        for mode, async_views in (('inprocess', False), ('http', False), ('asgi', False), ('asgi', True)):
+            output = io.StringIO()
+            call_command('benchmark_api', mode=mode, async_views=async_views, requests=4, warmup=1, concurrency=2, targets=['book_list', 'rental_detail', 'student_dashboard'], stdout=output)
+            report = json.loads(output.getvalue())
+
+            self.assertEqual(report['meta']['dataset']['rentals'], 60)
+            for name, result in report['results'].items():
+                self.assertEqual((result['requests'], result['errors']), (4, 0), name)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries_mean'], 0)
+
+        output = io.StringIO()
+        call_command('benchmark_api', requests=1, warmup=0, targets=['rental_list'], serializer_rows=30, stdout=output)
+        for name, result in json.loads(output.getvalue())['serializers'].items():
+            self.assertEqual((result['rows'], result['identical']), (30, True), name)
+            self.assertGreater(result['speedup'], 0)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Adds a `replica` alias pointing at the test database, the way two SQLite files are used locally.
+    """
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings[REPLICA_ALIAS] = dict(connections['default'].settings_dict)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user('student', is_staff=True)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', number_of_pages=412)
+        self.client.force_login(self.student)
+
+    def list_rentals(self):
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            response = self.client.get(reverse('rental-list-create'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(replica_queries)
+
+    def test_router_sends_only_replica_reads_there_until_a_write(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Rental), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Rental), REPLICA_ALIAS)
+            self.assertEqual(router.db_for_write(Session), 'default')
+            self.assertEqual(router.db_for_write(User), 'default')
+            self.assertEqual(router.db_for_read(Rental), REPLICA_ALIAS)
+            self.assertEqual(router.db_for_write(Rental), 'default')
+            self.assertEqual(router.db_for_read(Rental), 'default')
+
+    def test_logging_in_does_not_pin_the_client(self):
+        self.client.logout()
+        User.objects.create_user('reader', password='reader', is_staff=True)
+        response = self.client.post(reverse('admin:login'), {'username': 'reader', 'password': 'reader'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(DatabaseRoutingMiddleware.cookie_name, response.cookies)
+
+    def test_list_views_and_export_read_from_the_replica(self):
+        Rental.objects.create(student=self.student, book=self.book)
+        response, replica_queries = self.list_rentals()
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertGreater(replica_queries, 0)
+        self.assertNotIn(DatabaseRoutingMiddleware.cookie_name, response.cookies)
+
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            self.assertEqual(self.client.get(reverse('book-list')).status_code, 200)
+            response = self.client.get(reverse('rental-export'))
+            self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 2)
+        self.assertGreaterEqual(len(replica_queries), 2)
+
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            response = self.client.get(reverse('book-search'), {'q': 'dune'})
+        self.assertEqual([book['title'] for book in response.json()], ['Dune'])
+        self.assertGreaterEqual(len(replica_queries), 2)
+
+    def test_writing_client_reads_its_own_writes_from_the_primary(self):
+        response = self.client.post(reverse('rental-list-create'), {'student': self.student.pk, 'book': self.book.pk, 'rental_date': timezone.now().isoformat()})
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[DatabaseRoutingMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], var_settings.DB_REPLICA_STICKINESS)
+        self.assertEqual(response[DatabaseRoutingMiddleware.header_name], cookie.value)
+        until = cookie.value
+
+        response, replica_queries = self.list_rentals()
+        self.assertEqual(replica_queries, 0)
+        self.assertEqual(len(response.json()['results']), 1)
+
+        self.client.cookies[DatabaseRoutingMiddleware.cookie_name] = str(time.time() - 1)
+        self.assertGreater(self.list_rentals()[1], 0)
+
+        # Clients without cookies pin themselves by echoing the header.
+        self.client.cookies.clear()
+        self.client.force_login(self.student)
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            self.client.get(reverse('rental-list-create'), headers={DatabaseRoutingMiddleware.header_name: until})
+        self.assertEqual(len(replica_queries), 0)
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    workers = 8
+    rounds = 5
+
+    def test_parallel_checkouts_never_double_rent_a_book(self):
+        students = [User.objects.create_user(f"student_{i}") for i in range(self.workers)]
+        books = [Book.objects.create(title=f"Book {i}", author='Author', number_of_pages=100) for i in range(self.rounds)]
+
+        for book in books:
+            barrier = threading.Barrier(self.workers)
+            outcomes = []
+
+            def rent(student):
+                try:
+                    barrier.wait()
+                    for attempt in range(50):
+                        try:
+                            checkout(student, Book.objects.get(pk=book.pk))
+                            outcomes.append('rented')
+                            return
+                        except OperationalError:
+                            time.sleep(0.005 * attempt)  # SQLite "database is locked": retry like a client would.
+                        except ValidationError:
+                            outcomes.append('refused')
+                            return
+                finally:
+                    connections.close_all()
+
+            threads = [threading.Thread(target=rent, args=(student,)) for student in students]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(outcomes), self.workers)
+            self.assertEqual(outcomes.count('rented'), 1, outcomes)
+            self.assertEqual(Rental.objects.filter(book=book, returned=False).count(), 1)
+            self.assertTrue(Book.objects.get(pk=book.pk).is_rented)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RentalRetrieveUpdateDestroyView, RentalListCreateView
+from .views import AsyncRentalDetailView, AsyncRentalListView, RentalBulkCheckoutView, RentalBulkReturnView, RentalExportView, RentalHistoryView, RentalRetrieveUpdateDestroyView, RentalListCreateView
 from .admin import RentalAdmin
 
 
@@ -7,4 +7,10 @@ urlpatterns = [
     # path('admin/rentals/student-dashboard/', RentalAdmin.student_dashboard_view, name='admin_student_dashboard'),
     path('rental-list-create/', RentalListCreateView.as_view(), name='rental-list-create'),
     path('rental-action/<int:pk>/', RentalRetrieveUpdateDestroyView.as_view(), name='rental-detail'),
+    path('rental-bulk-checkout/', RentalBulkCheckoutView.as_view(), name='rental-bulk-checkout'),
+    path('rental-bulk-return/', RentalBulkReturnView.as_view(), name='rental-bulk-return'),
+    path('rental-list-async/', AsyncRentalListView.as_view(), name='rental-list-async'),
+    path('rental-detail-async/<int:pk>/', AsyncRentalDetailView.as_view(), name='rental-detail-async'),
+    path('rental-history/', RentalHistoryView.as_view(), name='rental-history'),
+    path('rental-export/', RentalExportView.as_view(), name='rental-export'),
 ]
@@ -1,16 +1,32 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
-from django.core.exceptions import ObjectDoesNotExist
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
 from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from bookmate.load_env_vars import var_settings
+from utils.async_views import AsyncReadView
+from utils.fast_serializers import FastListMixin
+from utils.db_router import ReplicaReadMixin, read_alias, replica_reads
+from .archive import rental_history
+from .export import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_queryset, iter_export, parse_boundary, parse_returned
 from .models import Rental
-from .serializers import RentalUpdateCreateSerializer, RentalListSerializer
+from .services import checkout, checkout_many, record_returned_rental, return_many
+from .serializers import RENTAL_LIST_FIELDS, BulkCheckoutSerializer, BulkReturnSerializer, RentalUpdateCreateSerializer, RentalListSerializer, rental_list_rows
 
 
-class RentalListCreateView(generics.ListCreateAPIView):
+class RentalListCreateView(ReplicaReadMixin, FastListMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
-    queryset = Rental.objects.all()
+    queryset = Rental.objects.select_related('student', 'book').order_by('-created_at', '-id')
+    fast_serializer = rental_list_rows
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            queryset = queryset.only(*RENTAL_LIST_FIELDS)
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -28,14 +44,15 @@ class RentalListCreateView(generics.ListCreateAPIView):
         try:
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            student = serializer.validated_data['student']
-            book = serializer.validated_data['book']
-            
-            if Rental.objects.filter(student=student, book=book, returned=False).exists():
-                error_str = "You have already rented this book."
-                return self.handle_exception(ValidationError(error_str))
-            
-            serializer.save(created_by=self.request.user)
+            data = serializer.validated_data
+            try:
+                if data.get('return_date'):
+                    # A rental that is already over does not take the book from whoever holds it now.
+                    serializer.instance = record_returned_rental(data['student'], data['book'], data['rental_date'], data['return_date'], created_by=self.request.user)
+                else:
+                    serializer.instance = checkout(student=data['student'], book=data['book'], rental_date=data['rental_date'], created_by=self.request.user)
+            except DjangoValidationError as e:
+                return self.handle_exception(ValidationError(e.messages))
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
         except ValidationError as e:
@@ -44,11 +61,42 @@ class RentalListCreateView(generics.ListCreateAPIView):
             return self.handle_exception(e)
 
 
+class AsyncRentalListView(AsyncReadView):
+    """
+    Async version of RentalListCreateView's GET.
+    """
+    queryset = Rental.objects.select_related('student', 'book').only(*RENTAL_LIST_FIELDS)
+
+    async def get(self, request, *args, **kwargs):
+        with replica_reads():
+            return self.render(await self.paginated_data(self.queryset.all(), RentalListSerializer, rental_list_rows))
+
+
+class AsyncRentalDetailView(AsyncReadView):
+    """
+    Async version of RentalRetrieveUpdateDestroyView's GET.
+    """
+    queryset = AsyncRentalListView.queryset
+
+    async def get(self, request, pk, *args, **kwargs):
+        try:
+            rental = await self.queryset.aget(pk=pk)
+        except Rental.DoesNotExist:
+            return self.render({'error': 'Rental not found'}, status.HTTP_404_NOT_FOUND)
+        return self.render(RentalListSerializer(rental).data)
+
+
 class RentalRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
-    queryset = Rental.objects.all()
+    queryset = Rental.objects.select_related('student', 'book')
     serializer_class = RentalUpdateCreateSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            queryset = queryset.only(*RENTAL_LIST_FIELDS)
+        return queryset
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RentalListSerializer
@@ -86,4 +134,133 @@ class RentalRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
             self.perform_destroy(instance)
             return Response({'success': 'Rental deleted successfully'}, status=status.HTTP_200_OK)
         except Exception as exc:
-            return self.handle_exception(exc)
\ No newline at end of file
+            return self.handle_exception(exc)
+
+
+class BulkRentalView(generics.GenericAPIView):
+    """
+    Base for the bulk endpoints: the request is validated as a whole, then applied by a service that
+    handles every item in one transaction and reports on each; invalid items do not stop the others.
+    Responds with {"succeeded": n, "failed": n, "results": [...]}.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def apply(self, data) -> list[dict]:
+        raise NotImplementedError
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results = self.apply(serializer.validated_data)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        failed = sum('error' in result for result in results)
+        return Response({'succeeded': len(results) - failed, 'failed': failed, 'results': results})
+
+
+class RentalBulkCheckoutView(BulkRentalView):
+    """
+    Rents many books at once.
+
+    Body: {"rental_date": optional, "items": [{"student": id, "book": id}, ...]}
+    Each result carries the new rental's id, or the error that kept the item from being rented.
+    """
+    serializer_class = BulkCheckoutSerializer
+
+    def apply(self, data):
+        items = [(item['student'], item['book']) for item in data['items']]
+        return checkout_many(items, rental_date=data.get('rental_date'), created_by=self.request.user)
+
+
+class RentalBulkReturnView(BulkRentalView):
+    """
+    Returns many rentals at once, e.g. a class set.
+
+    Body: {"return_date": optional, "rentals": [id, ...], "items": [{"student": id, "book": id}, ...]}
+    A student/book item stands for that student's open rental of the book. Results list the
+    `rentals` first, then the `items`.
+    """
+    serializer_class = BulkReturnSerializer
+
+    def apply(self, data):
+        return return_many(
+            rental_ids=data['rentals'], pairs=[(item['student'], item['book']) for item in data['items']],
+            return_date=data.get('return_date'), modified_by=self.request.user,
+        )
+
+
+class RentalHistoryView(generics.GenericAPIView):
+    """
+    Rental history across the working table and the archive, newest first.
+
+    Query params:
+        student, book: Filter by student or book id.
+        before: Rentals with a lower id; follow `next` instead of setting it.
+        page_size: Rows per page, API_PAGE_SIZE by default and at most API_MAX_PAGE_SIZE.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            filters = {name: int(params[name]) if params.get(name) else None for name in ('student', 'book', 'before')}
+            page_size = min(max(int(params.get('page_size') or var_settings.API_PAGE_SIZE), 1), var_settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': "student, book, before and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        with replica_reads():
+            rows = rental_history(limit=page_size + 1, **filters)
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', rows[-1]['id'])
+        results = [
+            {
+                'id': row['id'],
+                'student': row['student_id'],
+                'book': {'id': row['book_id'], 'title': row['book__title'], 'author': row['book__author']},
+                'rental_date': row['rental_date'],
+                'return_date': row['return_date'],
+                'returned': row['returned'],
+                'rental_duration': row['rental_duration'],
+                'rental_fee': row['rental_fee'],
+                'archived': row['archived'],
+            }
+            for row in rows
+        ]
+        return Response({'next': next_url, 'results': results})
+
+
+class RentalExportView(generics.GenericAPIView):
+    """
+    Streams rentals with their duration and fees as CSV or JSONL.
+
+    Query params:
+        output_format: `csv` (default) or `jsonl`.
+        date_from, date_to: Rental date range (ISO dates or datetimes), end exclusive.
+        returned: `true` or `false`.
+        student: Student id or username.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        output_format = params.get('output_format', 'csv')
+        if output_format not in EXPORT_FORMATS:
+            return Response({'error': f"Unsupported format '{output_format}'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # The rows are streamed after the view returns, so the queryset is bound to its database here.
+            with replica_reads():
+                queryset = export_queryset(
+                    date_from=parse_boundary(params.get('date_from'), 'date_from'),
+                    date_to=parse_boundary(params.get('date_to'), 'date_to'),
+                    returned=parse_returned(params.get('returned')),
+                    student=params.get('student'),
+                ).using(read_alias())
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(iter_export(queryset, output_format), content_type=EXPORT_CONTENT_TYPES[output_format])
+        response['Content-Disposition'] = f'attachment; filename="rentals.{output_format}"'
+        return response
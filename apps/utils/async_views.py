@@ -0,0 +1,69 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from bookmate.load_env_vars import var_settings
+from .fast_serializers import render_json
+
+
+class AsyncReadView(View):
+    """
+    Base for read-only JSON endpoints written against the async ORM.
+
+    Under ASGI the request is served on the event loop and only the queries themselves go to a
+    thread, instead of the whole view occupying one. Responses match the DRF views they mirror:
+    same serializers, JSON renderer, pagination and error bodies. Requests are authenticated by
+    the DEFAULT_AUTHENTICATION_CLASSES and refused like APIView does: 401 with WWW-Authenticate
+    when the first authenticator has a challenge, 403 otherwise. Under WSGI the views still work,
+    each request running its own event loop.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        drf_request = Request(request, authenticators=[authentication() for authentication in self.authentication_classes])
+        try:
+            # The authenticators are synchronous (session and user lookups), so they run in a thread.
+            user = await sync_to_async(lambda: drf_request.user)()
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc, drf_request)
+
+    def handle_exception(self, exc, request) -> HttpResponse:
+        """
+        The error response APIView.handle_exception() would give.
+        """
+        headers = {}
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            challenge = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+            if challenge:
+                headers['WWW-Authenticate'] = challenge
+            exc.status_code = status.HTTP_401_UNAUTHORIZED if challenge else status.HTTP_403_FORBIDDEN
+        response = self.render({'detail': exc.detail}, exc.status_code)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def render(self, data, status_code=status.HTTP_200_OK) -> HttpResponse:
+        return HttpResponse(render_json(data), status=status_code, content_type=self.renderer.media_type)
+
+    async def paginated_data(self, queryset, serializer_class, fast_serializer=None):
+        """
+        One page of `queryset`, read with the async ORM and serialized by `fast_serializer` (a ValuesSerializer) when given.
+        """
+        paginator = self.pagination_class()
+        if fast_serializer is not None and var_settings.FAST_SERIALIZERS:
+            rows = fast_serializer.values(queryset, *getattr(paginator, 'cursor_fields', ()))
+            page = await paginator.apaginate_queryset(rows, Request(self.request), view=self)
+            return paginator.get_paginated_response(fast_serializer.to_representation(page)).data
+        page = await paginator.apaginate_queryset(queryset, Request(self.request), view=self)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data).data
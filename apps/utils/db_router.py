@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+
+class RoutingState:
+    """
+    Routing decisions of one request (or command): whether reads may use the replica, whether the
+    client is pinned to the primary after a recent write, and whether this request wrote.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+
+routing_state: ContextVar[RoutingState | None] = ContextVar('db_routing_state', default=None)
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in connections.settings
+
+
+def read_alias() -> str:
+    """
+    The database replica-eligible reads go to right now: the replica inside replica_reads(),
+    unless the client wrote in this request or recently (read-your-writes), or there is no replica.
+    """
+    state = routing_state.get()
+    if state is None or not state.replica_reads or state.pinned or state.wrote or not replica_configured():
+        return DEFAULT_DB_ALIAS
+    return REPLICA_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    """
+    Lets the reads inside the block go to the replica. Used around the list views, dashboard and exports.
+    """
+    state = routing_state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = routing_state.set(state)
+    previous, state.replica_reads = state.replica_reads, True
+    try:
+        yield state
+    finally:
+        state.replica_reads = previous
+        if token is not None:
+            routing_state.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    Serves a DRF view's GET requests through replica_reads(); `read_from` records the alias used.
+    """
+
+    read_from = DEFAULT_DB_ALIAS
+
+    def get(self, request, *args, **kwargs):
+        with replica_reads():
+            self.read_from = read_alias()
+            return super().get(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Primary/replica routing: every write goes to `default`, and reads go to the `replica` alias only
+    inside replica_reads() and never after a write by the same client (see DatabaseRoutingMiddleware).
+    Without a replica configured every query stays on `default`.
+
+    Only writes to `pinning_apps`, the data the replica-routed reads serve, count as the client's
+    writes; session saves, last_login updates and admin log entries do not pin anyone.
+    """
+
+    pinning_apps = {'books', 'rentals', 'changes'}
+
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None and model._meta.app_label in self.pinning_apps:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+from bookmate.load_env_vars import var_settings
+import json, operator, re
+
+try:
+    import orjson
+except ImportError:  # Optional: render_json() falls back to the json module.
+    orjson = None
+
+# Fields whose database value already is their JSON representation.
+PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+# orjson writes exponents as `1e16` where json writes `1e+16`; pages holding one are rendered with json.
+EXPONENT = re.compile(rb'\d[eE][-+]?\d')
+
+
+def render_json(data) -> bytes:
+    """
+    The bytes JSONRenderer produces for `data` (dicts, lists, strings, numbers, booleans and None),
+    encoded with orjson when it is installed.
+    """
+    content = None
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data)
+        except TypeError:
+            content = None
+        if content is not None and EXPONENT.search(content):
+            content = None
+    if content is None:
+        content = json.dumps(
+            data, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+        ).encode()
+    # Like JSONRenderer: U+2028/U+2029 are valid JSON but not valid JavaScript.
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ValuesSerializer:
+    """
+    Fast read path for a ModelSerializer: serializes rows read with values_list() instead of model
+    instances, producing the same data.
+
+    The serializer's fields are compiled once into one mapper per output key: plain columns are
+    copied as they are, other fields go through their own to_representation(), and nested
+    serializers become nested dicts (None when the relation is null). ISO 8601 datetimes are
+    converted to the current timezone, looked up once per call rather than once per value.
+    Fields that are not columns, such as model methods, must be given in `computed` as
+    `name: (columns, function)`.
+
+    Usage:
+        book_list_rows = ValuesSerializer(BookListSerializer)
+        data = book_list_rows.serialize(Book.objects.filter(...))
+    """
+
+    def __init__(self, serializer_class, computed=None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+        self._compiled = {}
+
+    def compile(self, tz=None) -> tuple[list, list]:
+        """
+        The columns to select and the mappers turning a row into its representation in `tz`.
+        """
+        compiled = self._compiled.get(tz)
+        if compiled is None:
+            columns = []
+            compiled = self._compiled[tz] = (columns, self._mappers(self.serializer_class(), '', columns, tz))
+        return compiled
+
+    def _column(self, columns, lookup):
+        if lookup not in columns:
+            columns.append(lookup)
+        return operator.itemgetter(columns.index(lookup))
+
+    def _mappers(self, serializer, prefix, columns, tz) -> list:
+        mappers = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = prefix + field.source.replace('.', '__')
+            if prefix + name in self.computed:
+                mappers.append((name, self._computed(prefix + name, prefix, columns)))
+            elif field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.ListSerializer)):
+                raise TypeError(f"{type(serializer).__name__}.{name} is not a column; pass it in `computed`.")
+            elif isinstance(field, serializers.BaseSerializer):
+                mappers.append((name, self._nested(self._column(columns, lookup), self._mappers(field, lookup + '__', columns, tz))))
+            elif isinstance(field, PLAIN_FIELDS):
+                mappers.append((name, self._column(columns, lookup)))
+            elif tz is not None and self._is_iso_datetime(field):
+                mappers.append((name, self._datetime(self._column(columns, lookup), tz, field.to_representation)))
+            else:
+                mappers.append((name, self._converted(self._column(columns, lookup), field.to_representation)))
+        return mappers
+
+    def _computed(self, name, prefix, columns):
+        lookups, function = self.computed[name]
+        getters = [self._column(columns, prefix + lookup) for lookup in lookups]
+        return lambda row: function(*(getter(row) for getter in getters))
+
+    @staticmethod
+    def _converted(getter, to_representation):
+        def mapper(row):
+            value = getter(row)
+            return None if value is None else to_representation(value)
+        return mapper
+
+    @staticmethod
+    def _is_iso_datetime(field) -> bool:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return (
+            type(field) is serializers.DateTimeField and not hasattr(field, 'timezone')
+            and output_format is not None and output_format.lower() == ISO_8601
+        )
+
+    @staticmethod
+    def _datetime(getter, tz, to_representation):
+        # DateTimeField.to_representation() with the timezone already resolved.
+        def mapper(row):
+            value = getter(row)
+            if value is None or value.tzinfo is None:
+                return None if value is None else to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return mapper
+
+    @staticmethod
+    def _nested(key, mappers):
+        def mapper(row):
+            if key(row) is None:
+                return None
+            return {name: field(row) for name, field in mappers}
+        return mapper
+
+    def values(self, queryset, *extra):
+        """
+        The queryset as named rows of the columns the serializer needs, plus `extra` ones (e.g. for a cursor).
+        """
+        columns = self.compile()[0]
+        return queryset.values_list(*columns, *(column for column in extra if column not in columns), named=True)
+
+    def to_representation(self, rows) -> list[dict]:
+        mappers = self.compile(timezone.get_current_timezone() if settings.USE_TZ else None)[1]
+        return [{name: field(row) for name, field in mappers} for row in rows]
+
+    def serialize(self, queryset) -> list[dict]:
+        return self.to_representation(self.values(queryset))
+
+
+class FastListMixin:
+    """
+    Serves a list view's JSON pages from values_list() rows through `fast_serializer` and render_json(),
+    skipping model instances and ModelSerializer; the bytes are the same as through serializer_class.
+    The plain HttpResponse still goes through the view's finalize_response(), which adds the same
+    Allow and Vary headers as to a DRF Response, so fast pages differ only in how the body was built.
+    The browsable API, indented JSON, and every page when FAST_SERIALIZERS is off take the regular DRF path.
+    """
+
+    fast_serializer = None
+
+    def use_fast_serializer(self, request) -> bool:
+        return (
+            self.fast_serializer is not None and var_settings.FAST_SERIALIZERS
+            and type(request.accepted_renderer) is JSONRenderer and 'indent' not in request.accepted_media_type
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serializer(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.fast_serializer.values(queryset, *getattr(self.paginator, 'cursor_fields', ()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return HttpResponse(render_json(self.fast_serializer.to_representation(rows)), content_type=JSONRenderer.media_type)
+        data = self.get_paginated_response(self.fast_serializer.to_representation(page)).data
+        return HttpResponse(render_json(data), content_type=JSONRenderer.media_type)
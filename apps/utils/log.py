@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+import json, logging
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: timestamp, level, logger, message and the `extra` fields.
+    """
+
+    def format(self, record):
+        payload = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class TestOutputFilter(logging.Filter):
+    """
+    Lets only errors through while `quiet`, which the test runner sets so the line logged for every
+    request, and the warnings of tests that make ISBNDB fail on purpose, stay out of the test output.
+    assertLogs() replaces the handlers, so tests still see every record.
+    """
+
+    quiet = False
+
+    def filter(self, record):
+        return not self.quiet or record.levelno >= logging.ERROR
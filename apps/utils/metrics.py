@@ -0,0 +1,197 @@
+from contextvars import ContextVar
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from bookmate.load_env_vars import var_settings
+import bisect, threading, time
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def label_key(self, labels) -> tuple:
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram(Counter):
+    """
+    Cumulative buckets, sum and count per label set, like prometheus_client's Histogram.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, '+Inf'), counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", (*key, ('le', bound)), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text format. Each worker process keeps its own
+    values, so scrape every process (or run a single one) to see them all.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+request_duration = registry.histogram('bookmate_http_request_duration_seconds', "Request latency by view.", ['view', 'method', 'status'])
+request_db_queries = registry.histogram('bookmate_http_request_db_queries', "SQL queries per request by view.", ['view'], buckets=QUERY_COUNT_BUCKETS)
+request_db_duration = registry.histogram('bookmate_http_request_db_duration_seconds', "Time spent in SQL per request by view.", ['view'])
+request_isbndb_calls = registry.histogram('bookmate_http_request_isbndb_calls', "ISBNDB calls per request by view.", ['view'], buckets=QUERY_COUNT_BUCKETS)
+isbndb_duration = registry.histogram('bookmate_isbndb_request_duration_seconds', "ISBNDB call latency, in requests and workers alike.", ['outcome'])
+slow_queries = registry.counter('bookmate_slow_queries_total', "SQL queries slower than SLOW_QUERY_MS by view.", ['view'])
+n_plus_one = registry.counter('bookmate_n_plus_one_total', "Requests repeating one SQL statement N_PLUS_ONE_THRESHOLD times or more, by view.", ['view'])
+
+
+class RequestMetrics:
+    """
+    What one request spent in SQL and on ISBNDB; filled in by RequestMetricsMiddleware and record_isbndb_call().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.isbndb_calls = 0
+        self.isbndb_time = 0.0
+        self.statements = {}
+        self.slow_queries = []
+        self.lock = threading.Lock()
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.db_queries += 1
+                self.db_time += elapsed
+                if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                    # Parameters are passed separately, so the SQL text is already the statement's shape.
+                    self.statements[sql] = self.statements.get(sql, 0) + 1
+                if elapsed * 1000 >= var_settings.SLOW_QUERY_MS:
+                    self.slow_queries.append((sql, elapsed))
+
+    def record_isbndb_call(self, elapsed):
+        with self.lock:
+            self.isbndb_calls += 1
+            self.isbndb_time += elapsed
+
+    def repeated_statements(self, threshold) -> list[tuple[str, int]]:
+        return sorted(((sql, count) for sql, count in self.statements.items() if count >= threshold), key=lambda item: -item[1])
+
+
+current_request_metrics: ContextVar[RequestMetrics | None] = ContextVar('current_request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting each query on the current request, if any. It is installed on every connection
+    as it is opened: connections are per thread, and under ASGI the queries run in a thread of their own.
+    """
+    metrics = current_request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.db_wrapper(execute, sql, params, many, context)
+
+
+def install_query_metrics(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_metrics)
+
+
+def record_isbndb_call(elapsed, outcome):
+    """
+    Records one ISBNDB call: always in the global histogram, and on the current request when there is one.
+    """
+    isbndb_duration.observe(elapsed, outcome=outcome)
+    metrics = current_request_metrics.get()
+    if metrics is not None:
+        metrics.record_isbndb_call(elapsed)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for staff users and, when METRICS_TOKEN is set, scrapers sending it as a bearer token.
+    """
+    token = var_settings.METRICS_TOKEN
+    if not (request.user.is_staff or (token and request.headers.get('Authorization') == f"Bearer {token}")):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type=PROMETHEUS_CONTENT_TYPE)
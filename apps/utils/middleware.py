@@ -0,0 +1,156 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bookmate.load_env_vars import var_settings
+from utils.db_router import RoutingState, replica_configured, routing_state
+from utils.metrics import (
+    RequestMetrics, current_request_metrics, n_plus_one, request_db_duration, request_db_queries,
+    request_duration, request_isbndb_calls, slow_queries,
+)
+import logging, time
+
+logger = logging.getLogger('bookmate.requests')
+
+
+def view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures every request: total latency, SQL query count and time, and ISBNDB call count and time.
+
+    The numbers are sent back in a `Server-Timing` header, logged as one structured record on the
+    `bookmate.requests` logger and aggregated into the histograms served at /metrics. Queries
+    slower than SLOW_QUERY_MS and statements repeated N_PLUS_ONE_THRESHOLD times in one request
+    (the N+1 pattern) are logged as warnings naming the view.
+    Queries run while a streaming response is consumed are not counted. Works under WSGI and
+    ASGI alike, without moving async views to a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    def report(self, request, response, metrics):
+        elapsed = time.perf_counter() - metrics.started
+
+        view = view_name(request)
+        request_duration.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        request_db_queries.observe(metrics.db_queries, view=view)
+        request_db_duration.observe(metrics.db_time, view=view)
+        request_isbndb_calls.observe(metrics.isbndb_calls, view=view)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_queries} queries"',
+            f'isbndb;dur={metrics.isbndb_time * 1000:.1f};desc="{metrics.isbndb_calls} calls"',
+            f'total;dur={elapsed * 1000:.1f}',
+        ])
+        logger.info(
+            "%s %s %s %.1fms", request.method, request.path, response.status_code, elapsed * 1000,
+            extra={
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'db_queries': metrics.db_queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'isbndb_calls': metrics.isbndb_calls,
+                'isbndb_ms': round(metrics.isbndb_time * 1000, 2),
+            },
+        )
+        self.report_problems(view, metrics)
+        return response
+
+    def report_problems(self, view, metrics):
+        for sql, elapsed in metrics.slow_queries:
+            slow_queries.inc(view=view)
+            logger.warning("Slow query in %s (%.1fms): %s", view, elapsed * 1000, sql[:500], extra={'view': view, 'duration_ms': round(elapsed * 1000, 2)})
+        repeated = metrics.repeated_statements(var_settings.N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            n_plus_one.inc(view=view)
+            sql, count = repeated[0]
+            logger.warning("Possible N+1 in %s: statement ran %d times: %s", view, count, sql[:500], extra={'view': view, 'repeats': count})
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Read-your-writes for the replica router: a request that writes pins its client to the primary
+    for DB_REPLICA_STICKINESS seconds with a cookie, so the replica's lag never hides the client's
+    own rentals. The deadline is also sent in the `header_name` response header for clients that do
+    not keep cookies (token or basic auth); they pin themselves by sending it back. Does nothing
+    unless a replica is configured.
+    """
+
+    cookie_name = 'bookmate_primary_until'
+    header_name = 'X-Bookmate-Primary-Until'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned=self.is_pinned(request))
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.pin_writer(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=self.is_pinned(request))
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.pin_writer(response, state)
+
+    def pin_writer(self, response, state):
+        if state.wrote and replica_configured():
+            stickiness = var_settings.DB_REPLICA_STICKINESS
+            until = f"{time.time() + stickiness:.3f}"
+            response.set_cookie(self.cookie_name, until, max_age=stickiness, httponly=True, samesite='Lax')
+            response[self.header_name] = until
+        return response
+
+    def is_pinned(self, request) -> bool:
+        for value in (request.COOKIES.get(self.cookie_name), request.headers.get(self.header_name)):
+            try:
+                if value and float(value) > time.time():
+                    return True
+            except ValueError:
+                pass
+        return False
@@ -0,0 +1,181 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from bookmate.load_env_vars import var_settings
+import json
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the (created_at, id) keyset, newest first.
+
+    Unlike OFFSET, every page is fetched with `WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC
+    LIMIT n`, so deep pages cost the same as the first one and rows inserted while paging
+    never shift the pages. The id breaks ties between rows created in the same instant.
+
+    Query params:
+        cursor: Opaque cursor taken from the `next`/`previous` links.
+        page_size: Rows per page, capped at API_MAX_PAGE_SIZE.
+    """
+
+    cursor_query_param = 'cursor'
+    # What encode_cursor() reads from a row; list views reading values_list() rows must select them.
+    cursor_fields = ('created_at', 'pk')
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, var_settings.API_PAGE_SIZE))
+        except (TypeError, ValueError):
+            page_size = var_settings.API_PAGE_SIZE
+        return min(max(page_size, 1), var_settings.API_MAX_PAGE_SIZE)
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps([row.created_at.isoformat(), row.pk, int(reverse)])
+        return urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk, reverse = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError(created_at)
+            return created_at, int(pk), bool(reverse)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_queryset(self, queryset, request):
+        """
+        Returns the query for the requested page: the rows past the cursor, plus one to tell whether more follow.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = cursor = self.decode_cursor(request)
+
+        reverse = bool(cursor and cursor[2])
+        if cursor:
+            created_at, pk = cursor[:2]
+            # The redundant bound on created_at alone lets the database seek into the index instead of scanning it.
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).filter(Q(created_at__gt=created_at) | Q(pk__gt=pk))
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(pk__lt=pk))
+        ordering = ('created_at', 'pk') if reverse else ('-created_at', '-pk')
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views, reading the page with the async ORM.
+        """
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    def set_page(self, rows):
+        cursor = self.cursor
+        reverse = bool(cursor and cursor[2])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1], reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], reverse=True))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def estimated_row_count(model, using='default') -> int | None:
+    """
+    The planner's row estimate for the model's table (pg_class.reltuples on PostgreSQL, the largest
+    index in sqlite_stat1 after ANALYZE on SQLite), else the span of its integer primary keys.
+    Never counts rows.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(table)]),
+        'sqlite': ('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table]),
+    }
+    if connection.vendor in queries:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(*queries[connection.vendor])
+                row = cursor.fetchone()
+            if row and row[0] is not None and row[0] >= 0:
+                return int(row[0])
+        except DatabaseError:  # No statistics gathered yet.
+            pass
+    if model._meta.pk.get_internal_type() not in ('AutoField', 'BigAutoField'):
+        return None
+    bounds = model._default_manager.using(using).aggregate(low=Min('pk'), high=Max('pk'))
+    return 0 if bounds['low'] is None else bounds['high'] - bounds['low'] + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over large tables.
+
+    Rows are counted exactly only up to ADMIN_EXACT_COUNT_LIMIT, with a `COUNT(*)` over a LIMITed
+    subquery. Past it the whole table reports its estimated size and a filtered or searched
+    changelist reports the limit, so its later pages are reached by narrowing the filters.
+    Pair it with `show_full_result_count = False`, which drops the changelist's second, unfiltered count.
+    """
+
+    @cached_property
+    def count(self):
+        limit = var_settings.ADMIN_EXACT_COUNT_LIMIT
+        queryset = self.object_list
+        count = queryset.order_by().values('pk')[:limit + 1].count()
+        if count <= limit:
+            return count
+        if not queryset.query.has_filters():
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate:
+                return max(estimate, limit)
+        return limit
@@ -0,0 +1,17 @@
+from django.test.runner import DiscoverRunner
+from .log import TestOutputFilter
+
+
+class QuietRequestLogRunner(DiscoverRunner):
+    """
+    The project's test runner: only errors reach the console log while the tests run, so requests and
+    expected failures do not flood the output (see utils.log.TestOutputFilter).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        TestOutputFilter.quiet = True
+
+    def teardown_test_environment(self, **kwargs):
+        TestOutputFilter.quiet = False
+        super().teardown_test_environment(**kwargs)
@@ -12,8 +12,61 @@ load_dotenv()
 
 class VarSettings():
     ISBN_API_KEY: str = os.getenv("ISBN_API_KEY", "")
+    ISBN_API_BASE_URL: str = os.getenv("ISBN_API_BASE_URL", "https://api2.isbndb.com")
+    ISBN_API_TIMEOUT: float = float(os.getenv("ISBN_API_TIMEOUT", 5))
+    ISBN_API_RATE_LIMIT: float = float(os.getenv("ISBN_API_RATE_LIMIT", 1))  # Requests per second allowed by the API plan
+    ISBN_API_BURST: int = int(os.getenv("ISBN_API_BURST", 1))  # Requests that may be sent back to back
+    ISBN_API_CONCURRENCY: int = int(os.getenv("ISBN_API_CONCURRENCY", 4))  # Parallel lookups in fetch_many and pooled connections
+    ISBN_CIRCUIT_FAILURE_RATE: float = float(os.getenv("ISBN_CIRCUIT_FAILURE_RATE", 0.5))  # Error rate that opens the circuit
+    ISBN_CIRCUIT_MIN_CALLS: int = int(os.getenv("ISBN_CIRCUIT_MIN_CALLS", 10))  # Calls in the window before the rate is trusted
+    ISBN_CIRCUIT_WINDOW: int = int(os.getenv("ISBN_CIRCUIT_WINDOW", 20))  # Most recent calls the error rate is computed over
+    ISBN_CIRCUIT_RESET_TIMEOUT: int = int(os.getenv("ISBN_CIRCUIT_RESET_TIMEOUT", 30))  # Seconds before a probe call is let through
+    ISBN_CACHE_SIZE: int = int(os.getenv("ISBN_CACHE_SIZE", 1024))  # Entries kept in the in-process LRU
+    ISBN_CACHE_TTL: int = int(os.getenv("ISBN_CACHE_TTL", 7 * 24 * 60 * 60))  # Seconds a found book is cached
+    ISBN_CACHE_NEGATIVE_TTL: int = int(os.getenv("ISBN_CACHE_NEGATIVE_TTL", 24 * 60 * 60))  # Seconds a "no books found" is cached
+    ISBN_CACHE_ERROR_TTL: int = int(os.getenv("ISBN_CACHE_ERROR_TTL", 60))  # Seconds a failed lookup is cached
+    DB_ENGINE: str = os.getenv("DB_ENGINE", "django.db.backends.sqlite3")
+    DB_NAME: str = os.getenv("DB_NAME", "")  # Defaults to db.sqlite3 in the project directory
+    DB_USER: str = os.getenv("DB_USER", "")
+    DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
+    DB_HOST: str = os.getenv("DB_HOST", "")
+    DB_PORT: str = os.getenv("DB_PORT", "")
+    DB_CONN_MAX_AGE: int = int(os.getenv("DB_CONN_MAX_AGE", 60))  # Seconds a connection is reused across requests; 0 closes it after each one
+    DB_CONN_HEALTH_CHECKS: bool = os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() in ("1", "true", "yes")
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 0))  # PostgreSQL connection pool size (psycopg 3); 0 disables the pool
+    DB_SQLITE_WAL: bool = os.getenv("DB_SQLITE_WAL", "true").lower() in ("1", "true", "yes")  # Readers no longer wait for the writer
+    DB_SQLITE_BUSY_TIMEOUT: float = float(os.getenv("DB_SQLITE_BUSY_TIMEOUT", 5))  # Seconds to wait for a lock before "database is locked"
+    DB_SQLITE_TRANSACTION_MODE: str = os.getenv("DB_SQLITE_TRANSACTION_MODE", "IMMEDIATE")  # Take the write lock at BEGIN so the busy timeout applies
+    DB_REPLICA_NAME: str = os.getenv("DB_REPLICA_NAME", "")  # Setting it enables the read replica
+    DB_REPLICA_HOST: str = os.getenv("DB_REPLICA_HOST", "")
+    DB_REPLICA_PORT: str = os.getenv("DB_REPLICA_PORT", "")
+    DB_REPLICA_STICKINESS: int = int(os.getenv("DB_REPLICA_STICKINESS", 5))  # Seconds a client reads from the primary after writing
     FREE_RENTAL_PERIOD: int = int(os.getenv("FREE_RENTAL_PERIOD", 30))
+    ENRICHMENT_BATCH_SIZE: int = int(os.getenv("ENRICHMENT_BATCH_SIZE", 20))
+    ENRICHMENT_MAX_ATTEMPTS: int = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", 5))
+    ENRICHMENT_RETRY_BACKOFF: int = int(os.getenv("ENRICHMENT_RETRY_BACKOFF", 30))  # Base backoff in seconds
+    ENRICHMENT_LEASE_TIMEOUT: int = int(os.getenv("ENRICHMENT_LEASE_TIMEOUT", 300))  # Seconds a claimed task stays hidden
+    API_PAGE_SIZE: int = int(os.getenv("API_PAGE_SIZE", 50))
+    API_MAX_PAGE_SIZE: int = int(os.getenv("API_MAX_PAGE_SIZE", 500))
+    DASHBOARD_PAGE_SIZE: int = int(os.getenv("DASHBOARD_PAGE_SIZE", 25))
+    DASHBOARD_CACHE_TTL: int = int(os.getenv("DASHBOARD_CACHE_TTL", 300))  # Seconds; fees accrue over time so entries also expire
+    CATALOGUE_CACHE_TTL: int = int(os.getenv("CATALOGUE_CACHE_TTL", 600))  # Seconds a rendered book list/detail page is kept
+    BOOK_IMPORT_CHUNK_SIZE: int = int(os.getenv("BOOK_IMPORT_CHUNK_SIZE", 1000))
+    FAST_SERIALIZERS: bool = os.getenv("FAST_SERIALIZERS", "true").lower() in ("1", "true", "yes")  # List pages from values() rows instead of ModelSerializer
+    ADMIN_EXACT_COUNT_LIMIT: int = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 10000))  # Admin changelists count exactly up to this many rows, then estimate
+    BULK_RENTAL_MAX_ITEMS: int = int(os.getenv("BULK_RENTAL_MAX_ITEMS", 500))  # Items accepted by one bulk checkout/return request
+    RENTAL_ARCHIVE_AFTER_DAYS: int = int(os.getenv("RENTAL_ARCHIVE_AFTER_DAYS", 365))  # Returned rentals older than this move to the archive table
+    RENTAL_ARCHIVE_BATCH_SIZE: int = int(os.getenv("RENTAL_ARCHIVE_BATCH_SIZE", 5000))  # Rentals archived per transaction
+    CHANGE_FEED_SETTLE_SECONDS: float = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", 5))  # Changes younger than this are held back, so slower transactions commit first
+    CHANGE_LOG_COMPACT_AFTER_DAYS: int = int(os.getenv("CHANGE_LOG_COMPACT_AFTER_DAYS", 7))  # compact_changes keeps one entry per object past this age
+    CHANGE_LOG_DELETION_RETENTION_DAYS: int = int(os.getenv("CHANGE_LOG_DELETION_RETENTION_DAYS", 90))  # compact_changes drops delete entries past this age; clients further behind must download the lists again
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))  # Rentals fetched per round trip while exporting
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", 100))  # SQL queries at least this slow are logged as warnings
+    N_PLUS_ONE_THRESHOLD: int = int(os.getenv("N_PLUS_ONE_THRESHOLD", 10))  # Repeats of one statement in a request reported as N+1
+    REQUEST_LOG_LEVEL: str = os.getenv("REQUEST_LOG_LEVEL", "INFO")  # INFO logs every request, WARNING only slow queries and N+1
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")  # Bearer token that lets scrapers into /metrics; staff users can always read it
     admin_templates_dir: str = admin_templates_dir
     templates_dir: str = templates_dir
 
-var_settings = VarSettings()
\ No newline at end of file
+var_settings = VarSettings()
@@ -50,6 +50,7 @@ THIRD_PARTY_APPS = [
 LOCAL_APPS = [
     "books",
     "rentals",
+    "changes",
 ]
 
 INSTALLED_APPS = DEFAULT_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -57,6 +58,8 @@ INSTALLED_APPS = DEFAULT_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.middleware.RequestMetricsMiddleware',
+    'utils.middleware.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +68,32 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'utils.log.JsonFormatter'},
+    },
+    'filters': {
+        'test_output': {'()': 'utils.log.TestOutputFilter'},
+    },
+    'handlers': {
+        'json_console': {'class': 'logging.StreamHandler', 'formatter': 'json', 'filters': ['test_output']},
+    },
+    'loggers': {
+        'bookmate': {'handlers': ['json_console'], 'level': 'INFO', 'propagate': False},
+        'bookmate.requests': {'handlers': ['json_console'], 'level': var_settings.REQUEST_LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Keeps the request log lines out of the test output, see utils.log.TestOutputFilter.
+TEST_RUNNER = 'utils.test_runner.QuietRequestLogRunner'
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.KeysetPagination',
+    'PAGE_SIZE': var_settings.API_PAGE_SIZE,
+}
+
 ROOT_URLCONF = 'bookmate.urls'
 
 TEMPLATES = [
@@ -89,10 +118,49 @@ WSGI_APPLICATION = 'bookmate.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+def database_settings(name, host='', port=''):
+    database = {
+        'ENGINE': var_settings.DB_ENGINE,
+        'NAME': name,
+        'USER': var_settings.DB_USER,
+        'PASSWORD': var_settings.DB_PASSWORD,
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': var_settings.DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': var_settings.DB_CONN_HEALTH_CHECKS,
+        'OPTIONS': {},
+    }
+    if var_settings.DB_ENGINE.endswith('sqlite3'):
+        database['OPTIONS'] = {
+            'timeout': var_settings.DB_SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': var_settings.DB_SQLITE_TRANSACTION_MODE or None,
+        }
+        if var_settings.DB_SQLITE_WAL:
+            database['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'
+    elif var_settings.DB_ENGINE.endswith('postgresql') and var_settings.DB_POOL_MAX_SIZE:
+        # Pooled connections replace persistent ones; Django refuses both at once.
+        database['OPTIONS']['pool'] = {'min_size': var_settings.DB_POOL_MIN_SIZE, 'max_size': var_settings.DB_POOL_MAX_SIZE}
+        database['CONN_MAX_AGE'] = 0
+    return database
+
+
 DATABASES = {
+    'default': database_settings(var_settings.DB_NAME or BASE_DIR / 'db.sqlite3', var_settings.DB_HOST, var_settings.DB_PORT),
+}
+if var_settings.DB_REPLICA_NAME:
+    DATABASES['replica'] = database_settings(var_settings.DB_REPLICA_NAME, var_settings.DB_REPLICA_HOST or var_settings.DB_HOST, var_settings.DB_REPLICA_PORT or var_settings.DB_PORT)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['utils.db_router.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookmate',
     }
 }
 
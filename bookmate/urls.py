@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
+from utils.metrics import metrics_view
 
 # from apps.rentals.urls import router as rentals_router
 
@@ -23,4 +24,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/books/', include('books.urls')), 
     path('api/rentals/', include('rentals.urls')),
+    path('api/changes/', include('changes.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file